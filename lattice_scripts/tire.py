@@ -1,6 +1,5 @@
-import cadquery as cq
+import time
 
-from lq.commons import eachpointAdaptive
 from lq.topologies.conformal import cylinder
 
 z_uc = 8 # no. of Z unit cell
@@ -15,10 +14,19 @@ max_thickness = 40 # mm
 inner_radius = 350 # mm
 outer_radius = 950 # mm
 
-arcs, radials, axials = cylinder(z_uc,
-                                 angle_uc_size,
-                                 z_uz_size, r_uz_size,
-                                 min_thickness,
-                                 max_thickness,
-                                 inner_radius,
-                                 outer_radius)
+# build one angle_uc_size sector and turn copies of it: 'fused' fuses the copies into one
+# solid, 'instanced' keeps them in a compound sharing their geometry, None builds every cell
+sectors = 'fused'
+
+start_time = time.time()
+result = cylinder(z_uc,
+                  angle_uc_size,
+                  z_uz_size, r_uz_size,
+                  min_thickness,
+                  max_thickness,
+                  inner_radius,
+                  outer_radius,
+                  sectors = sectors)
+print('The excecution time is:  %s seconds'  % (time.time() - start_time))
+
+show_object(result)
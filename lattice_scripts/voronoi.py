@@ -1,70 +1,38 @@
-"""
-(L, H, W, t) = (100.0, 20.0, 20.0, 1.0)
-pts = [
-    (0, H/2.0, 0),
-    (W/2.0, H/2.0, 0),
-    (W/2.0, (H/2.0 - t), 0),
-    (t/2.0, (H/2.0 - t), 0),
-    (t/2.0, (t - H/2.0), 0),
-    (W/2.0, (t - H/2.0), 0),
-    (W/2.0, H/-2.0, 0),
-    (0, H/-2.0, 0)
-]
-result = cq.Workplane().polyline(pts)
-"""
+import time
 
-import numpy as np
-import scipy
+from lq.commons import graph_lattice
+from lq.topologies.voronoi import poisson_disk_seeds, random_seeds, tiled_voronoi_graph, voronoi_graph
 
-import cadquery as cq
+# USER INPUT
 
-from lq.commons import cylinder_by_two_points, make_sphere
+n_seeds = 1000
+lower = (0, 0, 0)
+upper = (9, 9, 9)
+strut_radius = 0.05
+node_diameter = 0.1
+# seed density along the box (relative, scaled to n_seeds) for a graded foam, None for
+# uniformly random seeds
+density = lambda points: 1 + 3 * points[:, 2] / upper[2]
+# tiles along X, Y and Z to compute the diagram tile by tile (e.g. (4, 4, 4) for millions of
+# seeds), None for one global diagram
+tiles = None
+workers = None
 
-<<<<<<< HEAD
-air_traffic_mess = np.random.random_sample((5000000, 3))*465
-=======
-air_traffic_mess = np.random.random_sample((100000, 3)) * 9
-print(f'{len(air_traffic_mess)} seeds generated')
->>>>>>> 74ebf6f0590a6abb5159c91dddb09e0b85c41647
-vor = scipy.spatial.Voronoi(air_traffic_mess)
+# END USER INPUT
 
-def fits(pt):
-    for i in pt:
-        if i < 0 or i > 1:
-            return False
-    return True
+if density is None:
+    seeds = random_seeds(n_seeds, lower, upper, seed = 0)
+else:
+    seeds = poisson_disk_seeds(lower, upper, density, n_seeds, seed = 0)
+print(f'{len(seeds)} seeds generated')
 
-<<<<<<< HEAD
-=======
-print(f'{len(vor.ridge_vertices)} ridges detected')
-j = 0
->>>>>>> 74ebf6f0590a6abb5159c91dddb09e0b85c41647
-for ridge_indices in vor.ridge_vertices:
-    voronoi_ridge_coords = vor.vertices[ridge_indices]
-    print(f'Ridge {j} of {len(vor.ridge_vertices)}...')
-    j += 1
-    for i in range(1, len(voronoi_ridge_coords[...,0])): 
-        startPoint = (
-            voronoi_ridge_coords[...,0][0],
-            voronoi_ridge_coords[...,1][0],
-            voronoi_ridge_coords[...,2][0]
-            )
-        endPoint = (
-            voronoi_ridge_coords[...,0][i],
-            voronoi_ridge_coords[...,1][i],
-            voronoi_ridge_coords[...,2][i]
-            )
-        if not fits(startPoint) or not fits(endPoint):
-            continue
-        print(startPoint, endPoint)
-        #edge = cq.Edge.makeLine(startPoint, endPoint)
-        #show_object(edge)
-        radius = 0.01
-        beam = cylinder_by_two_points(startPoint, endPoint, radius)
-        show_object(beam)
-        #sphere = make_sphere(cq.Vector(startPoint), radius)
-        #show_object(sphere)
-        #sphere = make_sphere(cq.Vector(endPoint), radius)
-        #show_object(sphere)
+start_time = time.time()
+if tiles is None:
+    nodes, edges = voronoi_graph(seeds, lower, upper)
+else:
+    nodes, edges = tiled_voronoi_graph(seeds, lower, upper, tiles, workers = workers)
+print(f'{len(edges)} struts and {len(nodes)} nodes')
+result = graph_lattice(nodes, edges, strut_radius, node_diameter, node_shape = 'sphere')
+print('The excecution time is:  %s seconds'  % (time.time() - start_time))
 
-#result = cq.Workplane().polyline(pts)
\ No newline at end of file
+show_object(result)
@@ -0,0 +1,157 @@
+from collections import OrderedDict
+
+import numpy as np
+
+import cadquery as cq
+
+def _freeze(value, ndigits = 9):
+    """
+    Converts a callback argument into a hashable value that can be a part of a cache key.
+    Floating point values (including NumPy scalars) are rounded so that parameters computed
+    with slightly different round-off errors (e.g. by np.linspace) still hit the same entry.
+
+    :param value: the argument value
+    :param ndigits: number of decimal digits kept for floating point values
+    :return: a hashable representation of the value
+    """
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, (float, np.floating)):
+        # adding 0.0 turns -0.0 into 0.0
+        return round(float(value), ndigits) + 0.0
+    if isinstance(value, np.ndarray):
+        return tuple(_freeze(v, ndigits) for v in value.tolist())
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v, ndigits) for v in value)
+    if isinstance(value, cq.Vector):
+        return _freeze(value.toTuple(), ndigits)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v, ndigits)) for k, v in value.items()))
+    return value
+
+def make_key(*args, **kwargs):
+    """
+    Builds a cache key out of positional and keyword arguments.
+
+    :return: a hashable tuple
+    """
+    return (tuple(_freeze(a) for a in args),
+            tuple(sorted((k, _freeze(v)) for k, v in kwargs.items())))
+
+class ShapeCache():
+    """
+    A bounded least-recently-used cache of shapes.
+
+    The shapes are stored in the location they were built in. Callers are expected to
+    place them with ``located()`` or ``moved()`` which creates a new reference to the same
+    underlying TShape instead of copying the geometry.
+
+    :param maxsize: maximal number of stored shapes. None means unbounded
+    """
+    def __init__(self, maxsize = 256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._shapes = OrderedDict()
+
+    def __len__(self):
+        return len(self._shapes)
+
+    def __contains__(self, key):
+        return key in self._shapes
+
+    def get(self, key, builder):
+        """
+        Returns the shape stored under the key or builds and stores it.
+
+        :param key: a hashable key (see make_key)
+        :param builder: a function without arguments that builds the shape
+        :return: the cached shape
+        """
+        try:
+            shape = self._shapes[key]
+        except KeyError:
+            self.misses += 1
+            shape = builder()
+            self._shapes[key] = shape
+            if self.maxsize is not None and len(self._shapes) > self.maxsize:
+                self._shapes.popitem(last = False)
+            return shape
+        self.hits += 1
+        self._shapes.move_to_end(key)
+        return shape
+
+    def clear(self):
+        """
+        Removes all stored shapes and resets the counters.
+        """
+        self._shapes.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def info(self):
+        """
+        :return: a dict with the hit/miss counters and the cache occupancy
+        """
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._shapes),
+                "maxsize": self.maxsize}
+
+    def __repr__(self):
+        info = self.info()
+        return (f'ShapeCache(hits={info["hits"]}, misses={info["misses"]}, '
+                f'size={info["size"]}, maxsize={info["maxsize"]})')
+
+# The cache shared by all *_heterogeneous_lattice builders.
+UNIT_CELL_CACHE = ShapeCache(maxsize = 256)
+
+class cached_unit_cell():
+    """
+    Wraps a unit cell callback of eachpointAdaptive so that every distinct set of
+    parameters is built only once (at the origin) and then placed with ``located()``.
+
+    The wrapped function must have the signature ``unit_cell(location, **params)`` and
+    return a shape placed at ``location``, as all unit_cell functions in lq.topologies do.
+
+    :param unit_cell: the unit cell function
+    :param cache: the ShapeCache to use. Defaults to UNIT_CELL_CACHE
+    """
+    def __init__(self, unit_cell, cache = UNIT_CELL_CACHE):
+        self.unit_cell = unit_cell
+        self.cache = cache
+
+    def __getstate__(self):
+        # Shapes cannot be pickled. A copy sent to a worker process of eachpointAdaptive
+        # gets the process-local UNIT_CELL_CACHE or a new cache of the same size.
+        shared = self.cache is UNIT_CELL_CACHE
+        return {"unit_cell": self.unit_cell,
+                "shared": shared,
+                "maxsize": self.cache.maxsize}
+
+    def __setstate__(self, state):
+        self.unit_cell = state["unit_cell"]
+        if state["shared"]:
+            self.cache = UNIT_CELL_CACHE
+        else:
+            self.cache = ShapeCache(maxsize = state["maxsize"])
+
+    def __call__(self, location, **params):
+        key = (self.unit_cell.__module__, self.unit_cell.__qualname__) + make_key(**params)
+        shape = self.cache.get(key, lambda: self.unit_cell(cq.Location(), **params))
+        return shape.located(location)
+
+def cached(unit_cell, cache = UNIT_CELL_CACHE):
+    """
+    Returns the unit cell callback wrapped with cached_unit_cell, or the callback itself
+    if caching is disabled.
+
+    :param unit_cell: the unit cell function
+    :param cache: the ShapeCache to use, None disables caching
+    :return: a callback for eachpointAdaptive
+    """
+    if cache is None:
+        return unit_cell
+    return cached_unit_cell(unit_cell, cache)
@@ -1,10 +1,127 @@
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+import pickle
+import warnings
+
+import numpy as np
+
 import cadquery as cq
+from OCP.gp import gp_Trsf
+
+from .cache import UNIT_CELL_CACHE
+from .graph import graph_segments
+from .primitives import node, strut, strut_between, strut_location, struts_between
+
+# Fuzzy tolerances of the repeated fuses (see checked_fuse), relative to the size of the shapes.
+FUZZY_TOLERANCES = (1e-6, 1e-5)
+
+def _location_to_values(location):
+    """
+    Converts a location into the 12 values of its transformation matrix
+    (3 rows, 4 columns) so that it can be sent to another process.
+    """
+    trsf = location.wrapped.Transformation()
+    return tuple(trsf.Value(i, j) for i in range(1, 4) for j in range(1, 5))
+
+def _location_from_values(values):
+    """
+    Restores a location from the values produced by _location_to_values.
+    """
+    trsf = gp_Trsf()
+    trsf.SetValues(*values)
+    return cq.Location(trsf)
+
+def _eachpoint_worker(payload):
+    """
+    Calls the callback of eachpointAdaptive in a worker process.
+
+    The resulting shape is returned as BREP bytes of the shape at its own origin together
+    with its location, so that identical shapes can be imported only once in the parent.
+    """
+    callback, location_values, extra_args = payload
+    p_res = callback(_location_from_values(location_values), **extra_args)
+    if not isinstance(p_res, cq.Shape):
+        raise TypeError('In the parallel mode, the callback has to return a cq.Shape, '
+                        f'got {type(p_res).__name__}')
+    stream = BytesIO()
+    p_res.located(cq.Location()).exportBrep(stream)
+    return stream.getvalue(), _location_to_values(p_res.location())
+
+def _is_picklable(*objects):
+    try:
+        for o in objects:
+            pickle.dumps(o)
+    except (pickle.PicklingError, TypeError, AttributeError):
+        return False
+    return True
+
+class _CallbackArgs():
+    """
+    Keyword arguments of the callback calls of eachpointAdaptive, created lazily for each call.
+
+    :param callback_extra_args: None, a list of dicts (one per point, missing ones are empty),
+        or a single dict whose values are either shared by all calls or, for 1D NumPy arrays
+        with one value per point, taken per call
+    :param n: number of points
+    """
+    def __init__(self, callback_extra_args, n):
+        self.n = n
+        self.sets = None
+        self.shared = {}
+        self.columns = {}
+        if callback_extra_args is None:
+            self.sets = []
+        elif isinstance(callback_extra_args, dict):
+            for name, value in callback_extra_args.items():
+                if isinstance(value, np.ndarray) and value.ndim > 0:
+                    if len(value) != n:
+                        raise ValueError(f'The argument \'{name}\' has {len(value)} values '
+                                         f'for {n} points')
+                    self.columns[name] = value
+                else:
+                    self.shared[name] = value
+        else:
+            self.sets = callback_extra_args
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, i):
+        if self.sets is not None:
+            return self.sets[i] if i < len(self.sets) else {}
+        extra_args = dict(self.shared)
+        for name, column in self.columns.items():
+            extra_args[name] = column[i]
+        return extra_args
+
+    def __iter__(self):
+        return (self[i] for i in range(self.n))
+
+def _call_in_pool(callback, pnts, callback_extra_args, workers, chunksize):
+    """
+    Calls the callback for each point in a process pool and collects the results in the
+    order of the points.
+    """
+    payloads = ((callback, _location_to_values(p), extra_args)
+                for p, extra_args in zip(pnts, callback_extra_args))
+    res = []
+    imported = {}
+    with ProcessPoolExecutor(max_workers = workers) as executor:
+        for brep, location_values in executor.map(_eachpoint_worker, payloads,
+                                                  chunksize = chunksize):
+            if brep not in imported:
+                imported[brep] = cq.Shape.importBrep(BytesIO(brep))
+            res.append(imported[brep].located(_location_from_values(location_values)))
+    return res
 
 def eachpointAdaptive(
     self,
     callback,
     callback_extra_args = None,
-    useLocalCoords = False
+    useLocalCoords = False,
+    workers = None,
+    chunksize = 1,
+    instanced = False
 ):
     """
     Same as each(), except that (1) each item on the stack is converted into a point before it
@@ -23,15 +140,21 @@ def eachpointAdaptive(
         provided to the callback in addition to the obligatory location argument. The outer array 
         level is indexed by the objects on the stack to iterate over, in the order they appear in 
         the Workplane.objects attribute. The inner arrays are dicts of keyword arguments, each dict 
-        for one call of the callback function each. If a single dict is provided, then this set of 
-        keyword arguments is used for every call of the callback.
+        for one call of the callback function each. If fewer dicts than objects are provided,
+        empty dicts are used for the remaining calls. If a single dict is provided, then its
+        values are used for every call of the callback, except for 1D NumPy arrays with one value
+        per object, which are indexed per call (a column of the argument). The arguments of each
+        call are only created when the callback is called.
     :param useLocalCoords: Should points provided to the callback be in local or global coordinates.
+    :param workers: Number of worker processes. If None or 1, the callback is called serially in
+        this process. Otherwise, the callback has to be picklable (e.g. a module-level function)
+        and return a cq.Shape; the shapes are sent back as BREP data. If the callback or its
+        arguments cannot be pickled, the serial mode is used.
+    :param chunksize: Number of points sent to a worker process at once in the parallel mode.
+    :param instanced: If True, the stack of the result holds a single compound of the results
+        (see instanced_compound) instead of the list of results.
 
     :return: CadQuery object which contains a list of vectors (points) on its stack.
-
-    .. todo:: Implement that callback_extra_args can also be a single dict.
-    .. todo:: Implement that empty dicts are used as arguments for calls to the callback if not 
-        enough sets are provided for all objects on the stack.
     """
     print('Building an element of an array...')
     # Convert the objects on the stack to a list of points.
@@ -48,29 +171,269 @@ def eachpointAdaptive(
             else:
                 pnts.append(o)
 
-    # If no extra keyword arguments are provided to the callback, provide a list of empty dicts as 
-    # structure for the **() deferencing to work below without issues.
-    if callback_extra_args is None:
-        callback_extra_args = [{} for p in pnts]
+    # Normalize the extra keyword arguments so that callback_extra_args[i] is the dict for the
+    # i-th point, whatever form they were provided in.
+    callback_extra_args = _CallbackArgs(callback_extra_args, len(pnts))
 
-    # Call the callback for each point and collect the objects it generates with each call.
-    res = []
-    for i, p in enumerate(pnts):
-        p = (p * loc) if useLocalCoords == False else p
-        extra_args = callback_extra_args[i]
-        p_res = callback(p, **extra_args)
-        p_res = p_res.move(loc) if useLocalCoords == True else p_res
-        res.append(p_res)
+    if workers is not None and workers > 1 and len(pnts) > 1:
+        if not _is_picklable(callback, callback_extra_args[0]):
+            warnings.warn('The callback or its arguments cannot be pickled, '
+                          'falling back to the serial mode')
+            workers = None
+
+    if workers is not None and workers > 1 and len(pnts) > 1:
+        # Call the callback in a process pool, the results keep the order of the points.
+        pnts = [(p * loc) if useLocalCoords == False else p for p in pnts]
+        res = _call_in_pool(callback, pnts, callback_extra_args, workers, chunksize)
+        if useLocalCoords == True:
+            res = [r.move(loc) for r in res]
+    else:
+        # Call the callback for each point and collect the objects it generates with each call.
+        res = []
+        for i, p in enumerate(pnts):
+            p = (p * loc) if useLocalCoords == False else p
+            extra_args = callback_extra_args[i]
+            p_res = callback(p, **extra_args)
+            p_res = p_res.move(loc) if useLocalCoords == True else p_res
+            res.append(p_res)
 
     # For result objects that are wires, make them pending if necessary.
     for r in res:
         if isinstance(r, cq.Wire) and not r.forConstruction:
             self._addPendingWire(r)
     print(f'Success!\n{"-"*20}')
+    if instanced:
+        return self.newObject([instanced_compound(res)])
     return self.newObject(res)
 # Register our custom plugin before use.
 cq.Workplane.eachpointAdaptive = eachpointAdaptive
 
+def instanced_compound(shapes) -> cq.Compound:
+    """
+    Packs shapes into one compound without copying them. Shapes that are located
+    references to the same geometry (e.g. unit cells from cached_unit_cell) keep sharing
+    their TShape in the compound, so a lattice with few distinct cells stays small in memory
+    and each distinct cell only has to be tessellated once (see distinct_instances).
+
+    :param shapes: a list of cq.Shape
+    :return: a cq.Compound
+    """
+    return cq.Compound.makeCompound(shapes)
+
+def distinct_instances(shape):
+    """
+    Groups the direct children of a compound by their underlying geometry (TShape).
+
+    :param shape: a cq.Compound, e.g. made by instanced_compound
+    :return: a list of (prototype, locations) tuples, where prototype is the shared shape
+        placed at the origin and locations is a list of cq.Location of its instances
+    """
+    groups = {}
+    for child in shape:
+        prototype = child.located(cq.Location())
+        # the hash of a shape at the identity location only depends on its TShape
+        candidates = groups.setdefault(prototype.hashCode(), [])
+        for group_prototype, locations in candidates:
+            if group_prototype.wrapped.IsPartner(child.wrapped):
+                locations.append(child.location())
+                break
+        else:
+            candidates.append((prototype, [child.location()]))
+    return [group for candidates in groups.values() for group in candidates]
+
+def _collect_shapes(objects):
+    """
+    Flattens Workplanes, shapes and (nested) lists of them into a list of shapes.
+    """
+    shapes = []
+    for o in objects:
+        if isinstance(o, cq.Workplane):
+            # the same items Workplane.union would take from the stack
+            shapes.extend(o.solids().vals())
+        elif isinstance(o, cq.Shape):
+            shapes.append(o)
+        elif isinstance(o, (list, tuple)):
+            shapes.extend(_collect_shapes(o))
+        else:
+            raise TypeError(f'Cannot fuse an object of type {type(o).__name__}')
+    return shapes
+
+def fuse_shapes(shapes,
+    strategy = 'single',
+    glue = False,
+    tol = None
+) -> cq.Shape:
+    """
+    Fuses a list of shapes.
+
+    :param shapes: list of cq.Shape objects
+    :param strategy: 'single' runs one multi-argument General Fuse of all the shapes,
+        'tree' fuses the shapes pairwise in a balanced binary tree
+    :param glue: use the glue option of the General Fuse (faster for shapes that only touch)
+    :param tol: fuzzy tolerance of the boolean operation
+    :return: the fused shape
+    """
+    if len(shapes) == 0:
+        raise ValueError('Nothing to fuse')
+    if strategy == 'single':
+        if len(shapes) == 1:
+            return shapes[0]
+        # cq.Shape.fuse runs the General Fuse algorithm in the parallel mode of OCC.
+        return shapes[0].fuse(*shapes[1:], glue = glue, tol = tol)
+    if strategy == 'tree':
+        while len(shapes) > 1:
+            pairs = [shapes[i].fuse(shapes[i + 1], glue = glue, tol = tol)
+                     for i in range(0, len(shapes) - 1, 2)]
+            if len(shapes) % 2 == 1:
+                pairs.append(shapes[-1])
+            shapes = pairs
+        return shapes[0]
+    raise ValueError(f"Strategy '{strategy}' does not exist.")
+
+def union_all(objects,
+    strategy = 'single',
+    clean = True,
+    glue = False,
+    tol = None
+) -> cq.cq.Workplane:
+    """
+    Fuses all solids in one pass instead of growing a result with a chain of
+    Workplane.union calls, where every boolean re-intersects the accumulated shape.
+
+    :param objects: list of Workplanes, shapes or lists of them. Workplanes contribute all
+        shapes on their stack
+    :param strategy: 'single' or 'tree', see fuse_shapes
+    :param clean: call clean() on the result, as Workplane.union does
+    :param glue: use the glue option of the General Fuse
+    :param tol: fuzzy tolerance of the boolean operation
+    :return: a Workplane with the fused shape on its stack
+    """
+    shapes = _collect_shapes(objects)
+    result = cq.Workplane("XY")
+    if len(shapes) == 0:
+        return result
+    fused = fuse_shapes(shapes, strategy, glue, tol)
+    if clean and len(shapes) > 1:
+        fused = fused.clean()
+    return result.newObject([fused])
+
+def _fused_correctly(fused, shapes) -> bool:
+    """
+    Whether fused is a valid shape with solids and a volume between the largest of the
+    shapes and their sum.
+    """
+    volumes = [shape.Volume() for shape in shapes]
+    return (bool(fused.Solids()) and fused.isValid()
+            and max(volumes) * (1 - 1e-9) <= fused.Volume() <= sum(volumes) * (1 + 1e-9))
+
+def checked_fuse(groups, strategy = 'single') -> cq.Shape:
+    """
+    Fuses groups of shapes one after another (see fuse_shapes): the first group, then the
+    result with the second group and so on. OCC can return an empty, invalid or too small
+    shape without an error where the faces of the shapes nearly touch (e.g. the nodes of the
+    tco lattice), so every fused shape is checked (see _fused_correctly). Otherwise the groups are fused again with the fuzzy
+    tolerances of FUZZY_TOLERANCES (times the size of the shapes) in turn.
+
+    :param groups: list of lists of cq.Shape objects
+    :param strategy: 'single' or 'tree', see fuse_shapes
+    :return: the fused shape
+    """
+    groups = [list(group) for group in groups if len(group) > 0]
+    size = cq.Compound.makeCompound(sum(groups, [])).BoundingBox().DiagonalLength
+    for tol in (None,) + tuple(tolerance * size for tolerance in FUZZY_TOLERANCES):
+        fused = []
+        for group in groups:
+            shapes = fused + group
+            fused = union_all(shapes, strategy, tol = tol).vals()
+            if not _fused_correctly(fused[0], shapes):
+                break
+        else:
+            return fused[0]
+    raise RuntimeError('The shapes could not be fused')
+
+def graph_lattice(nodes,
+    edges,
+    strut_radius,
+    node_diameter = None,
+    node_shape = 'box',
+    delta = 0.01,
+    position = (0, 0, 0),
+    rotation = (0, 0, 0),
+    fuse = False,
+    strategy = 'single'
+) -> cq.cq.Workplane:
+    """
+    Builds a strut lattice from its global graph (see graph.lattice_graph): one strut per
+    edge and one node per node. Like the cells of the lattice builders, the solids are
+    left on the stack unless fuse is set.
+
+    :param nodes: an (M, 3) array of nodes
+    :param edges: an (E, 2) array of edges
+    :param strut_radius: radius of the struts (scalar or E values)
+    :param node_diameter: diameter of the nodes (scalar or M values), None for no nodes
+    :param node_shape: 'box' or 'sphere'
+    :param delta: the small coefficient added to the side of the box nodes
+    :param position: origin of the lattice
+    :param rotation: angles (in degrees) about X, Y and Z of the lattice
+    :param fuse: fuse the struts and nodes into one solid, see checked_fuse
+    :param strategy: 'single' or 'tree', see fuse_shapes
+    :return: a Workplane with the struts and nodes (or the fused lattice) on its stack
+    """
+    shapes = struts_between(graph_segments(nodes, edges), strut_radius)
+    nodes_shapes = []
+    if node_diameter is not None:
+        diameters = np.broadcast_to(np.asarray(node_diameter, dtype = float), (len(nodes),))
+        nodes_shapes = [node(d, tuple(center), node_shape, delta)
+                        for center, d in zip(np.asarray(nodes, dtype = float).tolist(), diameters)
+                        if d > 0]
+    if fuse:
+        # The struts are fused first and the nodes onto them, as the unit cells do: one
+        # General Fuse of the struts together with the box nodes drops most of the volume
+        # of the rco and tcubic lattices.
+        if shapes or nodes_shapes:
+            shapes = [checked_fuse([shapes, nodes_shapes], strategy)]
+    else:
+        shapes += nodes_shapes
+    location = strut_location(rotation, position)
+    return cq.Workplane("XY").newObject([shape.moved(location) for shape in shapes])
+
+def deduplicated_lattice(graph,
+    cache = UNIT_CELL_CACHE,
+    workers = None,
+    instanced = False,
+    **kwargs
+) -> cq.cq.Workplane:
+    """
+    Builds a lattice with deduplicate = True: the struts and nodes shared by neighbouring
+    cells are built once from the global graph of the lattice (see graph_lattice) instead
+    of cell by cell.
+
+    No unit cell is built, so a unit cell cache other than the default and worker processes
+    cannot be used and raise ValueError. instanced packs the struts and nodes, which are
+    placed copies of cached prototypes, into one compound (see instanced_compound).
+    The struts come before the nodes on the stack; fuse the struts before adding the
+    nodes, as graph_lattice does with fuse = True.
+
+    :param graph: nodes, edges, strut radii and node diameters of the lattice, as returned
+        by the *_heterogeneous_graph functions
+    :param cache: the unit cell cache passed to the lattice builder
+    :param workers: the number of worker processes passed to the lattice builder
+    :param instanced: return a single compound of the struts and nodes
+    :param kwargs: the other arguments of graph_lattice
+    :return: a Workplane with the struts and nodes on its stack
+    """
+    if workers is not None and workers > 1:
+        raise ValueError("A deduplicated lattice is built in this process, "
+                         "workers cannot be used with deduplicate = True")
+    if cache is not None and cache is not UNIT_CELL_CACHE:
+        raise ValueError("A deduplicated lattice does not build unit cells, "
+                         "a unit cell cache cannot be used with deduplicate = True")
+    result = graph_lattice(*graph, **kwargs)
+    if instanced:
+        result = result.newObject([instanced_compound(result.vals())])
+    print("The lattice is generated")
+    return result
+
 def cylinder_tranformation(radius, height,
     rotation = cq.Vector(0, 0, 0),
     transformation = cq.Vector(0, 0, 0)):
@@ -85,11 +448,8 @@ def cylinder_tranformation(radius, height,
     cylinder
     :return: A cylinder with the specified parameters.
     """
-    return (cq.Workplane()
-		.transformed(offset = transformation,
-                    rotate = rotation)
-		.circle(radius)
-		.extrude(height))
+    return cq.Workplane("XY").newObject(
+        [strut(radius, height, rotation, transformation)])
 
 def cylinder_sequential_tranformation(radius, height,
     rotation = cq.Vector(0, 0, 0),
@@ -107,11 +467,8 @@ def cylinder_sequential_tranformation(radius, height,
     cylinder
     :return: A cylinder with the specified parameters.
     """
-    return (cq.Workplane()
-		.transformed(offset = transformation)
-        .transformed(rotate = rotation)
-		.circle(radius)
-		.extrude(height))
+    return cq.Workplane("XY").newObject(
+        [strut(radius, height, rotation, transformation)])
 
 def cuboid_tranformation(side, height, fillet,
     rotation = cq.Vector(0, 0, 0),
@@ -137,30 +494,40 @@ def cuboid_tranformation(side, height, fillet,
 
 def cylinder_by_two_points(p1: tuple,
                             p2: tuple,
-                            radius: float
+                            radius: float,
+                            radius2: float = None
                             ) -> cq.cq.Workplane:
     """
-    Create a cylinder with a spline (which is in fact a line)
-    path and two circles as end caps
+    Create a straight cylinder between two points. If radius2 is given,
+    the strut is a truncated cone tapering from radius at p1 to radius2 at p2
     
     Args:
       p1 (tuple): tuple of the form (x, y, z)
       p2 (tuple): tuple of the form (x, y, z)
       radius (float): radius of the cylinder
+      radius2 (float): radius at p2 for tapered struts
     
     Returns:
       A CQ object.
     """
+    return cq.Workplane("XY").newObject([strut_between(p1, p2, radius, radius2)])
 
-    path = cq.Workplane().moveTo(p1[0], p1[1]).spline([p1, p2])
-
-    sweep = (cq.Workplane("XY")
-        .pushPoints([path.val().locationAt(0)]).circle(radius)
-        .pushPoints([path.val().locationAt(1)]).circle(radius)
-        .consolidateWires()
-        .sweep(path, multisection = True)
-        )
-    return sweep
+def cylinders_by_two_points(endpoints,
+                            radius,
+                            radius2 = None
+                            ) -> cq.cq.Workplane:
+    """
+    Create straight cylinders (or tapered struts) for a batch of segments
+    
+    Args:
+      endpoints (array-like): (N, 2, 3) start and end points of the struts
+      radius (float or array-like): radius of every cylinder
+      radius2 (float or array-like): radii at the end points for tapered struts
+    
+    Returns:
+      A CQ object with N solids (not fused, see union_all).
+    """
+    return cq.Workplane("XY").newObject(struts_between(endpoints, radius, radius2))
 
 def make_sphere(center: cq.Vector, radius: float) -> cq.cq.Workplane:
     """
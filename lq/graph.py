@@ -0,0 +1,195 @@
+import numpy as np
+
+# A lattice graph is a pair of arrays: nodes, the (M, 3) node coordinates, and edges,
+# the (E, 2) node indices of the struts. The strut topologies describe their unit cells
+# as graphs (see unit_cell_graph in the topology modules) and tile_graph repeats them
+# over a grid of cells.
+
+def rotation_matrix(rotation) -> np.ndarray:
+    """
+    The rotation of cq.Workplane.transformed(rotate = rotation): the rotations about X, Y
+    and Z (in degrees) in this order about the plane axes (see primitives.strut_location).
+
+    :param rotation: angles (in degrees) about X, Y and Z
+    :return: a (3, 3) matrix
+    """
+    matrix = np.eye(3)
+    for angle, axis in zip(np.radians(np.asarray(rotation, dtype = float)), range(3)):
+        c, s = np.cos(angle), np.sin(angle)
+        i, j = (axis + 1) % 3, (axis + 2) % 3
+        r = np.eye(3)
+        r[i, i], r[i, j], r[j, i], r[j, j] = c, - s, s, c
+        matrix = matrix @ r
+    return matrix
+
+def transform_points(points, rotation = (0, 0, 0), offset = (0, 0, 0)) -> np.ndarray:
+    """
+    Maps points from the local coordinates of
+    cq.Workplane().transformed(offset = offset, rotate = rotation) to the global ones.
+
+    :param points: an (..., 3) array
+    :param rotation: angles (in degrees) about X, Y and Z
+    :param offset: origin of the local coordinates
+    :return: an array of the shape of points
+    """
+    return np.asarray(points, dtype = float) @ rotation_matrix(rotation).T + np.asarray(offset, dtype = float)
+
+def strut_segment(length: float, rotation = (0, 0, 0), offset = (0, 0, 0)) -> np.ndarray:
+    """
+    End points of the strut primitives.strut(radius, length, rotation, offset).
+
+    :param length: length of the strut
+    :param rotation: angles (in degrees) about X, Y and Z
+    :param offset: the start point of the strut
+    :return: a (2, 3) array
+    """
+    return transform_points([[0, 0, 0], [0, 0, length]], rotation, offset)
+
+def segments_graph(segments, nodes = None, decimals: int = 9):
+    """
+    Builds a graph from strut end points. End points closer than 10^-decimals are merged,
+    and struts that pass through one of the given nodes are split there.
+
+    :param segments: an (N, 2, 3) array of strut end points
+    :param nodes: an (M, 3) array of nodes, e.g. where the struts cross. The end points are
+        always nodes
+    :param decimals: precision of the node coordinates
+    :return: nodes (an (K, 3) array) and edges (an (E, 2) int array)
+    """
+    segments = np.asarray(segments, dtype = float).reshape(-1, 2, 3)
+    extra = np.zeros((0, 3)) if nodes is None else np.asarray(nodes, dtype = float).reshape(-1, 3)
+    tolerance = 10.0 ** - decimals
+    pieces = []
+    for start, end in segments:
+        axis = end - start
+        length2 = axis @ axis
+        t = (extra - start) @ axis / length2
+        distance = np.linalg.norm(start + t[:, None] * axis - extra, axis = 1)
+        inner = (t > tolerance) & (t < 1 - tolerance) & (distance < tolerance * 10)
+        points = np.concatenate([[start], start + np.sort(t[inner])[:, None] * axis, [end]])
+        pieces.append(np.stack([points[:-1], points[1:]], axis = 1))
+    pieces = np.concatenate(pieces) if pieces else np.zeros((0, 2, 3))
+    points = np.round(np.concatenate([extra, pieces.reshape(-1, 3)]), decimals) + 0.0
+    nodes, index = np.unique(points, axis = 0, return_inverse = True)
+    edges = index.ravel()[len(extra):].reshape(-1, 2)
+    edges = np.unique(np.sort(edges, axis = 1), axis = 0)
+    return nodes, edges[edges[:, 0] != edges[:, 1]]
+
+def graph_segments(nodes: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    """
+    End points of the edges of a graph, the input of the mesh and SDF engines.
+
+    :return: an (E, 2, 3) array
+    """
+    return np.asarray(nodes)[np.asarray(edges)]
+
+def tile_graph(nodes: np.ndarray, edges: np.ndarray, origins):
+    """
+    Repeats a unit cell graph at every cell origin.
+
+    :param nodes: an (M, 3) array of the unit cell nodes
+    :param edges: an (E, 2) array of the unit cell edges
+    :param origins: a (C, 3) array of cell origins, see grid.cell_origins
+    :return: nodes (a (C * M, 3) array), edges (a (C * E, 2) array) and the cell of
+        every edge (a (C * E, ) array), e.g. to look up per cell strut radii
+    """
+    nodes = np.asarray(nodes, dtype = float)
+    edges = np.asarray(edges)
+    origins = np.asarray(origins, dtype = float).reshape(-1, 3)
+    cells = len(origins)
+    tiled_nodes = (origins[:, None] + nodes[None]).reshape(-1, 3)
+    tiled_edges = (edges[None] + (len(nodes) * np.arange(cells))[:, None, None]).reshape(-1, 2)
+    return tiled_nodes, tiled_edges, np.repeat(np.arange(cells), len(edges))
+
+def tile_cell_graphs(cell_graph, origins, values = None):
+    """
+    Repeats unit cell graphs at every cell origin. The graph can depend on a parameter of
+    the cell (e.g. the truncation): it is then built once per distinct value.
+
+    :param cell_graph: a graph (nodes, edges) or a function of a cell parameter returning one
+    :param origins: a (C, 3) array of cell origins, see grid.cell_origins
+    :param values: the parameter of every cell (C values), used if cell_graph is a function
+    :return: nodes, edges, the cell of every edge and the cell of every node
+    """
+    origins = np.asarray(origins, dtype = float).reshape(-1, 3)
+    if not callable(cell_graph):
+        nodes, edges, edge_cell = tile_graph(*cell_graph, origins)
+        return nodes, edges, edge_cell, np.repeat(np.arange(len(origins)), len(cell_graph[0]))
+    values = np.broadcast_to(np.asarray(values), (len(origins),))
+    parts = []
+    offset = 0
+    for value in np.unique(values):
+        cells = np.flatnonzero(values == value)
+        cell_nodes, cell_edges = cell_graph(value)
+        nodes, edges, edge_cell = tile_graph(cell_nodes, cell_edges, origins[cells])
+        parts.append((nodes, edges + offset, cells[edge_cell], np.repeat(cells, len(cell_nodes))))
+        offset += len(nodes)
+    return tuple(np.concatenate(column) for column in zip(*parts))
+
+def merge_graph(nodes: np.ndarray,
+    edges: np.ndarray,
+    edge_values = None,
+    node_values = None,
+    decimals: int = 9
+):
+    """
+    Merges the nodes at the same position (up to 10^-decimals) and the edges between
+    the same nodes, e.g. the struts and the nodes shared by neighbouring cells of a tiled
+    graph. A merged edge or node keeps the largest of its values (e.g. radii).
+
+    :param nodes: an (M, 3) array
+    :param edges: an (E, 2) array
+    :param edge_values: a value of every edge or None
+    :param node_values: a value of every node or None
+    :param decimals: precision of the node coordinates
+    :return: nodes, edges, edge values and node values of the merged graph
+    """
+    nodes = np.asarray(nodes, dtype = float)
+    unique_nodes, node_index = np.unique(np.round(nodes, decimals) + 0.0, axis = 0,
+                                         return_inverse = True)
+    node_index = node_index.ravel()
+    edges = np.sort(node_index[np.asarray(edges)], axis = 1)
+    unique_edges, edge_index = np.unique(edges, axis = 0, return_inverse = True)
+    edge_index = edge_index.ravel()
+
+    def reduce(values, index, n):
+        if values is None:
+            return None
+        result = np.full(n, - np.inf)
+        np.maximum.at(result, index, np.broadcast_to(np.asarray(values, dtype = float), index.shape))
+        return result
+
+    kept = unique_edges[:, 0] != unique_edges[:, 1]
+    edge_values = reduce(edge_values, edge_index, len(unique_edges))
+    return (unique_nodes,
+            unique_edges[kept],
+            None if edge_values is None else edge_values[kept],
+            reduce(node_values, node_index, len(unique_nodes)))
+
+def lattice_graph(cell_graph,
+    origins,
+    strut_radius,
+    node_diameter = None,
+    graph_values = None,
+    decimals: int = 9
+):
+    """
+    The global graph of a lattice of unit cell graphs, with every strut and node shared
+    by neighbouring cells once. A shared strut or node gets the largest radius or
+    diameter of its cells, as the union of the cells would.
+
+    :param cell_graph: a unit cell graph (nodes, edges) or a function of graph_values
+        returning one, see tile_cell_graphs
+    :param origins: a (C, 3) array of cell origins
+    :param strut_radius: radius of the struts of every cell (scalar or C values)
+    :param node_diameter: diameter of the nodes of every cell (scalar or C values) or None
+    :param graph_values: the parameter of the graph of every cell
+    :param decimals: precision of the node coordinates
+    :return: nodes, edges, the radius of every edge and the diameter of every node (or None)
+    """
+    nodes, edges, edge_cell, node_cell = tile_cell_graphs(cell_graph, origins, graph_values)
+    cells = len(np.asarray(origins).reshape(-1, 3))
+    strut_radius = np.broadcast_to(np.asarray(strut_radius, dtype = float), (cells,))
+    if node_diameter is not None:
+        node_diameter = np.broadcast_to(np.asarray(node_diameter, dtype = float), (cells,))[node_cell]
+    return merge_graph(nodes, edges, strut_radius[edge_cell], node_diameter, decimals)
@@ -0,0 +1,246 @@
+import numpy as np
+
+# Axis names used by the builders to choose the direction of the gradient.
+AXES = {'x': 0, 'y': 1, 'z': 2}
+
+def cell_indices(Nx: int, Ny: int, Nz: int) -> np.ndarray:
+    """
+    Returns the (i, j, k) indices of all cells of a Nx x Ny x Nz grid in the order used by
+    the lattice builders: i changes slowest, k fastest.
+
+    :param Nx: number of cells in the X direction
+    :param Ny: number of cells in the Y direction
+    :param Nz: number of cells in the Z direction
+    :return: an integer array of shape (Nx * Ny * Nz, 3)
+    """
+    i, j, k = np.meshgrid(np.arange(Nx), np.arange(Ny), np.arange(Nz), indexing = 'ij')
+    return np.stack([i.ravel(), j.ravel(), k.ravel()], axis = 1)
+
+def cell_origins(indices: np.ndarray, spacing: float) -> np.ndarray:
+    """
+    Returns the origins of the cells with the given indices.
+
+    :param indices: an (N, 3) array of cell indices, see cell_indices
+    :param spacing: distance between the origins of two neighbouring cells
+    :return: a float array of shape (N, 3)
+    """
+    return np.asarray(indices, dtype = float) * spacing
+
+def linear_rule(min_value: float, max_value: float, n: int) -> np.ndarray:
+    """
+    Values changing linearly from min_value to max_value.
+    """
+    return np.linspace(min_value, max_value, n)
+
+def sin_rule(min_value: float, max_value: float, n: int) -> np.ndarray:
+    """
+    The 'sin' rule of the strut lattices.
+    """
+    average = 0.5 * (min_value + max_value)
+    return np.sin(np.linspace(min_value, max_value, n) * 12) + 2 * average
+
+def sin_wave_rule(min_value: float, max_value: float, n: int) -> np.ndarray:
+    """
+    The 'sin' rule of the TPMS lattices: a sine wave between min_value and max_value.
+    """
+    average = 0.5 * (min_value + max_value)
+    return 0.5 * np.sin(np.linspace(0, n, num = n)) * (max_value - min_value) + average
+
+def parabola_rule(min_value: float, max_value: float, n: int) -> np.ndarray:
+    """
+    A parabola that has its maximum in the middle of the lattice.
+    """
+    x = np.linspace(0, 1, num = n)
+    return - 4 * max_value * (x - 0.5) * (x - 0.5) + max_value + min_value
+
+RULES = {
+    'linear': linear_rule,
+    'sin': sin_rule,
+    'parabola': parabola_rule
+}
+
+def graded(min_value: float,
+    max_value: float,
+    n: int,
+    rule: str = 'linear',
+    rules: dict = RULES
+) -> np.ndarray:
+    """
+    Returns n values of a parameter graded from min_value to max_value according to the rule.
+
+    :param min_value: the minimal value of the parameter
+    :param max_value: the maximal value of the parameter
+    :param n: number of values (usually the number of cells in the grading direction)
+    :param rule: name of the rule
+    :param rules: the available rules
+    :return: a float array of shape (n, )
+    """
+    if rule not in rules:
+        raise ValueError(f"Rule '{rule}' does not exist. The acceptable rules are {list(rules)}")
+    return rules[rule](min_value, max_value, n)
+
+def per_cell(values: np.ndarray, indices: np.ndarray, axis: str = 'z') -> np.ndarray:
+    """
+    Assigns to every cell the value of its layer in the given direction.
+
+    :param values: an array of values, one for every layer in the direction
+    :param indices: an (N, 3) array of cell indices, see cell_indices
+    :param axis: the direction of the layers: 'x', 'y' or 'z'
+    :return: an array of shape (N, )
+    """
+    axis = axis.lower()
+    if axis not in AXES:
+        raise ValueError(f'Direction {axis} does not exist. The acceptable directions are {list(AXES)}')
+    return np.asarray(values)[np.asarray(indices)[:, AXES[axis]]]
+
+def graded_cells(Nx: int, Ny: int, Nz: int,
+    min_strut_diameter: float,
+    max_strut_diameter: float,
+    min_node_diameter: float,
+    max_node_diameter: float,
+    rule: str = 'linear',
+    axis: str = 'z'
+):
+    """
+    Grades the struts and nodes of a strut lattice layer by layer, the step shared by the
+    lattice builders and the graphs of the lattices.
+
+    :param Nx: number of cells in the X direction
+    :param Ny: number of cells in the Y direction
+    :param Nz: number of cells in the Z direction
+    :param rule: name of the grading rule, see graded
+    :param axis: the direction of the grading: 'x', 'y' or 'z'
+    :return: the cell indices (see cell_indices), the strut radius and the node diameter
+        of every cell
+    """
+    axis = axis.lower()
+    if axis not in AXES:
+        raise ValueError(f'Direction {axis} does not exist. The acceptable directions are {list(AXES)}')
+    n = (Nx, Ny, Nz)[AXES[axis]]
+    indices = cell_indices(Nx, Ny, Nz)
+    strut_radii = graded(min_strut_diameter / 2.0, max_strut_diameter / 2.0, n, rule)
+    node_diameters = graded(min_node_diameter, max_node_diameter, n, rule)
+    return indices, per_cell(strut_radii, indices, axis), per_cell(node_diameters, indices, axis)
+
+def cell_params(n: int, **columns) -> dict:
+    """
+    Creates the keyword arguments of the unit cell callbacks of eachpointAdaptive in the
+    columnar form: values shared by all cells stay scalars, per cell values stay arrays.
+
+    :param n: number of cells
+    :param columns: parameter values: either one value for all cells or an array of n values
+    :return: a dict for the callback_extra_args of eachpointAdaptive
+    """
+    for name, column in columns.items():
+        if isinstance(column, np.ndarray) and column.ndim > 0 and len(column) != n:
+            raise ValueError(f"The parameter '{name}' has {len(column)} values for {n} cells")
+    return dict(columns)
+
+def cell_centers(indices: np.ndarray, spacing: float) -> np.ndarray:
+    """
+    Returns the centers of the cells with the given indices.
+
+    :param indices: an (N, 3) array of cell indices, see cell_indices
+    :param spacing: size of a cell
+    :return: a float array of shape (N, 3)
+    """
+    return (np.asarray(indices, dtype = float) + 0.5) * spacing
+
+def volume_field(values: np.ndarray, lower, upper):
+    """
+    Turns a volume of values sampled on a regular grid spanning the box [lower, upper]
+    into a field: a function of the coordinates that interpolates the volume trilinearly.
+    Points outside the box get the value of the nearest boundary sample.
+
+    :param values: an (nx, ny, nz) array
+    :param lower: the corner of the box at values[0, 0, 0]
+    :param upper: the corner of the box at values[-1, -1, -1]
+    :return: a function f(x, y, z) of arrays of coordinates
+    """
+    values = np.asarray(values, dtype = float)
+    if values.ndim != 3:
+        raise ValueError(f"Expected a 3D volume, got an array of shape {values.shape}")
+    lower = np.asarray(lower, dtype = float)
+    upper = np.asarray(upper, dtype = float)
+    cells = np.array(values.shape) - 1
+    # a volume with a single sample along an axis is constant along it
+    extent = np.where(cells > 0, upper - lower, 1.0)
+
+    def field(x, y, z):
+        x, y, z = np.broadcast_arrays(*(np.asarray(c, dtype = float) for c in (x, y, z)))
+        i0, w = [], []
+        for c, lo, ext, n in zip((x, y, z), lower, extent, cells):
+            u = np.clip((c - lo) / ext * n, 0, n)
+            i = np.minimum(np.floor(u).astype(int), max(n - 1, 0))
+            i0.append(i)
+            w.append(u - i)
+        result = np.zeros(x.shape)
+        for dx in (0, 1):
+            for dy in (0, 1):
+                for dz in (0, 1):
+                    weight = ((w[0] if dx else 1 - w[0])
+                              * (w[1] if dy else 1 - w[1])
+                              * (w[2] if dz else 1 - w[2]))
+                    index = tuple(np.minimum(i + d, n) for i, d, n in zip(i0, (dx, dy, dz), cells))
+                    result += weight * values[index]
+        return result
+    return field
+
+def evaluate_field(field, x, y, z, lower = None, upper = None) -> np.ndarray:
+    """
+    Evaluates a parameter field at the given points in a vectorized way.
+
+    :param field: a number, a function f(x, y, z) of arrays of coordinates, or a 3D array
+        of values spanning the box [lower, upper] (see volume_field)
+    :param x: X coordinates
+    :param y: Y coordinates
+    :param z: Z coordinates
+    :param lower: the lower corner of the box of a volume
+    :param upper: the upper corner of the box of a volume
+    :return: a float array of the shape of the coordinates
+    """
+    if isinstance(field, np.ndarray) and field.ndim == 3:
+        if lower is None or upper is None:
+            raise ValueError("The bounds of the volume are needed to evaluate it")
+        field = volume_field(field, lower, upper)
+    values = field(x, y, z) if callable(field) else field
+    return np.broadcast_to(np.asarray(values, dtype = float), np.shape(x))
+
+def quantize(values: np.ndarray, step: float = None) -> np.ndarray:
+    """
+    Rounds values to multiples of step, so that cells with nearly the same parameters get
+    the same ones and are built once by the unit cell cache.
+
+    :param values: an array of values
+    :param step: the quantization step. None or 0 keeps the values
+    :return: an array of the shape of values
+    """
+    if not step:
+        return np.asarray(values)
+    return np.round(np.asarray(values, dtype = float) / step) * step
+
+def cell_field(field,
+    indices: np.ndarray,
+    spacing: float,
+    min_value: float = None,
+    max_value: float = None,
+    step: float = None
+) -> np.ndarray:
+    """
+    Evaluates a parameter field at the centers of the cells of a lattice.
+    A volume spans the bounding box of the lattice.
+
+    :param field: a number, a function f(x, y, z) or a 3D array, see evaluate_field
+    :param indices: an (N, 3) array of cell indices, see cell_indices
+    :param spacing: size of a cell
+    :param min_value: the values are clipped to [min_value, max_value] (None for no bound)
+    :param max_value: see min_value
+    :param step: the quantization step, see quantize
+    :return: an array of N values
+    """
+    centers = cell_centers(indices, spacing)
+    upper = (np.asarray(indices).max(axis = 0) + 1) * spacing if len(indices) else np.zeros(3)
+    values = evaluate_field(field, centers[:, 0], centers[:, 1], centers[:, 2], np.zeros(3), upper)
+    if min_value is not None or max_value is not None:
+        values = np.clip(values, min_value, max_value)
+    return quantize(values, step)
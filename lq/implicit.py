@@ -0,0 +1,296 @@
+import numpy as np
+
+from .grid import evaluate_field
+from .mesh import marching_tetrahedra, mesh_writer
+
+# Implicit (level-set) TPMS lattices. A TPMS is the zero set of a periodic function F of
+# the coordinates scaled by 2 pi / unit_cell_size. The solid is a region of a field that
+# is negative inside, and it is meshed directly with marching tetrahedra, so no surface
+# fitting and no boolean operations are needed.
+
+def gyroid(x, y, z):
+    """
+    Gyroid: sin x cos y + sin y cos z + sin z cos x, and its gradient.
+    """
+    sx, sy, sz = np.sin(x), np.sin(y), np.sin(z)
+    cx, cy, cz = np.cos(x), np.cos(y), np.cos(z)
+    value = sx * cy + sy * cz + sz * cx
+    gradient = (cx * cy - sz * sx,
+                cy * cz - sx * sy,
+                cz * cx - sy * sz)
+    return value, gradient
+
+def schwarz_p(x, y, z):
+    """
+    Schwarz Primitive: cos x + cos y + cos z, and its gradient.
+    """
+    value = np.cos(x) + np.cos(y) + np.cos(z)
+    gradient = (- np.sin(x), - np.sin(y), - np.sin(z))
+    return value, gradient
+
+def schwarz_d(x, y, z):
+    """
+    Schwarz Diamond: sin x sin y sin z + sin x cos y cos z + cos x sin y cos z
+    + cos x cos y sin z, and its gradient.
+    """
+    sx, sy, sz = np.sin(x), np.sin(y), np.sin(z)
+    cx, cy, cz = np.cos(x), np.cos(y), np.cos(z)
+    value = sx * sy * sz + sx * cy * cz + cx * sy * cz + cx * cy * sz
+    gradient = (cx * sy * sz + cx * cy * cz - sx * sy * cz - sx * cy * sz,
+                sx * cy * sz - sx * sy * cz + cx * cy * cz - cx * sy * sz,
+                sx * sy * cz - sx * cy * sz - cx * sy * sz + cx * cy * cz)
+    return value, gradient
+
+def iwp(x, y, z):
+    """
+    Schoen I-WP: 2 (cos x cos y + cos y cos z + cos z cos x) - (cos 2x + cos 2y + cos 2z),
+    and its gradient.
+    """
+    sx, sy, sz = np.sin(x), np.sin(y), np.sin(z)
+    cx, cy, cz = np.cos(x), np.cos(y), np.cos(z)
+    value = (2 * (cx * cy + cy * cz + cz * cx)
+             - (np.cos(2 * x) + np.cos(2 * y) + np.cos(2 * z)))
+    gradient = (- 2 * sx * (cy + cz) + 2 * np.sin(2 * x),
+                - 2 * sy * (cx + cz) + 2 * np.sin(2 * y),
+                - 2 * sz * (cx + cy) + 2 * np.sin(2 * z))
+    return value, gradient
+
+SURFACES = {
+    'gyroid': gyroid,
+    'schwarz_p': schwarz_p,
+    'schwarz_d': schwarz_d,
+    'diamond': schwarz_d,
+    'iwp': iwp
+}
+
+def tpms_distance(surface,
+    x: np.ndarray,
+    y: np.ndarray,
+    z: np.ndarray,
+    unit_cell_size: float,
+    surfaces: dict = SURFACES
+) -> np.ndarray:
+    """
+    Evaluates F / |grad F|, the first order approximation of the signed distance to
+    the surface F = 0, so that the thickness of the lattices is in length units.
+
+    :param surface: name of the surface (see SURFACES) or a function
+        f(x, y, z, unit_cell_size) returning the distance, e.g. made by blend
+    :param x: X coordinates
+    :param y: Y coordinates
+    :param z: Z coordinates
+    :param unit_cell_size: size of the unit cell
+    :param surfaces: the available surfaces
+    :return: an array of the shape of the coordinates
+    """
+    if callable(surface):
+        return surface(x, y, z, unit_cell_size)
+    if surface not in surfaces:
+        raise ValueError(f"Surface '{surface}' does not exist. The acceptable surfaces are {list(surfaces)}")
+    scale = 2 * np.pi / unit_cell_size
+    value, gradient = surfaces[surface](x * scale, y * scale, z * scale)
+    norm = np.sqrt(sum(g * g for g in gradient)) * scale
+    return value / np.maximum(norm, 1e-9)
+
+def blend(surface1,
+    surface2,
+    point = (0, 0, 0),
+    direction = (1, 0, 0),
+    width: float = 1.0
+):
+    """
+    Creates a smooth transition from surface1 to surface2 across the plane through point
+    normal to direction. The distances to the two surfaces are mixed with a sigmoid weight
+    that goes from 12 % to 88 % over the given width, so the transition can span several
+    cells and have any orientation. Blends can be blended again.
+
+    :param surface1: the surface behind the plane: a name of SURFACES or another blend
+    :param surface2: the surface in front of the plane (in the direction)
+    :param point: a point of the middle plane of the transition
+    :param direction: the direction of the transition
+    :param width: the width of the transition
+    :return: a function f(x, y, z, unit_cell_size) that can be used as a surface
+    """
+    point = np.asarray(point, dtype = float)
+    direction = np.asarray(direction, dtype = float)
+    norm = np.linalg.norm(direction)
+    if norm == 0:
+        raise ValueError("The direction of the transition is a zero vector")
+    direction = direction / norm
+    if width <= 0:
+        raise ValueError(f"The width of the transition must be positive, got {width}")
+
+    def distance(x, y, z, unit_cell_size):
+        s = sum((c - p) * n for c, p, n in zip((x, y, z), point, direction))
+        weight = 0.5 * (1 + np.tanh(2 * s / width))
+        return ((1 - weight) * tpms_distance(surface1, x, y, z, unit_cell_size)
+                + weight * tpms_distance(surface2, x, y, z, unit_cell_size))
+    return distance
+
+def sheet_field(distance: np.ndarray, thickness) -> np.ndarray:
+    """
+    The sheet lattice: the band of the given thickness around the surface.
+
+    :param distance: the signed distance to the surface, see tpms_distance
+    :param thickness: thickness of the sheet (a scalar or an array like distance)
+    :return: a field that is negative inside the sheet
+    """
+    return np.abs(distance) - 0.5 * np.asarray(thickness)
+
+def network_field(distance: np.ndarray, offset = 0.0) -> np.ndarray:
+    """
+    The network (skeletal) lattice: one of the two labyrinths of the surface.
+
+    :param distance: the signed distance to the surface, see tpms_distance
+    :param offset: shifts the surface into the labyrinth (negative) or away from it (positive)
+    :return: a field that is negative inside the network
+    """
+    return distance - np.asarray(offset)
+
+def box_field(x, y, z, size, origin = (0, 0, 0)) -> np.ndarray:
+    """
+    Approximate signed distance to the box [origin, origin + size] (negative inside).
+    Intersecting a field with it trims the lattice to the box and closes the mesh on the box faces.
+    """
+    return np.maximum.reduce([np.maximum(o - c, c - o - s)
+                              for c, s, o in zip((x, y, z), size, origin)])
+
+def sample_axes(size, unit_cell_size: float, resolution: int = 16, origin = (0, 0, 0)):
+    """
+    Creates the sample coordinates of a box with one layer of samples outside every face.
+
+    :param size: dimensions of the box (x, y, z)
+    :param unit_cell_size: size of the unit cell
+    :param resolution: number of samples per unit cell
+    :param origin: the lower corner of the box
+    :return: the sample coordinates along X, Y and Z and the spacing per axis
+    """
+    size = np.asarray(size, dtype = float)
+    counts = np.maximum(np.ceil(size / unit_cell_size * resolution).astype(int), 1)
+    spacing = size / counts
+    axes = [o + np.arange(- 1, n + 2) * h for n, h, o in zip(counts, spacing, origin)]
+    return axes, spacing
+
+def tpms_field(surface,
+    x: np.ndarray,
+    y: np.ndarray,
+    z: np.ndarray,
+    size,
+    unit_cell_size: float,
+    thickness = 0.1,
+    kind: str = 'sheet',
+    origin = (0, 0, 0)
+) -> np.ndarray:
+    """
+    Evaluates the field of a TPMS lattice trimmed to a box, negative inside the solid.
+    See tpms_mesh for the parameters.
+    """
+    distance = tpms_distance(surface, x, y, z, unit_cell_size)
+    upper = np.asarray(origin, dtype = float) + np.asarray(size, dtype = float)
+    thickness = evaluate_field(thickness, x, y, z, origin, upper)
+    if kind == 'sheet':
+        field = sheet_field(distance, thickness)
+    elif kind == 'network':
+        field = network_field(distance, thickness)
+    else:
+        raise ValueError(f"Lattice kind '{kind}' does not exist. The acceptable kinds are ['sheet', 'network']")
+    return np.maximum(field, box_field(x, y, z, size, origin))
+
+def tpms_mesh(surface,
+    size,
+    unit_cell_size: float,
+    thickness = 0.1,
+    kind: str = 'sheet',
+    resolution: int = 16,
+    origin = (0, 0, 0)
+):
+    """
+    Meshes a TPMS lattice filling a box without any OCC operation.
+
+    :param surface: name of the surface (see SURFACES) or a blend of surfaces (see blend)
+    :param size: dimensions of the box (x, y, z)
+    :param unit_cell_size: size of the unit cell
+    :param thickness: the sheet thickness for 'sheet' lattices, the offset of the surface
+        for 'network' lattices. Either a number, a function f(x, y, z) of arrays of coordinates
+        evaluated at every sample, or a 3D array of values spanning the box
+    :param kind: 'sheet' or 'network'
+    :param resolution: number of samples per unit cell
+    :param origin: the lower corner of the box
+    :return: vertices (an (n, 3) array) and faces (an (m, 3) array) of a watertight mesh
+    """
+    axes, spacing = sample_axes(size, unit_cell_size, resolution, origin)
+    x, y, z = np.meshgrid(*axes, indexing = 'ij')
+    field = tpms_field(surface, x, y, z, size, unit_cell_size, thickness, kind, origin)
+    return marching_tetrahedra(field, [a[0] for a in axes], spacing, close = True)
+
+def _brick_keys(keys: np.ndarray, shape, start, global_shape):
+    """
+    Converts the vertex keys of a brick (see marching_tetrahedra) to keys of the whole
+    grid and counts the bricks that create every vertex: a vertex on a face of the brick
+    is created by the neighbouring brick as well, on an edge of the brick by four bricks.
+    """
+    lower, direction = np.divmod(keys, 8)
+    lower = np.stack(np.unravel_index(lower, shape), axis = 1)
+    copies = np.ones(len(keys), dtype = np.int64)
+    for axis in range(3):
+        # the edge lies in a face of the brick if it does not leave the face plane
+        in_plane = (direction >> axis & 1) == 0
+        seam = in_plane & (((lower[:, axis] == 0) & (start[axis] > 0)) |
+                           ((lower[:, axis] == shape[axis] - 1) &
+                            (start[axis] + shape[axis] < global_shape[axis])))
+        copies[seam] *= 2
+    lower = np.ravel_multi_index(tuple((lower + start).T), global_shape)
+    return lower * 8 + direction, copies
+
+def tpms_stream(path: str,
+    surface,
+    size,
+    unit_cell_size: float,
+    thickness = 0.1,
+    kind: str = 'sheet',
+    resolution: int = 16,
+    origin = (0, 0, 0),
+    brick: int = 64
+) -> int:
+    """
+    Meshes a TPMS lattice brick by brick and streams the triangles into an STL or a 3MF
+    file (chosen by the extension of path), so the memory use depends on the brick size and
+    not on the size of the part.
+
+    Neighbouring bricks share their face samples. The voxels of the decomposition are split
+    the same way everywhere, so the seams match exactly; the 3MF writer welds the seam
+    vertices and forgets them once all the bricks sharing them were written.
+
+    :param path: path of the file
+    :param brick: number of voxels along every side of a brick
+    :return: the number of triangles
+    See tpms_mesh for the other parameters.
+    """
+    axes, spacing = sample_axes(size, unit_cell_size, resolution, origin)
+    global_shape = tuple(len(a) for a in axes)
+    starts = [range(0, n - 1, brick) for n in global_shape]
+    with mesh_writer(path) as writer:
+        for i in starts[0]:
+            for j in starts[1]:
+                for k in starts[2]:
+                    start = np.array([i, j, k])
+                    x, y, z = np.meshgrid(*(a[s:s + brick + 1] for a, s in zip(axes, start)),
+                                          indexing = 'ij')
+                    field = tpms_field(surface, x, y, z, size, unit_cell_size, thickness, kind, origin)
+                    vertices, faces, keys = marching_tetrahedra(
+                        field, [x[0, 0, 0], y[0, 0, 0], z[0, 0, 0]], spacing, return_keys = True)
+                    if len(faces) == 0:
+                        continue
+                    keys, copies = _brick_keys(keys, field.shape, start, global_shape)
+                    writer.add(vertices, faces, keys, copies = copies)
+        return writer.count
+
+def tpms_export(path: str, *args, **kwargs):
+    """
+    Meshes a TPMS lattice with tpms_mesh and writes it to an STL or a 3MF file (chosen by
+    the extension of path). The arguments are those of tpms_mesh.
+    """
+    vertices, faces = tpms_mesh(*args, **kwargs)
+    with mesh_writer(path) as writer:
+        writer.add(vertices, faces)
+    return vertices, faces
@@ -0,0 +1,478 @@
+import shutil
+import struct
+import tempfile
+import zipfile
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+# Corners of a voxel, numbered by bits: corner = x + 2 * y + 4 * z.
+CUBE_CORNERS = np.array([[(c >> 0) & 1, (c >> 1) & 1, (c >> 2) & 1] for c in range(8)])
+# Decomposition of a voxel into 6 tetrahedra around its main diagonal 0-7. All voxels are
+# split in the same way, so the faces of neighbouring voxels are split along the same
+# diagonal and the extracted surface is watertight.
+TETRAHEDRA = np.array([
+    [0, 1, 3, 7],
+    [0, 1, 5, 7],
+    [0, 2, 3, 7],
+    [0, 2, 6, 7],
+    [0, 4, 5, 7],
+    [0, 4, 6, 7]
+])
+
+def _triangle_table():
+    """
+    Builds the marching tetrahedra table: for each of the 16 sign cases of a tetrahedron
+    (bit i is set if vertex i is inside) the triangles as triples of tetrahedron edges
+    (pairs of local vertex indices).
+    """
+    table = {}
+    for case in range(1, 15):
+        inside = [v for v in range(4) if case >> v & 1]
+        outside = [v for v in range(4) if not case >> v & 1]
+        if len(inside) == 1 or len(outside) == 1:
+            lone, others = (inside[0], outside) if len(inside) == 1 else (outside[0], inside)
+            table[case] = [[(lone, o) for o in others]]
+        else:
+            (p, q), (r, s) = inside, outside
+            table[case] = [[(p, r), (p, s), (q, s)],
+                           [(p, r), (q, s), (q, r)]]
+    return table
+
+TRIANGLE_TABLE = _triangle_table()
+
+def marching_tetrahedra(values: np.ndarray,
+    origin = (0, 0, 0),
+    spacing = 1.0,
+    close: bool = False,
+    return_keys: bool = False
+):
+    """
+    Extracts the surface values = 0 of a scalar field sampled on a regular grid as an indexed
+    triangle mesh. The region values < 0 is the inside, the triangles are oriented
+    with their normals pointing outside. Vertices on shared voxel edges are created once, so the
+    mesh is watertight wherever the surface does not leave the grid.
+
+    :param values: a (nx, ny, nz) array of the field values
+    :param origin: coordinates of values[0, 0, 0]
+    :param spacing: distance between the samples, a scalar or one value per axis
+    :param close: pad the grid with outside values, so that the surface is closed at the
+        boundary of the grid
+    :param return_keys: also return the grid edge of every vertex as
+        8 * (linear index of its lower sample) + (direction bits of the edge), in the
+        padded grid if close
+    :return: vertices (an (n, 3) float array) and faces (an (m, 3) int array)
+        and, if return_keys, the keys (an (n, ) int array)
+    """
+    values = np.asarray(values, dtype = float)
+    spacing = np.broadcast_to(np.asarray(spacing, dtype = float), (3,))
+    origin = np.asarray(origin, dtype = float)
+    if close:
+        values = np.pad(values, 1, constant_values = 1.0)
+        origin = origin - spacing
+    # An exact zero is on neither side of the surface.
+    values = np.where(values == 0, 1e-12, values)
+    nx, ny, nz = values.shape
+    if min(nx, ny, nz) < 2:
+        return _empty_mesh(return_keys)
+    flat = values.ravel()
+    inside = values < 0
+    strides = np.array([ny * nz, nz, 1])
+
+    # Only voxels with corners on both sides of the surface produce triangles.
+    corner_inside = [inside[x:nx - 1 + x, y:ny - 1 + y, z:nz - 1 + z]
+                     for x, y, z in CUBE_CORNERS]
+    n_inside = sum(c.astype(np.int8) for c in corner_inside)
+    active = np.nonzero((n_inside > 0) & (n_inside < 8))
+    base = (np.stack(active, axis = 1) * strides).sum(axis = 1)
+    corner_offsets = CUBE_CORNERS @ strides
+
+    edge_keys = []
+    edge_lower = []
+    edge_upper = []
+    reference = []
+    for tetrahedron in TETRAHEDRA:
+        vertices = base[:, None] + corner_offsets[tetrahedron][None, :]
+        cases = ((flat[vertices] < 0) * np.array([1, 2, 4, 8])).sum(axis = 1)
+        for case, triangles in TRIANGLE_TABLE.items():
+            selected = vertices[cases == case]
+            if len(selected) == 0:
+                continue
+            inside_vertex = selected[:, [v for v in range(4) if case >> v & 1][0]]
+            for triangle in triangles:
+                for a, b in triangle:
+                    a, b = min(a, b), max(a, b)
+                    lower, upper = selected[:, a], selected[:, b]
+                    # the edges of the decomposition always go from the lower to the
+                    # upper corner, so an edge is its lower vertex and its direction
+                    direction = (CUBE_CORNERS[tetrahedron[b]] - CUBE_CORNERS[tetrahedron[a]]) @ [1, 2, 4]
+                    edge_keys.append(lower * 8 + direction)
+                    edge_lower.append(lower)
+                    edge_upper.append(upper)
+                reference.append(inside_vertex)
+    if not edge_keys:
+        return _empty_mesh(return_keys)
+
+    # Every group of triangles contributes 3 consecutive arrays of edges.
+    edge_keys = np.stack([np.concatenate(edge_keys[i::3]) for i in range(3)], axis = 1)
+    edge_lower = np.stack([np.concatenate(edge_lower[i::3]) for i in range(3)], axis = 1)
+    edge_upper = np.stack([np.concatenate(edge_upper[i::3]) for i in range(3)], axis = 1)
+    reference = np.concatenate(reference)
+
+    keys, first, faces = np.unique(edge_keys.ravel(), return_index = True, return_inverse = True)
+    faces = faces.reshape(-1, 3)
+    lower = edge_lower.ravel()[first]
+    upper = edge_upper.ravel()[first]
+    f_lower, f_upper = flat[lower], flat[upper]
+    # Keeping the vertices off the samples keeps vertices of different edges apart, also
+    # after rounding to the single precision of STL.
+    t = np.clip(f_lower / (f_lower - f_upper), 1e-3, 1 - 1e-3)[:, None]
+    p_lower = _grid_points(lower, values.shape, origin, spacing)
+    p_upper = _grid_points(upper, values.shape, origin, spacing)
+    vertices = p_lower + t * (p_upper - p_lower)
+
+    # Orient the triangles away from the inside vertex of their tetrahedron. The test uses
+    # the triangles through the edge midpoints, which have the same orientation and are never
+    # degenerate, unlike the interpolated ones.
+    midpoints = 0.5 * (_grid_points(edge_lower.ravel(), values.shape, origin, spacing)
+                       + _grid_points(edge_upper.ravel(), values.shape, origin, spacing)).reshape(-1, 3, 3)
+    a, b, c = midpoints[:, 0], midpoints[:, 1], midpoints[:, 2]
+    normals = np.cross(b - a, c - a)
+    inside_points = _grid_points(reference, values.shape, origin, spacing)
+    flip = np.einsum('ij,ij->i', normals, a - inside_points) < 0
+    faces[flip] = faces[flip][:, ::-1]
+    if return_keys:
+        return vertices, faces, keys
+    return vertices, faces
+
+def _empty_mesh(return_keys: bool = False):
+    empty = (np.zeros((0, 3)), np.zeros((0, 3), dtype = np.int64))
+    if return_keys:
+        return empty + (np.zeros(0, dtype = np.int64),)
+    return empty
+
+def _grid_points(linear_indices, shape, origin, spacing):
+    """
+    Coordinates of the grid samples with the given linear indices.
+    """
+    return np.stack(np.unravel_index(linear_indices, shape), axis = 1) * spacing + origin
+
+def mesh_volume(vertices: np.ndarray, faces: np.ndarray) -> float:
+    """
+    Volume enclosed by a closed, outward oriented triangle mesh.
+
+    :param vertices: an (n, 3) array
+    :param faces: an (m, 3) array of vertex indices
+    :return: the volume
+    """
+    a, b, c = vertices[faces[:, 0]], vertices[faces[:, 1]], vertices[faces[:, 2]]
+    return float(np.einsum('ij,ij->i', a, np.cross(b, c)).sum() / 6.0)
+
+def _stl_records(vertices: np.ndarray, faces: np.ndarray) -> bytes:
+    """
+    Packs triangles into binary STL records.
+    """
+    record = np.dtype([('normal', '<f4', (3,)),
+                       ('vertices', '<f4', (3, 3)),
+                       ('attribute', '<u2')])
+    triangles = vertices[faces]
+    normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    lengths = np.linalg.norm(normals, axis = 1)
+    lengths[lengths == 0] = 1.0
+    data = np.zeros(len(faces), dtype = record)
+    data['normal'] = normals / lengths[:, None]
+    data['vertices'] = triangles
+    return data.tobytes()
+
+CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="model" ContentType="application/vnd.ms-package.3dmanufacturing-3dmodel+xml"/>'
+    '</Types>')
+
+RELATIONSHIPS = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Target="/3D/3dmodel.model" Id="rel0" '
+    'Type="http://schemas.microsoft.com/3dmanufacturing/2013/01/3dmodel"/>'
+    '</Relationships>')
+
+MODEL_NAMESPACE = 'http://schemas.microsoft.com/3dmanufacturing/core/2015/02'
+BEAM_LATTICE_NAMESPACE = 'http://schemas.microsoft.com/3dmanufacturing/beamlattice/2017/02'
+BALLS_NAMESPACE = 'http://schemas.microsoft.com/3dmanufacturing/beamlattice/balls/2020/07'
+
+def _3mf_vertices(vertices: np.ndarray) -> str:
+    return ''.join(f'<vertex x="{x:.6g}" y="{y:.6g}" z="{z:.6g}"/>' for x, y, z in vertices.tolist())
+
+def _3mf_triangles(faces: np.ndarray, offset: int = 0) -> str:
+    return ''.join(f'<triangle v1="{a}" v2="{b}" v3="{c}"/>'
+                   for a, b, c in (faces + offset).tolist())
+
+class StlWriter:
+    """
+    Streams triangles into a binary STL file: the triangles are written as soon as
+    they are added and the triangle count in the header is filled in on close, so a mesh
+    can be written in chunks that never are all in memory.
+
+    Use it as a context manager or call close().
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0
+        self._file = open(path, 'wb')
+        self._file.write(b'LatticeQuery'.ljust(80, b' '))
+        self._file.write(struct.pack('<I', 0))
+
+    def add(self, vertices: np.ndarray, faces: np.ndarray, keys = None, shared = None, copies = None):
+        """
+        Writes a chunk of a mesh. keys, shared and copies are accepted for compatibility
+        with ThreeMfWriter, STL does not share vertices.
+
+        :param vertices: an (n, 3) array
+        :param faces: an (m, 3) array of indices into vertices
+        """
+        self._file.write(_stl_records(vertices, faces))
+        self.count += len(faces)
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._file.seek(80)
+        self._file.write(struct.pack('<I', self.count))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class ThreeMfWriter:
+    """
+    Streams a mesh into a 3MF file as a single object. The vertices and the triangles
+    of the added chunks go to two temporary files, which are copied into the archive on close.
+
+    Vertices that are shared between chunks (e.g. on the seams of meshing bricks) are
+    identified by their keys and written once, so the object stays watertight. The writer
+    remembers a shared vertex until all its copies were added (see add), so only the seams
+    of the chunks still to come are held in memory.
+
+    Use it as a context manager or call close().
+    """
+    def __init__(self, path: str, name: str = 'lattice', unit: str = 'millimeter'):
+        self.path = path
+        self.name = name
+        self.unit = unit
+        self.n_vertices = 0
+        self.count = 0
+        self._shared = {}
+        self._remaining = {}
+        self._vertices = tempfile.TemporaryFile()
+        self._triangles = tempfile.TemporaryFile()
+        self._closed = False
+
+    def add(self, vertices: np.ndarray, faces: np.ndarray, keys = None, shared = None, copies = None):
+        """
+        Writes a chunk of a mesh.
+
+        :param vertices: an (n, 3) array
+        :param faces: an (m, 3) array of indices into vertices
+        :param keys: an (n, ) array of integers identifying the vertices across chunks
+        :param shared: an (n, ) boolean array of the vertices that can appear in other
+            chunks (all vertices with keys if not given, or those with more than one copy)
+        :param copies: an (n, ) array of the number of chunks that add each vertex. A shared
+            vertex is forgotten once its last copy was added. Without copies the shared
+            vertices are kept until the writer is closed
+        """
+        ids = np.empty(len(vertices), dtype = np.int64)
+        new = np.ones(len(vertices), dtype = bool)
+        if keys is not None:
+            keys = np.asarray(keys)
+            if shared is None:
+                shared = np.ones(len(vertices), dtype = bool) if copies is None else np.asarray(copies) > 1
+            candidates = np.flatnonzero(shared)
+            known = np.array([self._shared.get(key, - 1) for key in keys[candidates].tolist()],
+                             dtype = np.int64)
+            found = known >= 0
+            ids[candidates[found]] = known[found]
+            new[candidates[found]] = False
+        ids[new] = np.arange(self.n_vertices, self.n_vertices + new.sum())
+        if keys is not None:
+            registered = candidates[~found]
+            if copies is None:
+                self._shared.update(zip(keys[registered].tolist(), ids[registered].tolist()))
+            else:
+                copies = np.asarray(copies)
+                for key, index, count in zip(keys[registered].tolist(), ids[registered].tolist(),
+                                             (copies[registered] - 1).tolist()):
+                    if count > 0:
+                        self._shared[key] = index
+                        self._remaining[key] = count
+                for key in keys[candidates[found]].tolist():
+                    if key in self._remaining:
+                        self._remaining[key] -= 1
+                        if self._remaining[key] == 0:
+                            del self._remaining[key], self._shared[key]
+        self.n_vertices += int(new.sum())
+        for start in range(0, int(new.sum()), 65536):
+            self._vertices.write(_3mf_vertices(vertices[new][start:start + 65536]).encode())
+        for start in range(0, len(faces), 65536):
+            self._triangles.write(_3mf_triangles(ids[faces[start:start + 65536]]).encode())
+        self.count += len(faces)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        with zipfile.ZipFile(self.path, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('[Content_Types].xml', CONTENT_TYPES)
+            archive.writestr('_rels/.rels', RELATIONSHIPS)
+            with archive.open('3D/3dmodel.model', 'w') as model:
+                model.write((f'<?xml version="1.0" encoding="UTF-8"?>\n'
+                             f'<model unit="{self.unit}" xml:lang="en-US" xmlns="{MODEL_NAMESPACE}">'
+                             f'<resources><object id="1" name="{escape(self.name)}" type="model">'
+                             f'<mesh><vertices>').encode())
+                self._vertices.seek(0)
+                shutil.copyfileobj(self._vertices, model)
+                model.write(b'</vertices><triangles>')
+                self._triangles.seek(0)
+                shutil.copyfileobj(self._triangles, model)
+                model.write(b'</triangles></mesh></object></resources>'
+                            b'<build><item objectid="1"/></build></model>')
+        self._vertices.close()
+        self._triangles.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def write_stl(path: str, vertices: np.ndarray, faces: np.ndarray):
+    """
+    Writes a triangle mesh to a binary STL file.
+
+    :param path: path of the file
+    :param vertices: an (n, 3) array
+    :param faces: an (m, 3) array of vertex indices
+    """
+    with StlWriter(path) as writer:
+        writer.add(vertices, faces)
+
+def write_3mf(path: str,
+    vertices: np.ndarray,
+    faces: np.ndarray,
+    name: str = 'lattice',
+    unit: str = 'millimeter'
+):
+    """
+    Writes a triangle mesh to a 3MF file as a single mesh object.
+
+    :param path: path of the file
+    :param vertices: an (n, 3) array
+    :param faces: an (m, 3) array of vertex indices
+    :param name: name of the object
+    :param unit: unit of the coordinates
+    """
+    with ThreeMfWriter(path, name, unit) as writer:
+        writer.add(vertices, faces)
+
+def mesh_writer(path: str, **kwargs):
+    """
+    Returns the streaming writer for the extension of path: ThreeMfWriter for '.3mf',
+    StlWriter otherwise.
+    """
+    if path.lower().endswith('.3mf'):
+        return ThreeMfWriter(path, **kwargs)
+    return StlWriter(path)
+
+def _3mf_beams(edges: np.ndarray, radius1: np.ndarray, radius2: np.ndarray) -> str:
+    return ''.join(f'<b:beam v1="{a}" v2="{b}" r1="{r1:.6g}" r2="{r2:.6g}"/>'
+                   for (a, b), r1, r2 in zip(edges.tolist(), radius1.tolist(), radius2.tolist()))
+
+def _3mf_balls(vertices: np.ndarray, radius: np.ndarray) -> str:
+    return ''.join(f'<b2:ball vindex="{v}" r="{r:.6g}"/>'
+                   for v, r in zip(vertices.tolist(), radius.tolist()))
+
+def write_beam_lattice(path: str,
+    nodes: np.ndarray,
+    edges: np.ndarray,
+    radius,
+    node_diameter = None,
+    radius2 = None,
+    name: str = 'lattice',
+    unit: str = 'millimeter',
+    min_length: float = 1e-4,
+    cap: str = 'sphere',
+    chunk: int = 65536
+):
+    """
+    Writes a strut lattice to a 3MF file as a beam lattice (the 3MF Beam Lattice
+    extension): the nodes, the beams between them and their radii instead of a
+    triangle mesh, which the slicer turns into geometry itself.
+
+    The arguments match the graphs of the lattices (see graph.lattice_graph and the
+    *_heterogeneous_graph functions of the topologies), e.g.
+    write_beam_lattice('part.3mf', *bcc_heterogeneous_graph(...)).
+
+    :param path: path of the file
+    :param nodes: an (M, 3) array of nodes
+    :param edges: an (E, 2) array of the node indices of the beams
+    :param radius: radius of the beams (scalar or E values), at the first node
+    :param node_diameter: diameter of the nodes (scalar or M values). The nodes are written
+        as balls (the balls addition of the extension); None leaves the nodes to the
+        caps of the beams
+    :param radius2: radii at the second node (scalar or E values), None for cylinders
+    :param name: name of the object
+    :param unit: unit of the coordinates
+    :param min_length: beams shorter than this are ignored by the reader
+    :param cap: end caps of the beams: 'sphere', 'hemisphere' or 'butt'
+    :param chunk: number of elements formatted at once
+    """
+    nodes = np.asarray(nodes, dtype = float).reshape(-1, 3)
+    edges = np.asarray(edges, dtype = np.int64).reshape(-1, 2)
+    if len(edges) and (edges.min() < 0 or edges.max() >= len(nodes)):
+        raise ValueError("An edge refers to a node that does not exist")
+    if cap not in ('sphere', 'hemisphere', 'butt'):
+        raise ValueError(f"Cap '{cap}' does not exist.")
+    radius1 = np.broadcast_to(np.asarray(radius, dtype = float), (len(edges),))
+    radius2 = radius1 if radius2 is None else np.broadcast_to(np.asarray(radius2, dtype = float), (len(edges),))
+    if len(edges) and (np.minimum(radius1, radius2) <= 0).any():
+        raise ValueError("The radii of the beams must be positive")
+    default = float(radius1.max()) if len(edges) else 1.0
+
+    namespaces = f'xmlns="{MODEL_NAMESPACE}" xmlns:b="{BEAM_LATTICE_NAMESPACE}"'
+    extensions = 'b'
+    lattice = f'<b:beamlattice minlength="{min_length:.6g}" radius="{default:.6g}" cap="{cap}"'
+    if node_diameter is not None:
+        ball_radius = np.broadcast_to(np.asarray(node_diameter, dtype = float) / 2.0, (len(nodes),))
+        balls = np.flatnonzero(ball_radius > 0)
+        namespaces += f' xmlns:b2="{BALLS_NAMESPACE}"'
+        extensions += ' b2'
+        lattice += f' b2:ballmode="mixed" b2:ballradius="{default:.6g}"'
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', CONTENT_TYPES)
+        archive.writestr('_rels/.rels', RELATIONSHIPS)
+        with archive.open('3D/3dmodel.model', 'w') as model:
+            model.write((f'<?xml version="1.0" encoding="UTF-8"?>\n'
+                         f'<model unit="{unit}" xml:lang="en-US" {namespaces} '
+                         f'requiredextensions="{extensions}">'
+                         f'<resources><object id="1" name="{escape(name)}" type="model">'
+                         f'<mesh><vertices>').encode())
+            for start in range(0, len(nodes), chunk):
+                model.write(_3mf_vertices(nodes[start:start + chunk]).encode())
+            # a beam lattice mesh has no triangles
+            model.write(f'</vertices><triangles/>{lattice}><b:beams>'.encode())
+            for start in range(0, len(edges), chunk):
+                end = start + chunk
+                model.write(_3mf_beams(edges[start:end], radius1[start:end], radius2[start:end]).encode())
+            model.write(b'</b:beams>')
+            if node_diameter is not None:
+                model.write(b'<b2:balls>')
+                for start in range(0, len(balls), chunk):
+                    index = balls[start:start + chunk]
+                    model.write(_3mf_balls(index, ball_radius[index]).encode())
+                model.write(b'</b2:balls>')
+            model.write(b'</b:beamlattice></mesh></object></resources>'
+                        b'<build><item objectid="1"/></build></model>')
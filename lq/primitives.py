@@ -0,0 +1,341 @@
+from math import pi, radians
+
+from OCP.BRepPrimAPI import BRepPrimAPI_MakeTorus
+from OCP.gp import gp_Ax1, gp_Ax2, gp_Ax3, gp_Dir, gp_Pnt, gp_Quaternion, gp_Trsf, gp_Vec
+
+import numpy as np
+
+import cadquery as cq
+
+from .cache import ShapeCache, make_key
+
+# Canonical primitives shared by all strut topologies.
+PRIMITIVE_CACHE = ShapeCache(maxsize = 1024)
+# Fitted surfaces of the TPMS topologies, per unit cell size.
+FACE_CACHE = ShapeCache(maxsize = 64)
+
+def _rotation(rotation) -> gp_Trsf:
+    """
+    Creates the rotation of cq.Workplane.transformed(rotate = rotation) applied to the
+    XY plane: the rotations are done in order x, y, z about the plane axes.
+
+    :param rotation: angles (in degrees) about X, Y and Z
+    :return: the rotation as gp_Trsf
+    """
+    trsf = gp_Trsf()
+    for angle, axis in zip(rotation, ((1, 0, 0), (0, 1, 0), (0, 0, 1))):
+        if angle == 0:
+            continue
+        t = gp_Trsf()
+        t.SetRotation(gp_Ax1(gp_Pnt(0, 0, 0), gp_Dir(*axis)), radians(angle))
+        trsf = trsf * t
+    return trsf
+
+def strut_location(rotation = (0, 0, 0),
+    offset = (0, 0, 0)
+) -> cq.Location:
+    """
+    Returns the location that places a canonical strut (starting at the origin and
+    pointing along +Z) in the same position as the sketch
+    cq.Workplane().transformed(offset = offset, rotate = rotation).circle(r).extrude(h)
+
+    :param rotation: angles (in degrees) about X, Y and Z
+    :param offset: the start point of the strut
+    :return: a cq.Location
+    """
+    if isinstance(rotation, cq.Vector):
+        rotation = rotation.toTuple()
+    if isinstance(offset, cq.Vector):
+        offset = offset.toTuple()
+    trsf = _rotation(tuple(float(a) for a in rotation))
+    translation = gp_Trsf()
+    translation.SetTranslation(gp_Vec(*(float(o) for o in offset)))
+    return cq.Location(translation * trsf)
+
+def prototype_cylinder(radius: float,
+    length: float,
+    cache: ShapeCache = PRIMITIVE_CACHE
+) -> cq.Solid:
+    """
+    Returns the canonical cylinder of the given radius and length: it starts at the origin
+    and points along +Z. The cylinder is built once per (radius, length).
+
+    :param radius: radius of the cylinder
+    :param length: length of the cylinder
+    :param cache: the ShapeCache that stores the prototypes
+    :return: a cq.Solid
+    """
+    key = ('cylinder',) + make_key(radius, length)
+    return cache.get(key, lambda: cq.Solid.makeCylinder(float(radius), float(length)))
+
+def prototype_cone(radius1: float,
+    radius2: float,
+    length: float,
+    cache: ShapeCache = PRIMITIVE_CACHE
+) -> cq.Solid:
+    """
+    Returns the canonical truncated cone: it starts at the origin with radius1
+    and ends at (0, 0, length) with radius2. Equal radii give the canonical cylinder.
+
+    :param radius1: radius at the start
+    :param radius2: radius at the end
+    :param length: length of the cone
+    :param cache: the ShapeCache that stores the prototypes
+    :return: a cq.Solid
+    """
+    if round(radius1 - radius2, 9) == 0:
+        return prototype_cylinder(radius1, length, cache)
+    key = ('cone',) + make_key(radius1, radius2, length)
+    return cache.get(key,
+        lambda: cq.Solid.makeCone(float(radius1), float(radius2), float(length)))
+
+def prototype_arc(radius: float,
+    arc_radius: float,
+    angle: float,
+    cache: ShapeCache = PRIMITIVE_CACHE
+) -> cq.Solid:
+    """
+    Returns the canonical curved strut: a torus segment whose center line is the arc of
+    radius arc_radius about +Z from (arc_radius, 0, 0) counterclockwise by angle. The
+    segment is built once per (radius, arc_radius, angle).
+
+    :param radius: radius of the strut
+    :param arc_radius: radius of the center line
+    :param angle: angle of the arc (in degrees)
+    :param cache: the ShapeCache that stores the prototypes
+    :return: a cq.Solid
+    """
+    key = ('arc',) + make_key(radius, arc_radius, angle)
+    return cache.get(key, lambda: cq.Solid(
+        BRepPrimAPI_MakeTorus(gp_Ax2(), float(arc_radius), float(radius), radians(angle)).Shape()))
+
+def prototype_node(diameter: float,
+    shape: str = 'box',
+    delta: float = 0.01,
+    cache: ShapeCache = PRIMITIVE_CACHE
+) -> cq.Solid:
+    """
+    Returns the canonical node centered at the origin. The node is built once per
+    (diameter, shape, delta).
+
+    'box' is the node used by the strut topologies: a cube with the side
+    diameter + delta and its |Z and then |X edges filleted with diameter / 2
+    (delta is needed because OCC cannot fillet a cube into a cylinder).
+    'sphere' is an analytic sphere of the given diameter, which is much cheaper to build
+    and to fuse.
+
+    :param diameter: diameter of the node
+    :param shape: 'box' or 'sphere'
+    :param delta: the small coefficient added to the side of the box
+    :param cache: the ShapeCache that stores the prototypes
+    :return: a cq.Solid
+    """
+    if shape == 'box':
+        def builder():
+            side = diameter + delta
+            return (cq.Workplane()
+                .box(side, side, side)
+                .edges("|Z")
+                .fillet(diameter / 2.0)
+                .edges("|X")
+                .fillet(diameter / 2.0)
+                ).val()
+        key = ('box_node',) + make_key(diameter, delta)
+    elif shape == 'sphere':
+        def builder():
+            return cq.Solid.makeSphere(diameter / 2.0, angleDegrees1 = -90, angleDegrees2 = 90)
+        key = ('sphere_node',) + make_key(diameter)
+    else:
+        raise TypeError(f'The node shape \'{shape}\' does not exist!')
+    return cache.get(key, builder)
+
+def node(diameter: float,
+    center = (0, 0, 0),
+    shape: str = 'box',
+    delta: float = 0.01,
+    cache: ShapeCache = PRIMITIVE_CACHE
+) -> cq.Solid:
+    """
+    Creates a node as a translated copy of the canonical node (see prototype_node).
+
+    :param diameter: diameter of the node
+    :param center: center of the node
+    :param shape: 'box' or 'sphere'
+    :param delta: the small coefficient added to the side of the box
+    :param cache: the ShapeCache that stores the prototypes
+    :return: a cq.Solid sharing its TShape with the prototype
+    """
+    return prototype_node(diameter, shape, delta, cache).moved(cq.Location(cq.Vector(center)))
+
+def strut(radius: float,
+    length: float,
+    rotation = (0, 0, 0),
+    offset = (0, 0, 0),
+    cache: ShapeCache = PRIMITIVE_CACHE
+) -> cq.Solid:
+    """
+    Creates a cylindrical strut as a moved copy of the canonical cylinder, so that building
+    a strut is a transformation instead of a sketch, face and prism.
+
+    The strut is placed as if it was made by
+    cq.Workplane().transformed(offset = offset, rotate = rotation).circle(radius).extrude(length)
+
+    :param radius: radius of the strut
+    :param length: length of the strut
+    :param rotation: angles (in degrees) about X, Y and Z
+    :param offset: the start point of the strut
+    :param cache: the ShapeCache that stores the prototypes
+    :return: a cq.Solid sharing its TShape with the prototype
+    """
+    return prototype_cylinder(radius, length, cache).moved(strut_location(rotation, offset))
+
+def segment_location(p1, p2) -> cq.Location:
+    """
+    Returns the location that maps the canonical strut (from the origin along +Z)
+    onto the segment p1-p2. The location does not scale, the strut length has to match
+    the segment length.
+
+    :param p1: start point (x, y, z)
+    :param p2: end point (x, y, z)
+    :return: a cq.Location
+    """
+    p1 = [float(c) for c in p1]
+    direction = gp_Vec(*(float(b) - a for a, b in zip(p1, p2)))
+    if direction.Z() >= 0:
+        rotation = gp_Quaternion(gp_Vec(0, 0, 1), direction)
+    else:
+        # the rotation between nearly opposite vectors is unstable, -Z is turned instead
+        rotation = gp_Quaternion(gp_Vec(0, 0, -1), direction).Multiplied(
+            gp_Quaternion(gp_Vec(1, 0, 0), pi))
+    trsf = gp_Trsf()
+    trsf.SetRotation(rotation)
+    trsf.SetTranslationPart(gp_Vec(*p1))
+    return cq.Location(trsf)
+
+def strut_between(p1,
+    p2,
+    radius: float,
+    radius2: float = None,
+    cache: ShapeCache = PRIMITIVE_CACHE
+) -> cq.Solid:
+    """
+    Creates a straight strut between two points as a placed copy of a canonical
+    cylinder or, if radius2 is given, a truncated cone.
+
+    :param p1: start point (x, y, z)
+    :param p2: end point (x, y, z)
+    :param radius: radius of the strut (at p1 for tapered struts)
+    :param radius2: radius at p2. None gives a cylinder
+    :param cache: the ShapeCache that stores the prototypes
+    :return: a cq.Solid
+    """
+    length = float(np.linalg.norm(np.subtract(p2, p1, dtype = float)))
+    if length == 0:
+        raise ValueError("The end points of the strut coincide")
+    if radius2 is None:
+        prototype = prototype_cylinder(radius, length, cache)
+    else:
+        prototype = prototype_cone(radius, radius2, length, cache)
+    return prototype.moved(segment_location(p1, p2))
+
+def arc_strut(radius: float,
+    center,
+    normal,
+    start,
+    angle: float,
+    cache: ShapeCache = PRIMITIVE_CACHE
+) -> cq.Solid:
+    """
+    Creates a curved strut along a circular arc as a placed copy of a canonical torus
+    segment (see prototype_arc).
+
+    :param radius: radius of the strut
+    :param center: center of the arc (x, y, z)
+    :param normal: axis of the arc, the arc goes counterclockwise about it
+    :param start: start point of the arc (x, y, z)
+    :param angle: angle of the arc (in degrees), 360 for a ring
+    :param cache: the ShapeCache that stores the prototypes
+    :return: a cq.Solid
+    """
+    center = np.asarray(center, dtype = float)
+    start = np.asarray(start, dtype = float) - center
+    trsf = gp_Trsf()
+    axes = gp_Ax3(gp_Pnt(*center.tolist()), gp_Dir(*np.asarray(normal, dtype = float).tolist()),
+                  gp_Dir(*start.tolist()))
+    trsf.SetTransformation(axes, gp_Ax3())
+    prototype = prototype_arc(radius, float(np.linalg.norm(start)), float(angle), cache)
+    return prototype.moved(cq.Location(trsf))
+
+def arc_between(p1,
+    middle,
+    p2,
+    radius: float,
+    cache: ShapeCache = PRIMITIVE_CACHE
+) -> cq.Solid:
+    """
+    Creates a curved strut along the circular arc from p1 through middle to p2 (see arc_strut).
+
+    :param p1: start point (x, y, z)
+    :param middle: a point of the arc between p1 and p2
+    :param p2: end point (x, y, z)
+    :param radius: radius of the strut
+    :param cache: the ShapeCache that stores the prototypes
+    :return: a cq.Solid
+    """
+    p1, middle, p2 = (np.asarray(p, dtype = float) for p in (p1, middle, p2))
+    a, b = p1 - middle, p2 - middle
+    # the points go counterclockwise about the normal of the triangle they make
+    normal = np.cross(b, a)
+    if np.linalg.norm(normal) == 0:
+        raise ValueError("The points of the arc are on a line")
+    center = middle + np.cross(a @ a * b - b @ b * a, np.cross(a, b)) / (2 * normal @ normal)
+    normal /= np.linalg.norm(normal)
+    start, end = p1 - center, p2 - center
+    angle = np.degrees(np.arctan2(np.cross(start, end) @ normal, start @ end)) % 360
+    return arc_strut(radius, center, normal, p1, angle, cache)
+
+def struts_between(endpoints,
+    radius,
+    radius2 = None,
+    cache: ShapeCache = PRIMITIVE_CACHE
+) -> list:
+    """
+    Creates straight struts for an array of segments.
+
+    :param endpoints: array-like of shape (N, 2, 3) with the start and end point of every strut
+    :param radius: a radius for all struts or an array of N radii (at the start points)
+    :param radius2: radii at the end points (scalar or N values). None gives cylinders
+    :param cache: the ShapeCache that stores the prototypes
+    :return: a list of N cq.Solid
+    """
+    endpoints = np.asarray(endpoints, dtype = float)
+    if endpoints.ndim != 3 or endpoints.shape[1:] != (2, 3):
+        raise ValueError(f"Expected an (N, 2, 3) array of end points, got {endpoints.shape}")
+    n = len(endpoints)
+    radius = np.broadcast_to(np.asarray(radius, dtype = float), (n,))
+    if radius2 is not None:
+        radius2 = np.broadcast_to(np.asarray(radius2, dtype = float), (n,))
+    return [strut_between(endpoints[i, 0], endpoints[i, 1], radius[i],
+                None if radius2 is None else radius2[i], cache)
+            for i in range(n)]
+
+def cached_face(name: str,
+    builder,
+    unit_cell_size: float,
+    cache: ShapeCache = FACE_CACHE
+) -> cq.Shape:
+    """
+    Returns a surface fitted by builder for the given unit cell size. The (expensive)
+    surface fit is done once per name and unit cell size.
+
+    The surface is fitted at its real size: a fit scaled from another size carries
+    scaled tolerances, and the mirrored octants of the TPMS cells then fail to fuse.
+
+    :param name: the cache key of the surface
+    :param builder: a function of the unit cell size that returns the surface
+    :param unit_cell_size: size of the unit cell
+    :param cache: the ShapeCache that stores the surfaces
+    :return: a cq.Face (or a compound of faces)
+    """
+    key = ('face', name) + make_key(unit_cell_size)
+    return cache.get(key, lambda: builder(unit_cell_size))
@@ -0,0 +1,201 @@
+import warnings
+
+import numpy as np
+
+from .mesh import marching_tetrahedra, mesh_writer
+
+# Beam lattices as signed distance fields. Every strut is a capsule (a cylinder with
+# spherical ends, which also makes the nodes), the struts are united by a (smooth)
+# minimum of their distances and the field is meshed with marching tetrahedra, so the cost
+# grows with the number of voxels near the struts instead of with boolean operations.
+
+# Triangles made by marching tetrahedra per voxel_size^2 of surface (measured on strut
+# lattices), used to choose the default voxel size from a triangle budget.
+TRIANGLES_PER_VOXEL_AREA = 9.0
+
+def segment_distance(points: np.ndarray,
+    start: np.ndarray,
+    end: np.ndarray,
+    radius1: np.ndarray,
+    radius2: np.ndarray
+) -> np.ndarray:
+    """
+    Signed distance from points to capsules with the radius changing linearly along the
+    segment (exact for constant radii, a close approximation for tapered ones).
+
+    :param points: an (..., 3) array broadcastable against the segments
+    :param start: an (..., 3) array of the start points of the segments
+    :param end: an (..., 3) array of the end points of the segments
+    :param radius1: radii at the start points
+    :param radius2: radii at the end points
+    :return: the distances, negative inside
+    """
+    axis = end - start
+    length2 = np.maximum(np.einsum('...i,...i->...', axis, axis), 1e-300)
+    t = np.clip(np.einsum('...i,...i->...', points - start, axis) / length2, 0, 1)
+    closest = start + t[..., None] * axis
+    return np.linalg.norm(points - closest, axis = -1) - (radius1 + t * (radius2 - radius1))
+
+def _block_pairs(lower: np.ndarray, upper: np.ndarray):
+    """
+    Enumerates the (segment, block) pairs of the blocks in the integer boxes
+    [lower, upper] of every segment.
+    """
+    dims = upper - lower + 1
+    counts = dims.prod(axis = 1)
+    segment = np.repeat(np.arange(len(dims)), counts)
+    local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    ny, nz = dims[segment, 1], dims[segment, 2]
+    offset = np.stack([local // (ny * nz), local // nz % ny, local % nz], axis = 1)
+    return segment, lower[segment] + offset
+
+def default_voxel_size(endpoints: np.ndarray,
+    radius1: np.ndarray,
+    radius2: np.ndarray,
+    max_triangles: int = 1000000
+) -> float:
+    """
+    Chooses the voxel size of beam_field: a third of the smallest radius, or the voxel size
+    that makes about max_triangles triangles if it is larger. The surface is estimated as
+    the sum of the areas of the capsules, which overestimates it where the struts overlap.
+
+    :param endpoints: an (N, 2, 3) array with the start and end point of every strut
+    :param radius1: the N radii at the start points
+    :param radius2: the N radii at the end points
+    :param max_triangles: the triangle budget
+    :return: the voxel size
+    """
+    length = np.linalg.norm(endpoints[:, 1] - endpoints[:, 0], axis = 1)
+    # lateral surface of the (truncated) cones and the spheres at their ends
+    area = (np.pi * (radius1 + radius2) * np.hypot(length, radius1 - radius2) +
+            2 * np.pi * (radius1 ** 2 + radius2 ** 2)).sum()
+    r_min = np.minimum(radius1, radius2).min()
+    voxel_size = max(r_min / 3.0, np.sqrt(TRIANGLES_PER_VOXEL_AREA * area / max_triangles))
+    if voxel_size > r_min:
+        warnings.warn(f'The voxel size {voxel_size:.3g} needed for {max_triangles} triangles is '
+                      f'larger than the smallest radius {r_min:.3g}, the thinnest struts '
+                      'may break up. Pass a voxel_size or a larger max_triangles')
+    return float(voxel_size)
+
+def beam_field(endpoints,
+    radius,
+    radius2 = None,
+    voxel_size: float = None,
+    smoothing: float = 0.0,
+    bounds = None,
+    block: int = 8,
+    batch: int = 4096,
+    max_triangles: int = 1000000
+):
+    """
+    Samples the signed distance field of a beam lattice on a regular grid.
+
+    The grid is split into blocks of block^3 samples, and a spatial hash of the blocks
+    lists the struts near every block. Each sample is then checked only against the
+    struts of its block instead of all struts.
+
+    The cost grows with the surface of the struts over voxel_size^2: the mesh has about
+    TRIANGLES_PER_VOXEL_AREA triangles per voxel_size^2 of surface, and the time and memory
+    of the sampling and meshing grow with it, so halving voxel_size makes about four times
+    as many triangles. By default voxel_size is a third of the smallest radius, coarsened
+    until the estimated mesh fits into max_triangles. A voxel larger than the smallest
+    radius cannot resolve the thinnest struts, which is warned about.
+
+    :param endpoints: an (N, 2, 3) array with the start and end point of every strut
+    :param radius: radius of the struts (scalar or N values), at the start points
+    :param radius2: radii at the end points (scalar or N values). None gives cylinders
+    :param voxel_size: distance between the samples, see above for the default
+    :param smoothing: radius of the smooth minimum that fillets the joints, 0 for a sharp union
+    :param bounds: (lower, upper) corners of a box the lattice is trimmed to. By default the
+        grid covers all struts
+    :param block: number of samples along a side of a block of the spatial hash
+    :param batch: number of (strut, block) pairs evaluated at once, which bounds the memory
+    :param max_triangles: the triangle budget of the default voxel_size
+    :return: the field (negative inside), the coordinates of its first sample and the spacing
+    """
+    endpoints = np.asarray(endpoints, dtype = float)
+    if endpoints.ndim != 3 or endpoints.shape[1:] != (2, 3):
+        raise ValueError(f"Expected an (N, 2, 3) array of end points, got {endpoints.shape}")
+    n = len(endpoints)
+    radius1 = np.broadcast_to(np.asarray(radius, dtype = float), (n,))
+    radius2 = radius1 if radius2 is None else np.broadcast_to(np.asarray(radius2, dtype = float), (n,))
+    r_max = np.maximum(radius1, radius2)
+    if voxel_size is None:
+        voxel_size = default_voxel_size(endpoints, radius1, radius2, max_triangles)
+    # Beyond this distance from the struts the field is not needed.
+    band = 2 * voxel_size + 4 * smoothing
+
+    if bounds is None:
+        lower = (endpoints.min(axis = 1) - r_max[:, None]).min(axis = 0)
+        upper = (endpoints.max(axis = 1) + r_max[:, None]).max(axis = 0)
+    else:
+        lower, upper = (np.asarray(b, dtype = float) for b in bounds)
+    # one sample outside the domain on every side
+    start = lower - voxel_size
+    counts = np.ceil((upper - lower) / voxel_size).astype(int) + 3
+    n_blocks = -(- counts // block)
+
+    # Spatial hash: the blocks overlapped by the bounding box of every strut.
+    reach = (r_max + band)[:, None]
+    box_lower = np.floor((endpoints.min(axis = 1) - reach - start) / (voxel_size * block)).astype(int)
+    box_upper = np.floor((endpoints.max(axis = 1) + reach - start) / (voxel_size * block)).astype(int)
+    box_lower = np.clip(box_lower, 0, n_blocks - 1)
+    box_upper = np.clip(box_upper, 0, n_blocks - 1)
+    segment, blocks = _block_pairs(box_lower, box_upper)
+    # Drop the blocks of the bounding box that are far from the strut itself.
+    half_diagonal = 0.5 * np.sqrt(3) * voxel_size * block
+    centers = start + (blocks + 0.5) * voxel_size * block - 0.5 * voxel_size
+    near = segment_distance(centers, endpoints[segment, 0], endpoints[segment, 1],
+                            radius1[segment], radius2[segment]) < band + half_diagonal
+    segment, blocks = segment[near], blocks[near]
+    block_ids = np.ravel_multi_index(tuple(blocks.T), tuple(n_blocks))
+
+    local = np.stack(np.meshgrid(*[np.arange(block)] * 3, indexing = 'ij'), axis = -1).reshape(-1, 3)
+    if smoothing > 0:
+        # smooth minimum: - k log(sum(exp(- d / k)))
+        field = np.zeros((np.prod(n_blocks), block ** 3))
+    else:
+        field = np.full((np.prod(n_blocks), block ** 3), band)
+    for first in range(0, len(segment), batch):
+        s = segment[first:first + batch]
+        points = start + (blocks[first:first + batch, None, :] * block + local[None]) * voxel_size
+        distance = segment_distance(points, endpoints[s, None, 0], endpoints[s, None, 1],
+                                    radius1[s, None], radius2[s, None])
+        if smoothing > 0:
+            np.add.at(field, block_ids[first:first + batch], np.exp(- distance / smoothing))
+        else:
+            np.minimum.at(field, block_ids[first:first + batch], distance)
+    if smoothing > 0:
+        with np.errstate(divide = 'ignore'):
+            field = np.minimum(- smoothing * np.log(field), band)
+
+    field = (field.reshape(*n_blocks, block, block, block)
+             .transpose(0, 3, 1, 4, 2, 5)
+             .reshape(*(n_blocks * block)))[:counts[0], :counts[1], :counts[2]]
+    if bounds is not None:
+        axes = [s + np.arange(c) * voxel_size for s, c in zip(start, counts)]
+        x, y, z = np.meshgrid(*axes, indexing = 'ij')
+        box = np.maximum.reduce([np.maximum(lo - c, c - up)
+                                 for c, lo, up in zip((x, y, z), lower, upper)])
+        field = np.maximum(field, box)
+    return field, start, voxel_size
+
+def beam_mesh(endpoints, radius, radius2 = None, **kwargs):
+    """
+    Meshes a beam lattice through its signed distance field (see beam_field for the
+    parameters).
+
+    :return: vertices (an (n, 3) array) and faces (an (m, 3) array) of a watertight mesh
+    """
+    field, start, spacing = beam_field(endpoints, radius, radius2, **kwargs)
+    return marching_tetrahedra(field, start, spacing, close = True)
+
+def beam_export(path: str, endpoints, radius, radius2 = None, **kwargs):
+    """
+    Meshes a beam lattice with beam_mesh and writes it to an STL or a 3MF file (chosen by
+    the extension of path).
+    """
+    vertices, faces = beam_mesh(endpoints, radius, radius2, **kwargs)
+    with mesh_writer(path) as writer:
+        writer.add(vertices, faces)
+    return vertices, faces
@@ -0,0 +1,207 @@
+import numpy as np
+from scipy.spatial import ConvexHull, QhullError
+
+from .mesh import mesh_writer
+
+# Strut lattices meshed directly: every strut is a faceted prism and every node a sphere or
+# the convex hull of the strut ends around it. The pieces overlap instead of being fused,
+# which slicers accept, and all of them are written into preallocated NumPy arrays.
+
+def _frames(axes: np.ndarray):
+    """
+    Unit vectors u, w perpendicular to every axis, so that (u, w, axis) is right handed.
+    """
+    d = axes / np.linalg.norm(axes, axis = 1)[:, None]
+    helper = np.zeros_like(d)
+    use_y = np.abs(d[:, 0]) > 0.9
+    helper[~use_y, 0] = 1
+    helper[use_y, 1] = 1
+    u = np.cross(d, helper)
+    u /= np.linalg.norm(u, axis = 1)[:, None]
+    return u, np.cross(d, u)
+
+def prism_faces(segments: int) -> np.ndarray:
+    """
+    Faces of a closed prism whose vertices are a ring of segments vertices at the start
+    followed by the same ring at the end, counterclockwise about the axis.
+
+    :param segments: number of sides of the prism
+    :return: a (4 * segments - 4, 3) array of vertex indices, outward oriented
+    """
+    i = np.arange(segments)
+    j = (i + 1) % segments
+    sides = np.concatenate([np.stack([i, j, j + segments], axis = 1),
+                            np.stack([i, j + segments, i + segments], axis = 1)])
+    k = np.arange(1, segments - 1)
+    bottom = np.stack([np.zeros_like(k), k + 1, k], axis = 1)
+    top = np.stack([np.full_like(k, segments), k + segments, k + 1 + segments], axis = 1)
+    return np.concatenate([sides, bottom, top])
+
+def strut_prisms(endpoints,
+    radius,
+    radius2 = None,
+    segments: int = 8
+):
+    """
+    Meshes struts as faceted prisms (frusta for tapered struts).
+
+    :param endpoints: an (N, 2, 3) array with the start and end point of every strut
+    :param radius: radius of the struts (scalar or N values), at the start points
+    :param radius2: radii at the end points (scalar or N values). None gives cylinders
+    :param segments: number of sides of the prisms
+    :return: vertices (an (N * 2 * segments, 3) array) and faces (an (N * (4 * segments - 4), 3) array)
+    """
+    endpoints = np.asarray(endpoints, dtype = float)
+    if endpoints.ndim != 3 or endpoints.shape[1:] != (2, 3):
+        raise ValueError(f"Expected an (N, 2, 3) array of end points, got {endpoints.shape}")
+    if segments < 3:
+        raise ValueError(f"A prism needs at least 3 sides, got {segments}")
+    n = len(endpoints)
+    radius1 = np.broadcast_to(np.asarray(radius, dtype = float), (n,))
+    radius2 = radius1 if radius2 is None else np.broadcast_to(np.asarray(radius2, dtype = float), (n,))
+    axes = endpoints[:, 1] - endpoints[:, 0]
+    if (np.linalg.norm(axes, axis = 1) == 0).any():
+        raise ValueError("The end points of a strut coincide")
+    u, w = _frames(axes)
+    angles = 2 * np.pi * np.arange(segments) / segments
+    # (N, segments, 3) unit radial directions
+    ring = np.cos(angles)[None, :, None] * u[:, None] + np.sin(angles)[None, :, None] * w[:, None]
+
+    vertices = np.empty((n, 2, segments, 3))
+    vertices[:, 0] = endpoints[:, None, 0] + radius1[:, None, None] * ring
+    vertices[:, 1] = endpoints[:, None, 1] + radius2[:, None, None] * ring
+    template = prism_faces(segments)
+    faces = template[None] + (2 * segments * np.arange(n))[:, None, None]
+    return vertices.reshape(-1, 3), faces.reshape(-1, 3)
+
+def sphere_template(segments: int = 8):
+    """
+    A unit UV sphere with segments meridians and segments // 2 parallels.
+
+    :return: vertices and outward oriented faces
+    """
+    n_lat = max(segments // 2, 2)
+    theta = np.pi * np.arange(1, n_lat) / n_lat
+    phi = 2 * np.pi * np.arange(segments) / segments
+    rings = np.stack([np.outer(np.sin(theta), np.cos(phi)),
+                      np.outer(np.sin(theta), np.sin(phi)),
+                      np.repeat(np.cos(theta)[:, None], segments, axis = 1)], axis = -1).reshape(-1, 3)
+    vertices = np.concatenate([[[0, 0, 1]], rings, [[0, 0, -1]]])
+    south = len(vertices) - 1
+    i = np.arange(segments)
+    j = (i + 1) % segments
+    faces = [np.stack([np.zeros(segments, dtype = int), 1 + i, 1 + j], axis = 1)]
+    for ring in range(n_lat - 2):
+        a = 1 + ring * segments
+        b = a + segments
+        faces.append(np.stack([a + i, b + i, b + j], axis = 1))
+        faces.append(np.stack([a + i, b + j, a + j], axis = 1))
+    last = 1 + (n_lat - 2) * segments
+    faces.append(np.stack([np.full(segments, south), last + j, last + i], axis = 1))
+    return vertices, np.concatenate(faces)
+
+def sphere_nodes(centers, radius, segments: int = 8):
+    """
+    Meshes nodes as UV spheres.
+
+    :param centers: an (M, 3) array of node centers
+    :param radius: radius of the nodes (scalar or M values)
+    :param segments: number of meridians of the spheres
+    :return: vertices and faces
+    """
+    centers = np.asarray(centers, dtype = float).reshape(-1, 3)
+    radius = np.broadcast_to(np.asarray(radius, dtype = float), (len(centers),))
+    template_vertices, template_faces = sphere_template(segments)
+    vertices = centers[:, None] + radius[:, None, None] * template_vertices[None]
+    faces = template_faces[None] + (len(template_vertices) * np.arange(len(centers)))[:, None, None]
+    return vertices.reshape(-1, 3), faces.reshape(-1, 3)
+
+def hull_nodes(centers, points, node_index, segments: int = 8):
+    """
+    Meshes nodes as the convex hulls of the points around them (e.g. the strut end rings).
+    A node whose points are flat (a single strut end) gets a sphere instead.
+
+    :param centers: an (M, 3) array of node centers
+    :param points: a (P, 3) array of points
+    :param node_index: the node of every point
+    :param segments: number of meridians of the fallback spheres
+    :return: vertices and faces
+    """
+    centers = np.asarray(centers, dtype = float).reshape(-1, 3)
+    order = np.argsort(node_index, kind = 'stable')
+    bounds = np.searchsorted(node_index[order], np.arange(len(centers) + 1))
+    vertices, faces, offset = [], [], 0
+    for node in range(len(centers)):
+        node_points = points[order[bounds[node]:bounds[node + 1]]]
+        try:
+            hull = ConvexHull(node_points)
+        except (QhullError, ValueError):
+            radius = np.linalg.norm(node_points - centers[node], axis = 1).max() if len(node_points) else 0
+            if radius == 0:
+                continue
+            node_vertices, node_faces = sphere_nodes(centers[node], radius, segments)
+        else:
+            node_vertices, node_faces = node_points, hull.simplices.copy()
+            # Qhull does not orient the simplices, its facet normals point outside.
+            a, b, c = (node_vertices[node_faces[:, i]] for i in range(3))
+            flip = np.einsum('ij,ij->i', np.cross(b - a, c - a), hull.equations[:, :3]) < 0
+            node_faces[flip] = node_faces[flip][:, ::-1]
+        vertices.append(node_vertices)
+        faces.append(node_faces + offset)
+        offset += len(node_vertices)
+    if not vertices:
+        return np.zeros((0, 3)), np.zeros((0, 3), dtype = int)
+    return np.concatenate(vertices), np.concatenate(faces)
+
+def strut_mesh(endpoints,
+    radius,
+    radius2 = None,
+    segments: int = 8,
+    node: str = 'sphere',
+    node_radius = None
+):
+    """
+    Meshes a strut lattice without B-rep: faceted struts and sphere or hull nodes.
+
+    :param endpoints: an (N, 2, 3) array with the start and end point of every strut
+    :param radius: radius of the struts (scalar or N values), at the start points
+    :param radius2: radii at the end points (scalar or N values). None gives cylinders
+    :param segments: number of sides of the struts
+    :param node: 'sphere', 'hull' (the convex hull of the strut ends around a node) or None
+    :param node_radius: radius of the sphere nodes (scalar or one value per node, in the order
+        of the unique end points). By default the largest radius of the struts of the node
+    :return: vertices (an (n, 3) array) and faces (an (m, 3) array)
+    """
+    endpoints = np.asarray(endpoints, dtype = float)
+    vertices, faces = strut_prisms(endpoints, radius, radius2, segments)
+    if node is None:
+        return vertices, faces
+    n = len(endpoints)
+    radius1 = np.broadcast_to(np.asarray(radius, dtype = float), (n,))
+    radius2 = radius1 if radius2 is None else np.broadcast_to(np.asarray(radius2, dtype = float), (n,))
+    centers, node_index = np.unique(np.round(endpoints.reshape(-1, 3), 9), axis = 0,
+                                    return_inverse = True)
+    node_index = node_index.ravel()
+    if node == 'sphere':
+        if node_radius is None:
+            node_radius = np.zeros(len(centers))
+            np.maximum.at(node_radius, node_index, np.stack([radius1, radius2], axis = 1).ravel())
+        node_vertices, node_faces = sphere_nodes(centers, node_radius, segments)
+    elif node == 'hull':
+        # ring vertices of strut i: start ring, then end ring (see strut_prisms)
+        ring_node = np.repeat(node_index, segments)
+        node_vertices, node_faces = hull_nodes(centers, vertices, ring_node, segments)
+    else:
+        raise TypeError(f'The node shape \'{node}\' does not exist!')
+    return (np.concatenate([vertices, node_vertices]),
+            np.concatenate([faces, node_faces + len(vertices)]))
+
+def strut_mesh_export(path: str, endpoints, radius, radius2 = None, **kwargs):
+    """
+    Meshes a strut lattice with strut_mesh and writes it to an STL or a 3MF file (chosen by
+    the extension of path).
+    """
+    vertices, faces = strut_mesh(endpoints, radius, radius2, **kwargs)
+    with mesh_writer(path) as writer:
+        writer.add(vertices, faces)
+    return vertices, faces
@@ -12,7 +12,11 @@
 # acknowledge and accept the above terms.
 ##############################################################################
 
-from ..commons import eachpointAdaptive
+from ..commons import eachpointAdaptive, deduplicated_lattice, union_all
+from ..cache import UNIT_CELL_CACHE, cached
+from ..graph import lattice_graph, segments_graph
+from ..grid import cell_origins, cell_params, graded_cells
+from ..primitives import node, strut
 
 from math import hypot, acos, degrees
 import numpy as np
@@ -52,13 +56,9 @@ def create_diagonal_strut(
 	"""
 	hypot2D = hypot(unit_cell_size, unit_cell_size)
 	hypot3D = hypot(hypot2D, unit_cell_size)
-	result = (
-		cq.Workplane()
-		.transformed(rotate = cq.Vector(angle_x, angle_y, 0))
-		.circle(radius)
-		.extrude(hypot3D)
-	)
-	return result.val().located(location)
+	result = strut(radius, hypot3D,
+		rotation = cq.Vector(angle_x, angle_y, 0))
+	return result.moved(location)
 
 def bcc_diagonals(
 		unit_cell_size: np.float64,
@@ -135,28 +135,23 @@ def bcc_vertical_struts(
 		result: cq.cq.Workplane
 			a solid model of the union of all vertical struts
 	"""
-	result = cq.Workplane("XY")
 	corner_points = unit_cell_size * np.array(
 		[(0, 0),
 		(1, 0),
 		(1, 1),
 		(0, 1)]
 	)
+	struts = []
 	for point in corner_points:
-		result = (result
-				  .union(
-					  cq.Workplane()
-					  .transformed(offset = cq.Vector(point[0], point[1]))
-					  .circle(strut_radius)
-					  .extrude(unit_cell_size)
-					  )
-				  )
-	return result
+		struts.append(
+			strut(strut_radius, unit_cell_size,
+				offset = cq.Vector(point[0], point[1]))
+			)
+	return union_all(struts)
 # Register our custom plugin before use.
 cq.Workplane.bcc_vertical_struts = bcc_vertical_struts
 
 def bcc_bottom_horizontal_struts(unit_cell_size, strut_radius):
-	result = cq.Workplane("XY")
 	angle = 90
 	corner_points = unit_cell_size * np.array(
 		[(0, 0),
@@ -164,23 +159,19 @@ def bcc_bottom_horizontal_struts(unit_cell_size, strut_radius):
 		(1, 1),
 		(0, 1)]
 	)
+	struts = []
 	for point in corner_points:
-		result = (result
-				  .union(
-					  cq.Workplane()
-					  .transformed(offset = cq.Vector(point[0], point[1], 0),
-								   rotate = cq.Vector(90, angle, 0))
-					  .circle(strut_radius)
-					  .extrude(unit_cell_size)
-					  )
-				  )
+		struts.append(
+			strut(strut_radius, unit_cell_size,
+				offset = cq.Vector(point[0], point[1], 0),
+				rotation = cq.Vector(90, angle, 0))
+			)
 		angle += 90
-	return result
+	return union_all(struts)
 # Register our custom plugin before use.
 cq.Workplane.bcc_bottom_horizontal_struts = bcc_bottom_horizontal_struts
 
 def bcc_top_horizontal_struts(unit_cell_size, strut_radius):
-	result = cq.Workplane("XY")
 	angle = 90
 	corner_points = unit_cell_size * np.array(
 		[(0, 0),
@@ -188,84 +179,132 @@ def bcc_top_horizontal_struts(unit_cell_size, strut_radius):
 		(1, 1),
 		(0, 1)]
 	)
+	struts = []
 	for point in corner_points:
-		result = (result
-				  .union(
-					  cq.Workplane()
-					  .transformed(offset = cq.Vector(point[0], point[1], unit_cell_size),
-								   rotate = cq.Vector(90, angle, 0))
-					  .circle(strut_radius)
-					  .extrude(unit_cell_size)
-					  )
-				  )
+		struts.append(
+			strut(strut_radius, unit_cell_size,
+				offset = cq.Vector(point[0], point[1], unit_cell_size),
+				rotation = cq.Vector(90, angle, 0))
+			)
 		angle += 90
-	return result
+	return union_all(struts)
 # Register our custom plugin before use.
 cq.Workplane.bcc_top_horizontal_struts = bcc_top_horizontal_struts
 
 # Creates 4 nodes at the XY plane of each unit cell
 def create_nodes(node_diameter,
 				unit_cell_size,
-				delta = 0.01 # a small coefficient is needed because CQ thinks that it cuts through emptiness
+				delta = 0.01, # a small coefficient is needed because CQ thinks that it cuts through emptiness
+				node_shape = 'box'
 				):
-	added_node_diameter = node_diameter + delta
-	node_radius = node_diameter / 2.0
-	result = cq.Workplane("XY")
 	corner_points = unit_cell_size * np.array(
 		[(0, 0),
 		(1, 0),
 		(1, 1),
 		(0, 1)]
 	)
-	for point in corner_points:
-		result= (result
-				  .union(
-					  cq.Workplane()
-					  .transformed(offset = cq.Vector(point[0], point[1], 0))
-					  .box(added_node_diameter, added_node_diameter, added_node_diameter)
-					  .edges("|Z")
-					  .fillet(node_radius)
-					  .edges("|X")
-					  .fillet(node_radius)
-					  )
-				  )
-		result= (result
-				  .union(
-					  cq.Workplane()
-					  .transformed(offset = cq.Vector(point[0], point[1], unit_cell_size))
-					  .box(added_node_diameter, added_node_diameter, added_node_diameter)
-					  .edges("|Z")
-					  .fillet(node_radius)
-					  .edges("|X")
-					  .fillet(node_radius)
-					  )
-				  )
 	half_unit_cell_size = unit_cell_size / 2
-	result= (result
-			 .union(
-				 cq.Workplane()
-				 .transformed(offset = cq.Vector(half_unit_cell_size,
-												 half_unit_cell_size,
-												 half_unit_cell_size))
-				 .box(added_node_diameter, added_node_diameter, added_node_diameter)
-				 .edges("|Z")
-				 .fillet(node_radius)
-				 .edges("|X")
-				 .fillet(node_radius)
-				 )
-			 )
-	return result
+	node_points = [(point[0], point[1], z)
+				   for point in corner_points
+				   for z in (0, unit_cell_size)]
+	node_points.append((half_unit_cell_size,
+						half_unit_cell_size,
+						half_unit_cell_size))
+	nodes = []
+	for point in node_points:
+		nodes.append(
+			node(node_diameter,
+				cq.Vector(point[0], point[1], point[2]),
+				node_shape,
+				delta)
+			)
+	return union_all(nodes)
 cq.Workplane.create_nodes = create_nodes
 
-def unit_cell(location, unit_cell_size, strut_radius, node_diameter, type):
-	result = cq.Workplane("XY")
-	result = result.union(bcc_diagonals(unit_cell_size, strut_radius))
+def unit_cell(location, unit_cell_size, strut_radius, node_diameter, type, node_shape = 'box'):
+	parts = [bcc_diagonals(unit_cell_size, strut_radius)]
 	if type == 'bccz':
-		result = result.union(bcc_vertical_struts(unit_cell_size, strut_radius))
-	result = result.union(create_nodes(node_diameter, unit_cell_size))
+		parts.append(bcc_vertical_struts(unit_cell_size, strut_radius))
+	parts.append(create_nodes(node_diameter, unit_cell_size, node_shape = node_shape))
+	result = union_all(parts)
 	return result.val().located(location)
 cq.Workplane.unit_cell = unit_cell
 
+def unit_cell_graph(unit_cell_size = 1.0, type = 'bcc'):
+	"""
+	Returns the unit cell of unit_cell as a graph: the 8 half diagonals from
+	the center node to the corners and, for 'bccz', the 4 vertical struts.
+
+	Parameters
+	----------
+		unit_cell_size : float
+			unit cell size (in mm)
+		type : str
+			the topology type, see bcc_heterogeneous_lattice
+	Returns
+	-------
+		nodes : np.ndarray
+			(M, 3) node coordinates
+		edges : np.ndarray
+			(E, 2) node indices of the struts
+	"""
+	corners = np.array([(x, y, z) for x in (0, 1) for y in (0, 1) for z in (0, 1)], dtype = float)
+	center = np.full(3, 0.5)
+	segments = [(center, corner) for corner in corners]
+	if type == 'bccz':
+		segments += [((x, y, 0), (x, y, 1)) for x in (0, 1) for y in (0, 1)]
+	return segments_graph(unit_cell_size * np.array(segments, dtype = float),
+						  unit_cell_size * np.vstack([corners, center]))
+
+def _graded_cells(Nx, Ny, Nz,
+				  min_strut_diameter,
+				  max_strut_diameter,
+				  min_node_diameter,
+				  max_node_diameter,
+				  topology,
+				  rule):
+	"""
+	Checks the topology and grades the cells of bcc_heterogeneous_lattice and
+	bcc_heterogeneous_graph (see grid.graded_cells).
+	"""
+	if topology not in ['bcc', 'bccz', 'sbcc', 'sbccz']:
+		raise TypeError(f'The type \'{topology}\' does not exist!')
+	return graded_cells(Nx, Ny, Nz, min_strut_diameter, max_strut_diameter,
+		min_node_diameter, max_node_diameter, rule)
+
+def bcc_heterogeneous_graph(unit_cell_size,
+							  min_strut_diameter,
+							  max_strut_diameter,
+							  min_node_diameter,
+							  max_node_diameter,
+							  Nx, Ny, Nz,
+							  topology = 'bcc',
+							  rule = 'linear'):
+	"""
+	Returns the lattice of bcc_heterogeneous_lattice as a graph, with the struts
+	and nodes shared by neighbouring cells merged (see graph.lattice_graph).
+	The graph is in the coordinates of the lattice, before position and rotation.
+
+	Parameters
+	----------
+		see bcc_heterogeneous_lattice
+	Returns
+	-------
+		nodes : np.ndarray
+			(M, 3) node coordinates
+		edges : np.ndarray
+			(E, 2) node indices of the struts
+		strut_radii : np.ndarray
+			radius of every strut
+		node_diameters : np.ndarray
+			diameter of every node
+	"""
+	indices, strut_radii, node_diameters = _graded_cells(Nx, Ny, Nz,
+		min_strut_diameter, max_strut_diameter, min_node_diameter, max_node_diameter, topology, rule)
+	return lattice_graph(unit_cell_graph(unit_cell_size, topology),
+		cell_origins(indices, unit_cell_size),
+		strut_radii, node_diameters)
+
 def bcc_heterogeneous_lattice(unit_cell_size,
 							  min_strut_diameter,
 							  max_strut_diameter,
@@ -275,49 +314,39 @@ def bcc_heterogeneous_lattice(unit_cell_size,
 							  topology = 'bcc',
 							  rule = 'linear',
 							  position = (0, 0, 0),
-							  rotation = (0, 0, 0)):
-	if topology not in ['bcc', 'bccz', 'sbcc', 'sbccz']:
-		raise TypeError(f'The type \'{topology}\' does not exist!')
-	min_strut_radius = min_strut_diameter / 2.0
-	max_strut_radius = max_strut_diameter / 2.0
-	if rule == 'linear':
-		strut_radii = np.linspace(min_strut_radius,
-	   		 					  max_strut_radius,
-		    					  Nz)
-		node_diameters = np.linspace(min_node_diameter,
-	    							 max_node_diameter,
-		    						 Nz)
-	if rule == 'sin':
-		average = lambda num1, num2: (num1 + num2) / 2
-		strut_radii = np.sin(
-			np.linspace(min_strut_radius, max_strut_radius, Nz)*12) + 2*average(min_strut_radius, max_strut_radius)
-		node_diameters = np.sin(
-			np.linspace(min_node_diameter, max_node_diameter, Nz)*12) + 2*average(min_node_diameter, max_node_diameter)
-	if rule == 'parabola':
-		x = np.linspace(0, 1, num=Nz)
-		frep = lambda d_min, d_max :-4*d_max*(x-0.5)*(x-0.5)+d_max+d_min
-		strut_radii = frep(min_strut_radius, max_strut_radius)
-		print(strut_radii)
-		node_diameters = frep(min_node_diameter, max_node_diameter)
-	UC_pnts = []
-	for i in range(Nx):
-		for j in range(Ny):
-			for k in range(Nz):
-				UC_pnts.append((i * unit_cell_size, j * unit_cell_size, k * unit_cell_size))
+							  rotation = (0, 0, 0),
+							  node_shape = 'box',
+							  cache = UNIT_CELL_CACHE,
+							  workers = None,
+							  instanced = False,
+							  deduplicate = False):
+	if deduplicate:
+		# every strut and node shared by neighbouring cells is built once
+		return deduplicated_lattice(bcc_heterogeneous_graph(unit_cell_size,
+				min_strut_diameter, max_strut_diameter,
+				min_node_diameter, max_node_diameter,
+				Nx, Ny, Nz, topology, rule),
+			cache, workers, instanced,
+			node_shape = node_shape,
+			position = position,
+			rotation = rotation)
+	indices, strut_radii, node_diameters = _graded_cells(Nx, Ny, Nz,
+		min_strut_diameter, max_strut_diameter, min_node_diameter, max_node_diameter, topology, rule)
 	print("Datapoints generated")
 	result = cq.Workplane().tag('base').transformed(
 		offset = cq.Vector(position[0], position[1], position[2]),
 		rotate = cq.Vector(rotation[0], rotation[1], rotation[2]))
-	result = result.pushPoints(UC_pnts)
-	unit_cell_params = []
-	for i in range(Nx * Ny):
-		for j in range(Nz):
-			unit_cell_params.append({"unit_cell_size": unit_cell_size,
-				"strut_radius": strut_radii[j],
-				"node_diameter": node_diameters[j],
-				"type": topology})
-	result = result.eachpointAdaptive(unit_cell,
+	result = result.pushPoints(cell_origins(indices, unit_cell_size).tolist())
+	unit_cell_params = cell_params(len(indices),
+		unit_cell_size = unit_cell_size,
+		strut_radius = strut_radii,
+		node_diameter = node_diameters,
+		type = topology,
+		node_shape = node_shape)
+	result = result.eachpointAdaptive(cached(unit_cell, cache),
 									  callback_extra_args = unit_cell_params,
-									  useLocalCoords = True)
+									  useLocalCoords = True,
+									  workers = workers,
+									  instanced = instanced)
 	print("The lattice is generated")
 	return result
\ No newline at end of file
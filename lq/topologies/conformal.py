@@ -1,64 +1,536 @@
+import numpy as np
+
 import cadquery as cq
 
+from ..commons import fuse_shapes, instanced_compound, union_all
+from ..graph import tile_cell_graphs
+from ..grid import cell_indices
+from ..primitives import arc_between, node, prototype_node, segment_location, struts_between
+from .cubic import unit_cell_graph as cubic_cell_graph
+
+# Conformal lattices: a grid of unit cells in parametric coordinates (e.g. radius, angle
+# and height) is mapped into space. The strut graph of the whole grid is built once in
+# parametric coordinates and mapped; the struts that become curves are built as arcs or
+# as chains of straight pieces, and everything is fused (or meshed) in one pass.
+
+# diameter of the spheres where the struts of a node end, in radii of its thickest strut
+JOINT_SCALE = 3.0
+
+def cylindrical_map(points) -> np.ndarray:
+    """
+    Maps cylindrical coordinates (r, theta in degrees, z) to Cartesian ones, about Z.
+    """
+    r, theta, z = np.asarray(points, dtype = float).T
+    theta = np.radians(theta)
+    return np.stack([r * np.cos(theta), r * np.sin(theta), z], axis = -1)
+
+def spherical_map(points) -> np.ndarray:
+    """
+    Maps spherical coordinates (r, polar angle theta from +Z and azimuth phi, in degrees)
+    to Cartesian ones.
+    """
+    r, theta, phi = np.asarray(points, dtype = float).T
+    theta, phi = np.radians(theta), np.radians(phi)
+    return np.stack([r * np.sin(theta) * np.cos(phi),
+                     r * np.sin(theta) * np.sin(phi),
+                     r * np.cos(theta)], axis = -1)
+
+def toroidal_map(points, major_radius: float) -> np.ndarray:
+    """
+    Maps toroidal coordinates (distance r from the center circle of radius major_radius,
+    poloidal angle theta and toroidal angle phi, in degrees) to Cartesian ones, about Z.
+    """
+    r, theta, phi = np.asarray(points, dtype = float).T
+    theta, phi = np.radians(theta), np.radians(phi)
+    ring = major_radius + r * np.cos(theta)
+    return np.stack([ring * np.cos(phi), ring * np.sin(phi), r * np.sin(theta)], axis = -1)
+
+def _mapping(mapping, major_radius):
+    """
+    The map of a name (or a function of an (N, 3) array of parametric points).
+    """
+    if callable(mapping):
+        return mapping
+    if mapping == 'cylindrical':
+        return cylindrical_map
+    if mapping == 'spherical':
+        return spherical_map
+    if mapping == 'toroidal':
+        if major_radius is None:
+            raise ValueError("The toroidal map needs a major radius")
+        return lambda points: toroidal_map(points, major_radius)
+    raise TypeError(f'The map \'{mapping}\' does not exist!')
+
+def _values(value, points, cells, cell_index):
+    """
+    A value (e.g. a radius) of every edge or node: a number, one value per cell or a function
+    of the parametric points.
+    """
+    if callable(value):
+        return np.broadcast_to(np.asarray(value(points), dtype = float), (len(points),))
+    return np.broadcast_to(np.asarray(value, dtype = float), (cells,))[cell_index]
+
+def parametric_graph(cells,
+    lower,
+    upper,
+    strut_radius,
+    node_diameter = None,
+    mapping = 'cylindrical',
+    cell_graph = None,
+    major_radius: float = None,
+    decimals: int = 9
+):
+    """
+    The strut graph of a grid of unit cells in parametric coordinates, merged where the map
+    joins it (e.g. the struts shared by neighbouring cells, at 0 and 360 degrees or at the
+    poles of a sphere).
+
+    :param cells: number of cells along the three parametric coordinates
+    :param lower: lower corner of the grid in parametric coordinates
+    :param upper: upper corner of the grid in parametric coordinates
+    :param strut_radius: radius of the struts: a number, one value per cell (the largest of
+        the cells of a shared strut is kept) or a function of the parametric midpoints of the
+        struts (an (E, 3) array)
+    :param node_diameter: diameter of the nodes, like strut_radius (a function of the
+        parametric nodes), or None for no nodes
+    :param mapping: 'cylindrical', 'spherical', 'toroidal' or a function mapping an (N, 3)
+        array of parametric points into space
+    :param cell_graph: the unit cell graph in a cell of size 1 (nodes, edges), by default
+        the cubic cell (see cubic.unit_cell_graph)
+    :param major_radius: major radius of the toroidal map
+    :param decimals: precision of the node coordinates
+    :return: the parametric nodes (an (M, 3) array), the edges (an (E, 2) array), the
+        parametric end points of every edge (an (E, 2, 3) array, they differ from the nodes
+        where the map wraps around), the radius of every edge and the diameter of every node
+        (or None)
+    """
+    mapping = _mapping(mapping, major_radius)
+    lower = np.asarray(lower, dtype = float)
+    upper = np.asarray(upper, dtype = float)
+    counts = np.broadcast_to(np.asarray(cells, dtype = int), (3,))
+    size = (upper - lower) / counts
+    cell_nodes, cell_edges = cubic_cell_graph(1.0) if cell_graph is None else cell_graph
+    origins = lower + cell_indices(*counts) * size
+    nodes, edges, edge_cell, node_cell = tile_cell_graphs(
+        (np.asarray(cell_nodes, dtype = float) * size, cell_edges), origins)
+    radius = _values(strut_radius, nodes[edges].mean(axis = 1), len(origins), edge_cell)
+    if node_diameter is not None:
+        node_diameter = _values(node_diameter, nodes, len(origins), node_cell)
+
+    # merge the nodes that are mapped to the same point, keeping a parametric one
+    _, first, node_index = np.unique(np.round(mapping(nodes), decimals) + 0.0, axis = 0,
+                                     return_index = True, return_inverse = True)
+    node_index = node_index.ravel()
+    parametric = nodes[edges]
+    edges = node_index[edges]
+    # the struts keep their parametric direction, a strut is shared if it joins the same nodes
+    _, edge_first, edge_index = np.unique(np.sort(edges, axis = 1), axis = 0,
+                                          return_index = True, return_inverse = True)
+    edge_index = edge_index.ravel()
+    merged_radius = np.full(len(edge_first), - np.inf)
+    np.maximum.at(merged_radius, edge_index, radius)
+    merged_edges = edges[edge_first]
+    segments = parametric[edge_first]
+    kept = merged_edges[:, 0] != merged_edges[:, 1]
+    if node_diameter is not None:
+        merged_diameter = np.full(len(first), - np.inf)
+        np.maximum.at(merged_diameter, node_index, node_diameter)
+        node_diameter = merged_diameter
+    return nodes[first], merged_edges[kept], segments[kept], merged_radius[kept], node_diameter
+
+def _edge_curves(segments, mapping, tolerance):
+    """
+    Samples the mapped struts at t = 0, 1/4, 1/2, 3/4 and 1 and classifies them: straight
+    if the samples are within tolerance of the chord, an arc if they are within tolerance of
+    the circle through the start, the middle and the end, a general curve otherwise.
+
+    :return: the (E, 5, 3) samples, the mask of the straight and of the arc struts
+    """
+    t = np.linspace(0, 1, 5)
+    start, end = segments[:, 0], segments[:, 1]
+    parametric = start[:, None] + t[None, :, None] * (end - start)[:, None]
+    samples = mapping(parametric.reshape(-1, 3)).reshape(-1, 5, 3)
+    chord = samples[:, 4] - samples[:, 0]
+    chord_length = np.linalg.norm(chord, axis = 1)
+    offsets = samples[:, 1:4] - samples[:, None, 0]
+    along = np.einsum('ijk,ik->ij', offsets, chord) / chord_length[:, None] ** 2
+    deviation = np.linalg.norm(offsets - along[..., None] * chord[:, None], axis = 2).max(axis = 1)
+    straight = deviation < tolerance
+
+    center, normal = _circles(samples[:, 0], samples[:, 2], samples[:, 4])
+    arc_radius = np.linalg.norm(samples[:, 0] - center, axis = 1)
+    quarters = samples[:, [1, 3]] - center[:, None]
+    off_plane = np.abs(np.einsum('ijk,ik->ij', quarters, normal))
+    off_circle = np.abs(np.linalg.norm(quarters, axis = 2) - arc_radius[:, None])
+    arc = ~straight & (np.maximum(off_plane, off_circle).max(axis = 1) < tolerance)
+    return samples, straight, arc, deviation
+
+def _circles(start, middle, end):
+    """
+    Centers and unit normals of the circles through three points (see
+    primitives.arc_between), the points go counterclockwise about the normals. Points on a
+    line give NaN.
+    """
+    a, b = start - middle, end - middle
+    normal = np.cross(b, a)
+    area2 = np.einsum('ij,ij->i', normal, normal)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        center = middle + np.cross(np.einsum('ij,ij->i', a, a)[:, None] * b -
+                                   np.einsum('ij,ij->i', b, b)[:, None] * a,
+                                   - normal) / (2 * area2[:, None])
+        return center, normal / np.sqrt(area2)[:, None]
+
+def _joints(edges, radius, diameter, count):
+    """
+    Radius of the sphere of every node where struts meet (0 at the free ends of the struts):
+    JOINT_SCALE / 2 times the radius of its thickest strut, or the radius of the node if it
+    is larger.
+    """
+    joint = np.zeros(count)
+    np.maximum.at(joint, edges.ravel(), np.repeat(JOINT_SCALE / 2 * radius, 2))
+    if diameter is not None:
+        joint = np.maximum(joint, diameter / 2)
+    joint[np.bincount(edges.ravel(), minlength = count) < 2] = 0
+    return joint
+
+def _directions(count: int) -> np.ndarray:
+    """
+    Nearly uniform unit vectors of the upper half space (a Fibonacci lattice).
+    """
+    z = (np.arange(count) + 0.5) / count
+    phi = np.pi * (3 - np.sqrt(5)) * np.arange(count)
+    ring = np.sqrt(1 - z ** 2)
+    return np.stack([ring * np.cos(phi), ring * np.sin(phi), z], axis = 1)
+
+def _poles(centers, edges, ends, radius, joint, candidates: int = 64):
+    """
+    Axes of the joint spheres, with the poles as far as possible from the circles where the
+    struts of the joint leave the sphere (OCC fuses badly where a pole of a sphere is on an
+    intersection curve).
+
+    :param centers: the mapped nodes
+    :param ends: the mapped (trimmed) end points of the struts (an (E, 2, 3) array)
+    :return: a unit vector for every node
+    """
+    owner = edges.T.ravel()
+    direction = ends.transpose(1, 0, 2).reshape(-1, 3) - centers[owner]
+    # the free ends of the struts (no joint) are not trimmed, they give NaN
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        direction /= np.linalg.norm(direction, axis = 1)[:, None]
+        # angle between a strut and the circle where it leaves the sphere
+        width = np.arcsin(np.clip(np.tile(radius, 2) / joint[owner], 0, 1))
+    axes = _directions(candidates)
+    angle = np.arccos(np.clip(direction @ axes.T, -1, 1))
+    clearance = np.minimum(np.abs(angle - width[:, None]), np.abs(np.pi - angle - width[:, None]))
+    score = np.full((len(centers), candidates), np.inf)
+    np.minimum.at(score, owner, clearance)
+    return axes[np.argmax(score, axis = 1)]
+
+def _trim(segments, length, edges, radius, joint):
+    """
+    Shortens the parametric struts at the joints: a strut ends halfway between its radius
+    (where it clears the perpendicular struts) and the sphere of the joint, so that its end
+    stays inside the sphere.
+    """
+    outer = joint[edges]
+    inner = radius[:, None]
+    cut = np.where(outer > 0, (inner + np.sqrt(np.maximum(outer ** 2 - inner ** 2, 0))) / 2, 0)
+    t = np.minimum(cut / length[:, None], 0.4)
+    start, end = segments[:, 0], segments[:, 1]
+    return np.stack([start + t[:, :1] * (end - start), end - t[:, 1:] * (end - start)], axis = 1)
+
+def _subdivide(segments, mapping, deviation, tolerance):
+    """
+    Splits the struts into straight pieces along their mapped curves, more pieces for a
+    larger deviation from the chord (it shrinks with the square of the number of pieces).
+
+    :return: the mapped points of the pieces (an (P, 2, 3) array) and the strut of every piece
+    """
+    pieces = np.maximum(np.ceil(np.sqrt(deviation / tolerance)), 1).astype(int)
+    strut = np.repeat(np.arange(len(segments)), pieces)
+    local = np.arange(pieces.sum()) - np.repeat(np.cumsum(pieces) - pieces, pieces)
+    t = np.stack([local, local + 1], axis = 1) / pieces[strut, None]
+    start, end = segments[strut, 0], segments[strut, 1]
+    parametric = start[:, None] + t[..., None] * (end - start)[:, None]
+    return mapping(parametric.reshape(-1, 3)).reshape(-1, 2, 3), strut
+
+def conformal_graph(cells,
+    lower,
+    upper,
+    strut_radius,
+    node_diameter = None,
+    mapping = 'cylindrical',
+    cell_graph = None,
+    major_radius: float = None,
+    tolerance: float = None,
+    decimals: int = 9
+):
+    """
+    The strut graph of a conformal lattice in space, with the curved struts split into
+    straight pieces, e.g. for the mesh engines (strut_mesh.strut_mesh, sdf.beam_mesh), the
+    3MF beam lattice writer or commons.graph_lattice. See parametric_graph for the
+    parameters.
+
+    :param tolerance: the largest distance between a strut and its mapped curve, by default
+        a tenth of the thinnest strut
+    :return: nodes, edges, the radius of every edge and the diameter of every node. The joints
+        inside curved struts get the diameter of their strut, the nodes of the lattice get
+        node_diameter (0 if it is None)
+    """
+    nodes, edges, segments, radius, diameter = parametric_graph(
+        cells, lower, upper, strut_radius, node_diameter, mapping, cell_graph, major_radius,
+        decimals)
+    mapping = _mapping(mapping, major_radius)
+    if tolerance is None:
+        tolerance = 0.1 * radius.min()
+    _, straight, _, deviation = _edge_curves(segments, mapping, tolerance)
+    deviation[straight] = 0
+    pieces, strut = _subdivide(segments, mapping, deviation, tolerance)
+    if diameter is None:
+        diameter = np.zeros(len(nodes))
+    # the lattice nodes first, then the joints (the ends of the pieces that are not nodes)
+    points = np.concatenate([mapping(nodes), pieces.reshape(-1, 3)])
+    values = np.concatenate([diameter, np.repeat(2 * radius[strut], 2)])
+    unique_points, index = np.unique(np.round(points, decimals) + 0.0, axis = 0,
+                                     return_inverse = True)
+    index = index.ravel()
+    node_values = np.full(len(unique_points), - np.inf)
+    is_node = np.zeros(len(unique_points), dtype = bool)
+    is_node[index[:len(nodes)]] = True
+    np.maximum.at(node_values, index[len(nodes):], values[len(nodes):])
+    # a lattice node keeps its own diameter
+    node_values[index[:len(nodes)]] = diameter
+    piece_edges = index[len(nodes):].reshape(-1, 2)
+    kept = piece_edges[:, 0] != piece_edges[:, 1]
+    return unique_points, piece_edges[kept], radius[strut][kept], node_values
+
+def _lattice_shapes(nodes, edges, segments, radius, diameter, mapping, tolerance, node_shape,
+    edge_mask = None,
+    node_mask = None
+):
+    """
+    The solids of the struts and the nodes of a mapped graph (see conformal_lattice), only
+    for the edges and the nodes of the masks if they are given. The joints are computed
+    from the whole graph, so that the solids of a part match those of its neighbours.
+    """
+    samples, straight, arc, _ = _edge_curves(segments, mapping, tolerance)
+    length = np.linalg.norm(np.diff(samples, axis = 1), axis = 2).sum(axis = 1)
+    joint = _joints(edges, radius, diameter, len(nodes))
+    segments = _trim(segments, length, edges, radius, joint)
+    samples, _, _, deviation = _edge_curves(segments, mapping, tolerance)
+    centers = mapping(nodes)
+    poles = _poles(centers, edges, samples[:, [0, 4]], radius, joint)
+    if edge_mask is None:
+        edge_mask = np.ones(len(edges), dtype = bool)
+    if node_mask is None:
+        node_mask = np.ones(len(nodes), dtype = bool)
+    curved = ~straight & ~arc & edge_mask
+    straight, arc = straight & edge_mask, arc & edge_mask
+    if diameter is None:
+        diameter = np.zeros(len(nodes))
+
+    shapes = struts_between(samples[straight][:, [0, 4]], radius[straight])
+    shapes += [arc_between(p1, middle, p2, r) for p1, middle, p2, r in
+               zip(samples[arc, 0], samples[arc, 2], samples[arc, 4], radius[arc])]
+    pieces, strut = _subdivide(segments[curved], mapping, deviation[curved], tolerance)
+    shapes += struts_between(pieces, radius[curved][strut])
+    # spherical joints between the pieces of a strut, with the poles inside the pieces
+    inner = strut[1:] == strut[:-1]
+    shapes += [prototype_node(2 * r, 'sphere').moved(segment_location(p1, p2)) for p1, p2, r in
+               zip(pieces[1:, 0][inner], pieces[1:, 1][inner], radius[curved][strut[1:]][inner])]
+    # a joint is a node if the node is large enough, a sphere otherwise
+    for p, pole, d, r in zip(centers[node_mask], poles[node_mask], diameter[node_mask],
+                             joint[node_mask]):
+        if r > 0 and (d < 2 * r or node_shape == 'sphere'):
+            shapes.append(prototype_node(2 * r, 'sphere').moved(segment_location(p, p + pole)))
+        elif d > 0:
+            shapes.append(node(d, tuple(p), node_shape))
+    return shapes
+
+def _same_in_sectors(values, points, coordinate: int, start: float, angle: float,
+                     decimals: int) -> bool:
+    """
+    Whether values (e.g. the radii of the struts at their parametric midpoints) are the same
+    in every sector: the points are matched by their periodic coordinate modulo angle.
+    """
+    keys = np.array(points, dtype = float)
+    offset = np.round((keys[:, coordinate] - start) % angle, decimals)
+    keys[:, coordinate] = np.where(np.isclose(offset, angle, rtol = 0, atol = 10.0 ** - decimals),
+                                   0, offset)
+    _, index = np.unique(np.round(keys, decimals) + 0.0, axis = 0, return_inverse = True)
+    index = index.ravel()
+    low = np.full(index.max(initial = -1) + 1, np.inf)
+    high = np.full(len(low), - np.inf)
+    np.minimum.at(low, index, values)
+    np.maximum.at(high, index, values)
+    return np.allclose(low, high, rtol = 0, atol = 10.0 ** - decimals)
+
+def _fused_sectors(sector, count: int, axis, angle: float) -> cq.Shape:
+    """
+    Fuses count copies of a sector turned by angle (in degrees) about axis: blocks of 1, 2,
+    4, ... sectors are fused with a turned copy of themselves, and the blocks of the binary
+    digits of count are fused at the end.
+    """
+    def turned(shape, sectors):
+        return shape.moved(cq.Location(cq.Vector(0, 0, 0), cq.Vector(*axis), sectors * angle))
+
+    blocks = [sector]
+    while 2 ** len(blocks) <= count:
+        blocks.append(blocks[-1].fuse(turned(blocks[-1], 2 ** (len(blocks) - 1))))
+    result, done = None, 0
+    for k in reversed(range(len(blocks))):
+        if count & 2 ** k:
+            block = turned(blocks[k], done)
+            result = block if result is None else result.fuse(block)
+            done += 2 ** k
+    return result
+
+def conformal_lattice(cells,
+    lower,
+    upper,
+    strut_radius,
+    node_diameter = None,
+    mapping = 'cylindrical',
+    cell_graph = None,
+    major_radius: float = None,
+    tolerance: float = None,
+    node_shape: str = 'sphere',
+    fuse: bool = True,
+    strategy: str = 'single',
+    sectors: str = None,
+    periodic_coordinate: int = None,
+    periodic_axis = None,
+    decimals: int = 9
+) -> cq.cq.Workplane:
+    """
+    Builds a conformal lattice from its graph (see parametric_graph for the parameters):
+    the struts that stay straight as cylinders, those mapped to circular arcs (e.g. along
+    the angles of the cylindrical, spherical and toroidal maps) as torus segments and the
+    other ones as chains of cylinders with spherical joints. All solids are fused in one
+    pass.
+
+    The struts of a node end inside a sphere of JOINT_SCALE times the radius of its thickest
+    strut (or inside the node if node_diameter is larger) instead of crossing: OCC does not
+    fuse crossing struts of the same radius, their intersection curves touch.
+
+    A lattice that goes all around an axis (e.g. 360 degrees of the cylindrical map) with
+    radii that do not depend on the angle is made of identical sectors, one cell wide. With
+    sectors, only the first sector is built and the other ones are turned copies of it; radii
+    or diameters that differ between the sectors raise a ValueError.
+
+    :param tolerance: the largest distance between a strut and its mapped curve, by default
+        a tenth of the thinnest strut
+    :param node_shape: 'box' or 'sphere'
+    :param fuse: fuse the struts and nodes into one solid, otherwise they are left on the stack
+    :param strategy: 'single' or 'tree', see commons.fuse_shapes
+    :param sectors: None builds every cell. 'instanced' puts the turned copies of the sector
+        (fused if fuse is True) in a compound that shares their geometry (see
+        commons.instanced_compound), 'fused' fuses them as well, doubling the fused block of
+        sectors at every step
+    :param periodic_coordinate: the parametric coordinate of the angle (in degrees), 1 for
+        the cylindrical map and 2 for the spherical and toroidal ones by default
+    :param periodic_axis: the axis (through the origin) the angle turns about, Z for the
+        maps above by default
+    :return: a Workplane with the lattice (or its struts and nodes) on its stack
+    """
+    nodes, edges, segments, radius, diameter = parametric_graph(
+        cells, lower, upper, strut_radius, node_diameter, mapping, cell_graph, major_radius,
+        decimals)
+    name = mapping
+    mapping = _mapping(mapping, major_radius)
+    if tolerance is None:
+        tolerance = 0.1 * radius.min()
+    if sectors is None:
+        shapes = _lattice_shapes(nodes, edges, segments, radius, diameter, mapping, tolerance,
+                                 node_shape)
+        if fuse:
+            return union_all(shapes, strategy)
+        return cq.Workplane("XY").newObject(shapes)
+
+    if sectors not in ('instanced', 'fused'):
+        raise ValueError(f"Sectors '{sectors}' do not exist.")
+    if sectors == 'fused' and not fuse:
+        raise ValueError("Fused sectors need fuse = True")
+    if periodic_coordinate is None or periodic_axis is None:
+        if callable(name):
+            raise ValueError("The periodic coordinate and axis of a custom map are needed")
+        periodic_coordinate = 1 if name == 'cylindrical' else 2
+        periodic_axis = (0, 0, 1)
+    start = np.asarray(lower, dtype = float)[periodic_coordinate]
+    count = np.broadcast_to(np.asarray(cells, dtype = int), (3,))[periodic_coordinate]
+    if not np.isclose(np.asarray(upper, dtype = float)[periodic_coordinate] - start, 360):
+        raise ValueError("Sectors need a lattice that goes all around (360 degrees)")
+    angle = 360 / count
+    axis = np.asarray(periodic_axis, dtype = float)
+    axis /= np.linalg.norm(axis)
+
+    def sector(points):
+        return np.floor((points[..., periodic_coordinate] - start) / angle + 1e-6) % count
+
+    # the nodes and struts on the axis (e.g. at the poles of a sphere) are in every sector,
+    # they are built once
+    centers = mapping(nodes)
+    on_axis = np.linalg.norm(centers - np.outer(centers @ axis, axis), axis = 1) < 10.0 ** - decimals
+    along_axis = on_axis[edges].all(axis = 1)
+    if not (_same_in_sectors(radius[~along_axis], segments[~along_axis].mean(axis = 1),
+                             periodic_coordinate, start, angle, decimals)
+            and (diameter is None or _same_in_sectors(diameter[~on_axis], nodes[~on_axis],
+                                                      periodic_coordinate, start, angle, decimals))):
+        raise ValueError("Sectors need radii and diameters that do not depend on the angle")
+    owned = ((sector(segments.mean(axis = 1)) == 0) & ~along_axis, (sector(nodes) == 0) & ~on_axis)
+    shapes = _lattice_shapes(nodes, edges, segments, radius, diameter, mapping, tolerance,
+                             node_shape, *owned)
+    shared = _lattice_shapes(nodes, edges, segments, radius, diameter, mapping, tolerance,
+                             node_shape, along_axis, on_axis)
+    if fuse:
+        shapes = [fuse_shapes(shapes, strategy).clean()]
+    if sectors == 'fused':
+        result = _fused_sectors(shapes[0], count, axis, angle)
+        if shared:
+            result = fuse_shapes([result] + shared)
+        return cq.Workplane("XY").newObject([result.clean()])
+    turned = [shape.moved(cq.Location(cq.Vector(0, 0, 0), cq.Vector(*axis), k * angle))
+              for k in range(count) for shape in shapes]
+    return cq.Workplane("XY").newObject([instanced_compound(turned + shared)])
+
 def cylinder(z_uc, angle_uc_size, z_uz_size, r_uz_size,
+             min_thickness, max_thickness,
+             inner_radius, outer_radius,
+             fuse = True,
+             sectors = None):
+    """
+    A cylindrical lattice about the Y axis: rings (arcs) at every radius and height, radial
+    struts between the rings at every angle and axial struts along the height. The radius
+    of the struts grows linearly from min_thickness at the inner radius to max_thickness at
+    the outer one.
 
-                       min_thickness, max_thickness,
-                       inner_radius, outer_radius):
-    r_uc = (outer_radius - inner_radius) / r_uz_size
+    :param z_uc: number of cells along the height
+    :param angle_uc_size: angle of a cell (in degrees)
+    :param z_uz_size: height of a cell
+    :param r_uz_size: radial size of a cell
+    :param min_thickness: radius of the innermost struts
+    :param max_thickness: radius of the outermost struts
+    :param inner_radius: inner radius of the cylinder
+    :param outer_radius: outer radius of the cylinder
+    :param fuse: fuse the struts into one solid, otherwise they are left on the stack
+    :param sectors: None, 'instanced' or 'fused' to build a single sector of angle_uc_size
+        degrees and turn copies of it, see conformal_lattice
+    :return: a Workplane with the lattice
+    """
+    r_uc = round((outer_radius - inner_radius) / r_uz_size)
     delta_thickness = (max_thickness - min_thickness) / r_uc
-    
-    t = min_thickness
-    arcs = cq.Workplane()
-    
-    for r in range(inner_radius, outer_radius + 1, r_uz_size):
-        for z in range(z_uc + 1):
-            arcs = arcs.union(
-                cq.Workplane()
-                .transformed(offset = cq.Vector(r,
-                                                z * z_uz_size,
-                                                0))
-                .circle(t)
-                .revolve(360,
-                         [-r, 0, 0],
-                         [-r, 1, 0])
-                )
-    
-        t += delta_thickness
-    
-    t = min_thickness
-    radials = cq.Workplane()
-    for r in range(inner_radius, outer_radius, r_uz_size):
-        for z in range(z_uc + 1):
-            for phi in range(0, 360, angle_uc_size):
-                radials = radials.union(cq.Workplane()
-                            .transformed(rotate = cq.Vector(0,
-                                                            phi,
-                                                            0))
-                            .transformed(offset = cq.Vector(0,
-                                                            z * z_uz_size,
-                                                            r))
-                            .circle(t)
-                            .extrude(r_uz_size)
-                            )
-        t += delta_thickness
-    
-    
-    t = min_thickness
-    axials = cq.Workplane()
-    for r in range(inner_radius, outer_radius + 1, r_uz_size):
-        for phi in range(0, 360, angle_uc_size):
-            axials = axials.union(cq.Workplane()
-                                  .transformed(rotate = cq.Vector(0,
-                                                                  phi,
-                                                                  0))
-                                  .transformed(offset = cq.Vector(0,
-                                                                  0,
-                                                                  r))
-                                  .transformed(rotate = cq.Vector(- 90,
-                                                                  0,
-                                                                  0))
-                                  .circle(t)
-                                  .extrude(z_uc * z_uz_size)
-                                  )
-        t += delta_thickness
-    return arcs, radials, axials
\ No newline at end of file
+
+    def thickness(points):
+        # the struts of a layer and the ring at its inner radius share a thickness
+        layer = np.floor((points[:, 0] - inner_radius) / r_uz_size + 1e-9)
+        return min_thickness + layer * delta_thickness
+
+    return conformal_lattice((r_uc, round(360 / angle_uc_size), z_uc),
+                             (inner_radius, 0, 0),
+                             (outer_radius, 360, z_uc * z_uz_size),
+                             thickness,
+                             mapping = lambda points: cylindrical_map(points)[:, [1, 2, 0]],
+                             fuse = fuse,
+                             sectors = sectors,
+                             periodic_coordinate = 1,
+                             periodic_axis = (0, 1, 0))
@@ -12,7 +12,11 @@
 # acknowledge and accept the above terms.
 ##############################################################################
 
-from ..commons import eachpointAdaptive
+from ..commons import eachpointAdaptive, deduplicated_lattice, union_all
+from ..cache import UNIT_CELL_CACHE, cached
+from ..graph import lattice_graph, segments_graph
+from ..grid import cell_origins, cell_params, graded_cells
+from ..primitives import node, strut
 
 from math import hypot, acos, degrees
 import numpy as np
@@ -39,28 +43,23 @@ def z_struts(
 		result: cq.cq.Workplane
 			a solid model of the union of all vertical struts
 	"""
-	result = cq.Workplane("XY")
 	corner_points = unit_cell_size * np.array(
 		[(0, 0),
 		(1, 0),
 		(1, 1),
 		(0, 1)]
 	)
+	struts = []
 	for point in corner_points:
-		result = (result
-				  .union(
-					  cq.Workplane()
-					  .transformed(offset = cq.Vector(point[0], point[1]))
-					  .circle(strut_radius)
-					  .extrude(unit_cell_size)
-					  )
-				  )
-	return result
+		struts.append(
+			strut(strut_radius, unit_cell_size,
+				offset = cq.Vector(point[0], point[1]))
+			)
+	return union_all(struts)
 # Register our custom plugin before use.
 cq.Workplane.z_struts = z_struts
 
 def bottom_xy_struts(unit_cell_size, strut_radius):
-	result = cq.Workplane("XY")
 	angle = 90
 	corner_points = unit_cell_size * np.array(
 		[(0, 0),
@@ -68,23 +67,19 @@ def bottom_xy_struts(unit_cell_size, strut_radius):
 		(1, 1),
 		(0, 1)]
 	)
+	struts = []
 	for point in corner_points:
-		result = (result
-				  .union(
-					  cq.Workplane()
-					  .transformed(offset = cq.Vector(point[0], point[1], 0),
-								   rotate = cq.Vector(90, angle, 0))
-					  .circle(strut_radius)
-					  .extrude(unit_cell_size)
-					  )
-				  )
+		struts.append(
+			strut(strut_radius, unit_cell_size,
+				offset = cq.Vector(point[0], point[1], 0),
+				rotation = cq.Vector(90, angle, 0))
+			)
 		angle += 90
-	return result
+	return union_all(struts)
 # Register our custom plugin before use.
 cq.Workplane.bottom_xy_struts = bottom_xy_struts
 
 def top_xy_struts(unit_cell_size, strut_radius):
-	result = cq.Workplane("XY")
 	angle = 90
 	corner_points = unit_cell_size * np.array(
 		[(0, 0),
@@ -92,71 +87,78 @@ def top_xy_struts(unit_cell_size, strut_radius):
 		(1, 1),
 		(0, 1)]
 	)
+	struts = []
 	for point in corner_points:
-		result = (result
-				  .union(
-					  cq.Workplane()
-					  .transformed(offset = cq.Vector(point[0], point[1], unit_cell_size),
-								   rotate = cq.Vector(90, angle, 0))
-					  .circle(strut_radius)
-					  .extrude(unit_cell_size)
-					  )
-				  )
+		struts.append(
+			strut(strut_radius, unit_cell_size,
+				offset = cq.Vector(point[0], point[1], unit_cell_size),
+				rotation = cq.Vector(90, angle, 0))
+			)
 		angle += 90
-	return result
+	return union_all(struts)
 # Register our custom plugin before use.
 cq.Workplane.top_xy_struts = top_xy_struts
 
 # Creates 4 nodes at the XY plane of each unit cell
 def create_nodes(node_diameter,
 				unit_cell_size,
-				delta = 0.01 # a small coefficient is needed because CQ thinks that it cuts through emptiness
+				delta = 0.01, # a small coefficient is needed because CQ thinks that it cuts through emptiness
+				node_shape = 'box'
 				):
-	added_node_diameter = node_diameter + delta
-	node_radius = node_diameter / 2.0
-	result = cq.Workplane("XY")
 	corner_points = unit_cell_size * np.array(
 		[(0, 0),
 		(1, 0),
 		(1, 1),
 		(0, 1)]
 	)
-	for point in corner_points:
-		result= (result
-				  .union(
-					  cq.Workplane()
-					  .transformed(offset = cq.Vector(point[0], point[1], 0))
-					  .box(added_node_diameter, added_node_diameter, added_node_diameter)
-					  .edges("|Z")
-					  .fillet(node_radius)
-					  .edges("|X")
-					  .fillet(node_radius)
-					  )
-				  )
-		result= (result
-				  .union(
-					  cq.Workplane()
-					  .transformed(offset = cq.Vector(point[0], point[1], unit_cell_size))
-					  .box(added_node_diameter, added_node_diameter, added_node_diameter)
-					  .edges("|Z")
-					  .fillet(node_radius)
-					  .edges("|X")
-					  .fillet(node_radius)
-					  )
-				  )
-	return result
+	node_points = [(point[0], point[1], z)
+				   for point in corner_points
+				   for z in (0, unit_cell_size)]
+	nodes = []
+	for point in node_points:
+		nodes.append(
+			node(node_diameter,
+				cq.Vector(point[0], point[1], point[2]),
+				node_shape,
+				delta)
+			)
+	return union_all(nodes)
 cq.Workplane.create_nodes = create_nodes
 
-def unit_cell(location, unit_cell_size, strut_radius, node_diameter, type):
-	result = cq.Workplane("XY")
-	result = result.union(z_struts(unit_cell_size, strut_radius))
-	result = result.union(bottom_xy_struts(unit_cell_size, strut_radius))
-	result = result.union(top_xy_struts(unit_cell_size, strut_radius))
-	result = result.union(create_nodes(node_diameter, unit_cell_size))
+def unit_cell(location, unit_cell_size, strut_radius, node_diameter, type, node_shape = 'box'):
+	result = union_all([z_struts(unit_cell_size, strut_radius),
+						bottom_xy_struts(unit_cell_size, strut_radius),
+						top_xy_struts(unit_cell_size, strut_radius),
+						create_nodes(node_diameter, unit_cell_size, node_shape = node_shape)])
 	return result.val().located(location)
 cq.Workplane.unit_cell = unit_cell
 
-def cubic_heterogeneous_lattice(unit_cell_size,
+def unit_cell_graph(unit_cell_size = 1.0, type = 'cubic'):
+	"""
+	Returns the unit cell of unit_cell as a graph: the 12 edges and 8 corners
+	of the cube.
+
+	Parameters
+	----------
+		unit_cell_size : float
+			unit cell size (in mm)
+		type : str
+			the topology type
+	Returns
+	-------
+		nodes : np.ndarray
+			(M, 3) node coordinates
+		edges : np.ndarray
+			(E, 2) node indices of the struts
+	"""
+	corners = np.array([(x, y, z) for x in (0, 1) for y in (0, 1) for z in (0, 1)], dtype = float)
+	segments = [(corner, corner + axis)
+				for corner in corners
+				for axis in np.eye(3)
+				if corner @ axis == 0]
+	return segments_graph(unit_cell_size * np.array(segments), unit_cell_size * corners)
+
+def cubic_heterogeneous_graph(unit_cell_size,
 							  min_strut_diameter,
 							  max_strut_diameter,
 							  min_node_diameter,
@@ -164,38 +166,66 @@ def cubic_heterogeneous_lattice(unit_cell_size,
 							  Nx, Ny, Nz,
 							  type = 'cubic',
 							  rule = 'linear'):
-	min_strut_radius = min_strut_diameter / 2.0
-	max_strut_radius = max_strut_diameter / 2.0
-	if rule == 'linear':
-		strut_radii = np.linspace(min_strut_radius,
-	   		 					  max_strut_radius,
-		    					  Nz)
-		node_diameters = np.linspace(min_node_diameter,
-	    							 max_node_diameter,
-		    						 Nz)
-	if rule == 'sin':
-		average = lambda num1, num2: (num1 + num2) / 2
-		strut_radii = np.sin(
-			np.linspace(min_strut_radius, max_strut_radius, Nz)*12) + 2*average(min_strut_radius, max_strut_radius)
-		node_diameters = np.sin(
-			np.linspace(min_node_diameter, max_node_diameter, Nz)*12) + 2*average(min_node_diameter, max_node_diameter)
-	UC_pnts = []
-	for i in range(Nx):
-		for j in range(Ny):
-			for k in range(Nz):
-				UC_pnts.append((i * unit_cell_size, j * unit_cell_size, k * unit_cell_size))
+	"""
+	Returns the lattice of cubic_heterogeneous_lattice as a graph, with the struts
+	and nodes shared by neighbouring cells merged (see graph.lattice_graph).
+
+	Parameters
+	----------
+		see cubic_heterogeneous_lattice
+	Returns
+	-------
+		nodes : np.ndarray
+			(M, 3) node coordinates
+		edges : np.ndarray
+			(E, 2) node indices of the struts
+		strut_radii : np.ndarray
+			radius of every strut
+		node_diameters : np.ndarray
+			diameter of every node
+	"""
+	indices, strut_radii, node_diameters = graded_cells(Nx, Ny, Nz,
+		min_strut_diameter, max_strut_diameter, min_node_diameter, max_node_diameter, rule)
+	return lattice_graph(unit_cell_graph(unit_cell_size, type),
+		cell_origins(indices, unit_cell_size),
+		strut_radii, node_diameters)
+
+def cubic_heterogeneous_lattice(unit_cell_size,
+							  min_strut_diameter,
+							  max_strut_diameter,
+							  min_node_diameter,
+							  max_node_diameter,
+							  Nx, Ny, Nz,
+							  type = 'cubic',
+							  rule = 'linear',
+							  node_shape = 'box',
+							  cache = UNIT_CELL_CACHE,
+							  workers = None,
+							  instanced = False,
+							  deduplicate = False):
+	if deduplicate:
+		# every strut and node shared by neighbouring cells is built once
+		return deduplicated_lattice(cubic_heterogeneous_graph(unit_cell_size,
+				min_strut_diameter, max_strut_diameter,
+				min_node_diameter, max_node_diameter,
+				Nx, Ny, Nz, type, rule),
+			cache, workers, instanced,
+			node_shape = node_shape)
+	indices, strut_radii, node_diameters = graded_cells(Nx, Ny, Nz,
+		min_strut_diameter, max_strut_diameter, min_node_diameter, max_node_diameter, rule)
 	print("Datapoints generated")
 	result = cq.Workplane().tag('base')
-	result = result.pushPoints(UC_pnts)
-	unit_cell_params = []
-	for i in range(Nx * Ny):
-		for j in range(Nz):
-			unit_cell_params.append({"unit_cell_size": unit_cell_size,
-				"strut_radius": strut_radii[j],
-				"node_diameter": node_diameters[j],
-				"type": type})
-	result = result.eachpointAdaptive(unit_cell,
+	result = result.pushPoints(cell_origins(indices, unit_cell_size).tolist())
+	unit_cell_params = cell_params(len(indices),
+		unit_cell_size = unit_cell_size,
+		strut_radius = strut_radii,
+		node_diameter = node_diameters,
+		type = type,
+		node_shape = node_shape)
+	result = result.eachpointAdaptive(cached(unit_cell, cache),
 									  callback_extra_args = unit_cell_params,
-									  useLocalCoords = True)
+									  useLocalCoords = True,
+									  workers = workers,
+									  instanced = instanced)
 	print("The lattice is generated")
 	return result
\ No newline at end of file
@@ -14,7 +14,11 @@
 
 from typing import Tuple
 from numpy import append
-from ..commons import eachpointAdaptive
+from ..commons import eachpointAdaptive, deduplicated_lattice, union_all
+from ..cache import UNIT_CELL_CACHE, cached
+from ..graph import lattice_graph, segments_graph, strut_segment
+from ..grid import cell_origins, cell_params, graded_cells
+from ..primitives import node, strut
 
 from math import hypot, acos, degrees
 import numpy as np
@@ -32,6 +36,32 @@ PNT_LEVELS = [
 		[(0, 0), (0.5, 0.5), (1, 1)]
 		]
 
+# In a cube ABCDA1B1C1D1 this is the angle C1AD
+ANGLE_C1AD = 90 - degrees(acos(3**-.5))
+# (offset, rotation) of every strut relative to the unit cell size
+STRUT_DATA = [
+	# 4 bottom struts
+	((1, 0, 0), (-45, -ANGLE_C1AD, 0)),
+	((0.5, 0.5, 0), (-45, - ANGLE_C1AD, 0)),
+	((0.5, 0.5, 0), (45, ANGLE_C1AD, 0)),
+	((0, 1, 0), (45, ANGLE_C1AD, 0)),
+	# 4 2nd level struts
+	((0.75, 0.25, 0.25), (-45, ANGLE_C1AD, 0)),
+	((0.75, 0.25, 0.25), (45, - ANGLE_C1AD, 0)),
+	((0.25, 0.75, 0.25), (-45, ANGLE_C1AD, 0)),
+	((0.25, 0.75, 0.25), (45, - ANGLE_C1AD, 0)),
+	# 4 3rd level struts
+	((0.5, 0, 0.5), (-45, - ANGLE_C1AD, 0)),
+	((1, 0.5, 0.5), (-45, - ANGLE_C1AD, 0)),
+	((0.5, 1, 0.5), (45, ANGLE_C1AD, 0)),
+	((0, 0.5, 0.5), (45, ANGLE_C1AD, 0)),
+	# 4 top struts
+	((0.25, 0.25, 0.75), (45, - ANGLE_C1AD, 0)),
+	((0.25, 0.25, 0.75), (- 45, ANGLE_C1AD, 0)),
+	((0.75, 0.75, 0.75), (45, - ANGLE_C1AD, 0)),
+	((0.75, 0.75, 0.75), (- 45, ANGLE_C1AD, 0)),
+]
+
 def create_strut(
 		unit_cell_size: np.float64,
 		offset: Tuple,
@@ -61,11 +91,9 @@ def create_strut(
 	"""
 	hypot2D = hypot(0.25 * unit_cell_size, 0.25 * unit_cell_size)
 	strut_len = hypot(hypot2D, 0.25 * unit_cell_size)
-	result = cq.Workplane()
-	result = result.transformed(rotate = cq.Vector(angle),
-								offset = cq.Vector(offset))
-	result = result.circle(radius).extrude(strut_len)
-	return result
+	return strut(radius, strut_len,
+		rotation = cq.Vector(angle),
+		offset = cq.Vector(offset))
 # Register our custom plugin before use.
 cq.Workplane.create_strut = create_strut
 
@@ -91,79 +119,13 @@ def create_diamond_struts(
 			a solid model of the struts
 		
 	"""
-	angle_x = 45
-	# In a cube ABCDA1B1C1D1 this is the angle C1AD
-	angle_c1ad = 90 - degrees(acos(3**-.5))
-	# 4 bottom struts
-	result = create_strut(unit_cell_size,
-							(unit_cell_size, 0, 0),
-							(-45, -angle_c1ad, 0),
-							radius)
-	result = result.union(create_strut(unit_cell_size,
-										(0.5*unit_cell_size, 0.5*unit_cell_size, 0),
-										(-45, - angle_c1ad, 0),
-										radius))
-	result = result.union(create_strut(unit_cell_size,
-										(0.5*unit_cell_size, 0.5*unit_cell_size, 0),
-										(45, angle_c1ad, 0),
-										radius))
-	result = result.union(create_strut(unit_cell_size,
-										(0, unit_cell_size, 0),
-										(45, angle_c1ad, 0),
-										radius))
-	# 4 2nd level struts
-	result = result.union(create_strut(unit_cell_size,
-										(0.75 * unit_cell_size, 0.25 * unit_cell_size, 0.25 * unit_cell_size),
-										(-45, angle_c1ad, 0),
-										radius))
-	result = result.union(create_strut(unit_cell_size,
-										(0.75 * unit_cell_size, 0.25 * unit_cell_size, 0.25 * unit_cell_size),
-										(45, - angle_c1ad, 0),
-										radius))
-	result = result.union(create_strut(unit_cell_size,
-										(0.25 * unit_cell_size, 0.75 * unit_cell_size, 0.25 * unit_cell_size),
-										(-45, angle_c1ad, 0),
-										radius))
-	result = result.union(create_strut(unit_cell_size,
-										(0.25 * unit_cell_size, 0.75 * unit_cell_size, 0.25 * unit_cell_size),
-										(45, - angle_c1ad, 0),
-										radius))
-	# 4 3rd level struts
-	result = result.union(create_strut(unit_cell_size,
-										(0.5 * unit_cell_size, 0, 0.5 * unit_cell_size),
-										(-45, - angle_c1ad, 0),
-										radius))
-	result = result.union(create_strut(unit_cell_size,
-										(unit_cell_size, 0.5 * unit_cell_size, 0.5 * unit_cell_size),
-										(-45, - angle_c1ad, 0),
-										radius))
-	result = result.union(create_strut(unit_cell_size,
-										(0.5 * unit_cell_size, unit_cell_size, 0.5 * unit_cell_size),
-										(45, angle_c1ad, 0),
-										radius))
-	result = result.union(create_strut(unit_cell_size,
-										(0, 0.5 * unit_cell_size, 0.5 * unit_cell_size),
-										(45, angle_c1ad, 0),
-										radius))
-	# 4 top struts
-	result = result.union(create_strut(unit_cell_size,
-										(0.25*unit_cell_size, 0.25*unit_cell_size, 0.75 * unit_cell_size),
-										(45, - angle_c1ad, 0),
-										radius))
-	result = result.union(create_strut(unit_cell_size,
-										(0.25*unit_cell_size, 0.25*unit_cell_size, 0.75 * unit_cell_size),
-										(- 45, angle_c1ad, 0),
-										radius))
-	result = result.union(create_strut(unit_cell_size,
-										(0.75*unit_cell_size, 0.75*unit_cell_size, 0.75 * unit_cell_size),
-										(45, - angle_c1ad, 0),
-										radius))
-	result = result.union(create_strut(unit_cell_size,
-										(0.75*unit_cell_size, 0.75*unit_cell_size, 0.75 * unit_cell_size),
-										(- 45, angle_c1ad, 0),
-										radius))
-
-	return result
+	struts = []
+	for offset, angle in STRUT_DATA:
+		struts.append(create_strut(unit_cell_size,
+								   tuple(unit_cell_size * o for o in offset),
+								   angle,
+								   radius))
+	return union_all(struts)
 # Register our custom plugin before use.
 cq.Workplane.create_diamond_struts = create_diamond_struts
 
@@ -172,78 +134,124 @@ cq.Workplane.create_diamond_struts = create_diamond_struts
 # Creates 4 nodes at the XY plane of each unit cell
 def create_nodes(node_diameter,
 				unit_cell_size,
-				delta = 0.01 # a small coefficient is needed because CQ thinks that it cuts through emptiness
+				delta = 0.01, # a small coefficient is needed because CQ thinks that it cuts through emptiness
+				node_shape = 'box'
 				):
-	added_node_diameter = node_diameter + delta
-	node_radius = node_diameter / 2.0
 	
 	z_level = 0
-	result = cq.Workplane("XY")
+	nodes = []
 	for pnt_level in PNT_LEVELS:
 		for pnt in pnt_level:
-			result = (result
-					.union(
-						cq.Workplane()
-						.transformed(offset = cq.Vector(pnt[0] * unit_cell_size,
-														pnt[1] * unit_cell_size,
-														z_level))
-						.box(added_node_diameter, added_node_diameter, added_node_diameter)
-						.edges("|Z")
-						.fillet(node_radius)
-						.edges("|X")
-						.fillet(node_radius)
-						)
-					)
+			nodes.append(
+				node(node_diameter,
+					cq.Vector(pnt[0] * unit_cell_size,
+						pnt[1] * unit_cell_size,
+						z_level),
+					node_shape,
+					delta)
+				)
 		z_level += 0.25 * unit_cell_size
-	return result
+	return union_all(nodes)
 cq.Workplane.create_nodes = create_nodes
 
-def unit_cell(location, unit_cell_size, strut_radius, node_diameter, type):
-	result = cq.Workplane("XY")
-	result = result.union(create_diamond_struts(unit_cell_size, strut_radius))
-	result = result.union(create_nodes(node_diameter, unit_cell_size))
+def unit_cell(location, unit_cell_size, strut_radius, node_diameter, type, node_shape = 'box'):
+	result = union_all([create_diamond_struts(unit_cell_size, strut_radius),
+						create_nodes(node_diameter, unit_cell_size, node_shape = node_shape)])
 	return result.val().located(location)
 cq.Workplane.unit_cell = unit_cell
 
-def diamond_heterogeneous_lattice(unit_cell_size,
+def unit_cell_graph(unit_cell_size = 1.0, type = 'diamond'):
+	"""
+	Returns the unit cell of unit_cell as a graph: the struts of STRUT_DATA and
+	the nodes of PNT_LEVELS.
+
+	Parameters
+	----------
+		unit_cell_size : float
+			unit cell size (in mm)
+		type : str
+			the topology type
+	Returns
+	-------
+		nodes : np.ndarray
+			(M, 3) node coordinates
+		edges : np.ndarray
+			(E, 2) node indices of the struts
+	"""
+	strut_len = hypot(hypot(0.25, 0.25), 0.25)
+	segments = [strut_segment(strut_len, angle, offset) for offset, angle in STRUT_DATA]
+	nodes = [(x, y, 0.25 * level)
+			 for level, pnt_level in enumerate(PNT_LEVELS)
+			 for x, y in pnt_level]
+	return segments_graph(unit_cell_size * np.array(segments),
+						  unit_cell_size * np.array(nodes, dtype = float))
+
+def diamond_heterogeneous_graph(unit_cell_size,
 							  min_strut_diameter,
 							  max_strut_diameter,
 							  min_node_diameter,
 							  max_node_diameter,
 							  Nx, Ny, Nz,
 							  rule = 'linear'):
-	min_strut_radius = min_strut_diameter / 2.0
-	max_strut_radius = max_strut_diameter / 2.0
-	if rule == 'linear':
-		strut_radii = np.linspace(min_strut_radius,
-	   		 					  max_strut_radius,
-		    					  Nz)
-		node_diameters = np.linspace(min_node_diameter,
-	    							 max_node_diameter,
-		    						 Nz)
-	if rule == 'sin':
-		average = lambda num1, num2: (num1 + num2) / 2
-		strut_radii = np.sin(
-			np.linspace(min_strut_radius, max_strut_radius, Nz)*12) + 2*average(min_strut_radius, max_strut_radius)
-		node_diameters = np.sin(
-			np.linspace(min_node_diameter, max_node_diameter, Nz)*12) + 2*average(min_node_diameter, max_node_diameter)
-	UC_pnts = []
-	for i in range(Nx):
-		for j in range(Ny):
-			for k in range(Nz):
-				UC_pnts.append((i * unit_cell_size, j * unit_cell_size, k * unit_cell_size))
+	"""
+	Returns the lattice of diamond_heterogeneous_lattice as a graph, with the struts
+	and nodes shared by neighbouring cells merged (see graph.lattice_graph).
+
+	Parameters
+	----------
+		see diamond_heterogeneous_lattice
+	Returns
+	-------
+		nodes : np.ndarray
+			(M, 3) node coordinates
+		edges : np.ndarray
+			(E, 2) node indices of the struts
+		strut_radii : np.ndarray
+			radius of every strut
+		node_diameters : np.ndarray
+			diameter of every node
+	"""
+	indices, strut_radii, node_diameters = graded_cells(Nx, Ny, Nz,
+		min_strut_diameter, max_strut_diameter, min_node_diameter, max_node_diameter, rule)
+	return lattice_graph(unit_cell_graph(unit_cell_size),
+		cell_origins(indices, unit_cell_size),
+		strut_radii, node_diameters)
+
+def diamond_heterogeneous_lattice(unit_cell_size,
+							  min_strut_diameter,
+							  max_strut_diameter,
+							  min_node_diameter,
+							  max_node_diameter,
+							  Nx, Ny, Nz,
+							  rule = 'linear',
+							  node_shape = 'box',
+							  cache = UNIT_CELL_CACHE,
+							  workers = None,
+							  instanced = False,
+							  deduplicate = False):
+	if deduplicate:
+		# every strut and node shared by neighbouring cells is built once
+		return deduplicated_lattice(diamond_heterogeneous_graph(unit_cell_size,
+				min_strut_diameter, max_strut_diameter,
+				min_node_diameter, max_node_diameter,
+				Nx, Ny, Nz, rule),
+			cache, workers, instanced,
+			node_shape = node_shape)
+	indices, strut_radii, node_diameters = graded_cells(Nx, Ny, Nz,
+		min_strut_diameter, max_strut_diameter, min_node_diameter, max_node_diameter, rule)
 	print("Datapoints generated")
 	result = cq.Workplane().tag('base')
-	result = result.pushPoints(UC_pnts)
-	unit_cell_params = []
-	for i in range(Nx * Ny):
-		for j in range(Nz):
-			unit_cell_params.append({"unit_cell_size": unit_cell_size,
-				"strut_radius": strut_radii[j],
-				"node_diameter": node_diameters[j],
-				"type": type})
-	result = result.eachpointAdaptive(unit_cell,
+	result = result.pushPoints(cell_origins(indices, unit_cell_size).tolist())
+	unit_cell_params = cell_params(len(indices),
+		unit_cell_size = unit_cell_size,
+		strut_radius = strut_radii,
+		node_diameter = node_diameters,
+		type = type,
+		node_shape = node_shape)
+	result = result.eachpointAdaptive(cached(unit_cell, cache),
 									  callback_extra_args = unit_cell_params,
-									  useLocalCoords = True)
+									  useLocalCoords = True,
+									  workers = workers,
+									  instanced = instanced)
 	print("The lattice is generated")
 	return result
\ No newline at end of file
@@ -12,7 +12,10 @@
 # acknowledge and accept the above terms.
 ##############################################################################
 
-from ..commons import eachpointAdaptive
+from ..commons import eachpointAdaptive, deduplicated_lattice, union_all
+from ..cache import UNIT_CELL_CACHE, cached
+from ..graph import lattice_graph, segments_graph
+from ..grid import cell_origins, cell_params, graded_cells
 from .bcc import bcc_diagonals
 from .bcc import create_nodes as create_bcc_nodes
 from .fcc import create_diagonal_strut
@@ -22,6 +25,7 @@ from .fcc import fcc_bottom_horizontal_struts
 from .fcc import fcc_horizontal_diagonal_struts
 from .fcc import fcc_top_horizontal_struts
 from .fcc import create_nodes
+from .fcc import graph_parts as fcc_graph_parts
 
 from math import hypot, acos, degrees, hypot
 import numpy as np
@@ -40,22 +44,66 @@ cq.Workplane.fcc_horizontal_diagonal_struts = fcc_horizontal_diagonal_struts
 cq.Workplane.fcc_top_horizontal_struts = fcc_top_horizontal_struts
 cq.Workplane.create_nodes = create_nodes
 
-def unit_cell(location, unit_cell_size, strut_radius, node_diameter, type):
-	result = cq.Workplane("XY")
-	result = result.union(bcc_diagonals(unit_cell_size, strut_radius))
-	result = result.union(fcc_diagonals(unit_cell_size, strut_radius))
+def unit_cell(location, unit_cell_size, strut_radius, node_diameter, type, node_shape = 'box'):
+	parts = [bcc_diagonals(unit_cell_size, strut_radius),
+			 fcc_diagonals(unit_cell_size, strut_radius)]
 	if type in ['sfbcc', 'sfbccz']:
-		result = result.union(create_nodes(node_diameter, unit_cell_size, type))
+		parts.append(create_nodes(node_diameter, unit_cell_size, type, node_shape = node_shape))
 	if type in ['fbccz', 'sfbccz']:
-		result = result.union(fcc_vertical_struts(unit_cell_size, strut_radius))
+		parts.append(fcc_vertical_struts(unit_cell_size, strut_radius))
 	if type == 'fbcc':
-		result = result.union(fcc_horizontal_diagonal_struts(unit_cell_size, strut_radius))
-		result = result.union(create_nodes(node_diameter, unit_cell_size, type))
-	#result = result.union(create_bcc_nodes(node_diameter, unit_cell_size))
+		parts.append(fcc_horizontal_diagonal_struts(unit_cell_size, strut_radius))
+		parts.append(create_nodes(node_diameter, unit_cell_size, type, node_shape = node_shape))
+	#parts.append(create_bcc_nodes(node_diameter, unit_cell_size))
+	result = union_all(parts)
 	return result.val().located(location)
 cq.Workplane.unit_cell = unit_cell
 
-def fbcc_heterogeneous_lattice(unit_cell_size,
+def unit_cell_graph(unit_cell_size = 1.0, type = 'fbcc'):
+	"""
+	Returns the unit cell of unit_cell as a graph: the BCC body diagonals (which
+	cross without a node) and the FCC struts and nodes.
+
+	Parameters
+	----------
+		unit_cell_size : float
+			unit cell size (in mm)
+		type : str
+			the topology type, see fbcc_heterogeneous_lattice
+	Returns
+	-------
+		nodes : np.ndarray
+			(M, 3) node coordinates
+		edges : np.ndarray
+			(E, 2) node indices of the struts
+	"""
+	diagonals = np.array(
+		[((0, 0, 0), (1, 1, 1)),
+		((1, 0, 0), (0, 1, 1)),
+		((1, 1, 0), (0, 0, 1)),
+		((0, 1, 0), (1, 0, 1))], dtype = float)
+	fcc_type = {'sfbccz': 'sfccz', 'sfbcc': 'sfcc'}.get(type, type)
+	segments, nodes = fcc_graph_parts(fcc_type)
+	return segments_graph(unit_cell_size * np.vstack([diagonals, segments]),
+						  unit_cell_size * nodes)
+
+def _graded_cells(Nx, Ny, Nz,
+				  min_strut_diameter,
+				  max_strut_diameter,
+				  min_node_diameter,
+				  max_node_diameter,
+				  type,
+				  rule):
+	"""
+	Checks the type and grades the cells of fbcc_heterogeneous_lattice and
+	fbcc_heterogeneous_graph (see grid.graded_cells).
+	"""
+	if type not in ['fbcc', 'sfbcc', 'sfbccz']:
+		raise TypeError(f'The type \'{type}\' does not exist!')
+	return graded_cells(Nx, Ny, Nz, min_strut_diameter, max_strut_diameter,
+		min_node_diameter, max_node_diameter, rule)
+
+def fbcc_heterogeneous_graph(unit_cell_size,
 							  min_strut_diameter,
 							  max_strut_diameter,
 							  min_node_diameter,
@@ -63,40 +111,66 @@ def fbcc_heterogeneous_lattice(unit_cell_size,
 							  Nx, Ny, Nz,
 							  type = 'fbcc',
 							  rule = 'linear'):
-	if type not in ['fbcc', 'sfbcc', 'sfbccz']:
-		raise TypeError(f'The type \'{type}\' does not exist!')
-	min_strut_radius = min_strut_diameter / 2.0
-	max_strut_radius = max_strut_diameter / 2.0
-	if rule == 'linear':
-		strut_radii = np.linspace(min_strut_radius,
-	   		 					  max_strut_radius,
-		    					  Nz)
-		node_diameters = np.linspace(min_node_diameter,
-	    							 max_node_diameter,
-		    						 Nz)
-	if rule == 'sin':
-		average = lambda num1, num2: (num1 + num2) / 2
-		strut_radii = np.sin(
-			np.linspace(min_strut_radius, max_strut_radius, Nz)*12) + 2*average(min_strut_radius, max_strut_radius)
-		node_diameters = np.sin(
-			np.linspace(min_node_diameter, max_node_diameter, Nz)*12) + 2*average(min_node_diameter, max_node_diameter)
-	UC_pnts = []
-	for i in range(Nx):
-		for j in range(Ny):
-			for k in range(Nz):
-				UC_pnts.append((i * unit_cell_size, j * unit_cell_size, k * unit_cell_size))
+	"""
+	Returns the lattice of fbcc_heterogeneous_lattice as a graph, with the struts
+	and nodes shared by neighbouring cells merged (see graph.lattice_graph).
+
+	Parameters
+	----------
+		see fbcc_heterogeneous_lattice
+	Returns
+	-------
+		nodes : np.ndarray
+			(M, 3) node coordinates
+		edges : np.ndarray
+			(E, 2) node indices of the struts
+		strut_radii : np.ndarray
+			radius of every strut
+		node_diameters : np.ndarray
+			diameter of every node
+	"""
+	indices, strut_radii, node_diameters = _graded_cells(Nx, Ny, Nz,
+		min_strut_diameter, max_strut_diameter, min_node_diameter, max_node_diameter, type, rule)
+	return lattice_graph(unit_cell_graph(unit_cell_size, type),
+		cell_origins(indices, unit_cell_size),
+		strut_radii, node_diameters)
+
+def fbcc_heterogeneous_lattice(unit_cell_size,
+							  min_strut_diameter,
+							  max_strut_diameter,
+							  min_node_diameter,
+							  max_node_diameter,
+							  Nx, Ny, Nz,
+							  type = 'fbcc',
+							  rule = 'linear',
+							  node_shape = 'box',
+							  cache = UNIT_CELL_CACHE,
+							  workers = None,
+							  instanced = False,
+							  deduplicate = False):
+	if deduplicate:
+		# every strut and node shared by neighbouring cells is built once
+		return deduplicated_lattice(fbcc_heterogeneous_graph(unit_cell_size,
+				min_strut_diameter, max_strut_diameter,
+				min_node_diameter, max_node_diameter,
+				Nx, Ny, Nz, type, rule),
+			cache, workers, instanced,
+			node_shape = node_shape)
+	indices, strut_radii, node_diameters = _graded_cells(Nx, Ny, Nz,
+		min_strut_diameter, max_strut_diameter, min_node_diameter, max_node_diameter, type, rule)
 	print("Datapoints generated")
 	result = cq.Workplane().tag('base')
-	result = result.pushPoints(UC_pnts)
-	unit_cell_params = []
-	for i in range(Nx * Ny):
-		for j in range(Nz):
-			unit_cell_params.append({"unit_cell_size": unit_cell_size,
-				"strut_radius": strut_radii[j],
-				"node_diameter": node_diameters[j],
-				"type": type})
-	result = result.eachpointAdaptive(unit_cell,
+	result = result.pushPoints(cell_origins(indices, unit_cell_size).tolist())
+	unit_cell_params = cell_params(len(indices),
+		unit_cell_size = unit_cell_size,
+		strut_radius = strut_radii,
+		node_diameter = node_diameters,
+		type = type,
+		node_shape = node_shape)
+	result = result.eachpointAdaptive(cached(unit_cell, cache),
 									  callback_extra_args = unit_cell_params,
-									  useLocalCoords = True)
+									  useLocalCoords = True,
+									  workers = workers,
+									  instanced = instanced)
 	print("The lattice is generated")
 	return result
\ No newline at end of file
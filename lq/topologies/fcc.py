@@ -12,7 +12,11 @@
 # acknowledge and accept the above terms.
 ##############################################################################
 
-from ..commons import cuboid_tranformation, eachpointAdaptive, cylinder_tranformation
+from ..commons import cuboid_tranformation, cylinder_tranformation, eachpointAdaptive, deduplicated_lattice, union_all
+from ..cache import UNIT_CELL_CACHE, cached
+from ..graph import lattice_graph, segments_graph
+from ..grid import cell_origins, cell_params, graded_cells
+from ..primitives import node
 
 from math import hypot
 import numpy as np
@@ -51,7 +55,7 @@ def create_diagonal_strut(
 	"""
 	hypot2D = hypot(unit_cell_size, unit_cell_size)
 	result = cylinder_tranformation(radius, hypot2D, cq.Vector(angle_x, angle_y, 0))
-	return result.val().located(location)
+	return result.val().moved(location)
 
 def fcc_diagonals(unit_cell_size: np.float64,
 					strut_radius: np.float64) -> cq.cq.Workplane:
@@ -144,24 +148,22 @@ def fcc_vertical_struts(unit_cell_size: np.float64,
 		result : cq.cq.Workplane
 			a solid model of the union of all vertical struts
 	"""
-	result = cq.Workplane("XY")
 	corner_points = unit_cell_size * np.array(
 		[(0, 0),
 		(1, 0),
 		(1, 1),
 		(0, 1)]
 	)
+	struts = []
 	for point in corner_points:
-		result = (result.union(
+		struts.append(
 			cylinder_tranformation(strut_radius, unit_cell_size,
 					transformation = cq.Vector(point[0], point[1])))
-					)
-	return result
+	return union_all(struts)
 # Register our custom plugin before use.
 cq.Workplane.fcc_vertical_struts = fcc_vertical_struts
 
 def fcc_bottom_horizontal_struts(unit_cell_size, strut_radius):
-	result = cq.Workplane("XY")
 	angle = 90
 	corner_points = unit_cell_size * np.array(
 		[(0, 0),
@@ -169,20 +171,18 @@ def fcc_bottom_horizontal_struts(unit_cell_size, strut_radius):
 		(1, 1),
 		(0, 1)]
 	)
+	struts = []
 	for point in corner_points:
-		result = (result.union(
-					cylinder_tranformation(strut_radius, unit_cell_size,
-							cq.Vector(90, angle, 0),
-							cq.Vector(point[0], point[1], 0))
-							)
-				  )
+		struts.append(
+			cylinder_tranformation(strut_radius, unit_cell_size,
+					cq.Vector(90, angle, 0),
+					cq.Vector(point[0], point[1], 0)))
 		angle += 90
-	return result
+	return union_all(struts)
 # Register our custom plugin before use.
 cq.Workplane.fcc_bottom_horizontal_struts = fcc_bottom_horizontal_struts
 
 def fcc_horizontal_diagonal_struts(unit_cell_size, strut_radius):
-	result = cq.Workplane("XY")
 	corner_points = unit_cell_size * np.array(
 		[(0, 0, 0),
 		(1, 0, 0),
@@ -191,20 +191,18 @@ def fcc_horizontal_diagonal_struts(unit_cell_size, strut_radius):
 	)
 	angle = 135.0
 	hypot2D = hypot(unit_cell_size, unit_cell_size)
+	struts = []
 	for point in corner_points:
-		result = (result.union(
-					cylinder_tranformation(strut_radius, hypot2D,
-							cq.Vector(90, angle, 0),
-							cq.Vector(point[0], point[1], point[2]))
-							)
-				  )
+		struts.append(
+			cylinder_tranformation(strut_radius, hypot2D,
+					cq.Vector(90, angle, 0),
+					cq.Vector(point[0], point[1], point[2])))
 		angle += 90
-	return result
+	return union_all(struts)
 # Register our custom plugin before use.
 cq.Workplane.fcc_horizontal_diagonal_struts = fcc_horizontal_diagonal_struts
 
 def fcc_top_horizontal_struts(unit_cell_size, strut_radius):
-	result = cq.Workplane("XY")
 	angle = 90
 	corner_points = unit_cell_size * np.array(
 		[(0, 0),
@@ -212,15 +210,14 @@ def fcc_top_horizontal_struts(unit_cell_size, strut_radius):
 		(1, 1),
 		(0, 1)]
 	)
+	struts = []
 	for point in corner_points:
-		result = (result.union(
-					cylinder_tranformation(strut_radius, unit_cell_size,
-							cq.Vector(90, angle, 0),
-							cq.Vector(point[0], point[1], unit_cell_size))
-							)
-				  )
+		struts.append(
+			cylinder_tranformation(strut_radius, unit_cell_size,
+					cq.Vector(90, angle, 0),
+					cq.Vector(point[0], point[1], unit_cell_size)))
 		angle += 90
-	return result
+	return union_all(struts)
 # Register our custom plugin before use.
 cq.Workplane.fcc_top_horizontal_struts = fcc_top_horizontal_struts
 
@@ -228,11 +225,9 @@ cq.Workplane.fcc_top_horizontal_struts = fcc_top_horizontal_struts
 def create_nodes(node_diameter,
 				unit_cell_size,
 				type,
-				delta = 0.01 # a small coefficient is needed because CQ thinks that it cuts through emptiness
+				delta = 0.01, # a small coefficient is needed because CQ thinks that it cuts through emptiness
+				node_shape = 'box'
 				):
-	added_node_diameter = node_diameter + delta
-	node_radius = node_diameter / 2.0
-	result = cq.Workplane("XY")
 	corner_points = unit_cell_size * np.array(
 		[(0, 0),
 		(1, 0),
@@ -241,29 +236,6 @@ def create_nodes(node_diameter,
 	)
 	if type in ['fcc', 'fccz', 'fbcc']:
 		corner_points = np.vstack([corner_points, unit_cell_size * np.array([(0.5, 0.5)])])
-	for point in corner_points:
-		result= (result
-				  .union(
-					  cq.Workplane()
-					  .transformed(offset = cq.Vector(point[0], point[1], 0))
-					  .box(added_node_diameter, added_node_diameter, added_node_diameter)
-					  .edges("|Z")
-					  .fillet(node_radius)
-					  .edges("|X")
-					  .fillet(node_radius)
-					  )
-				  )
-		result= (result
-				  .union(
-					  cq.Workplane()
-					  .transformed(offset = cq.Vector(point[0], point[1], unit_cell_size))
-					  .box(added_node_diameter, added_node_diameter, added_node_diameter)
-					  .edges("|Z")
-					  .fillet(node_radius)
-					  .edges("|X")
-					  .fillet(node_radius)
-					  )
-				  )
 	half_unit_cell_size = unit_cell_size / 2
 	middle_points = unit_cell_size * np.array(
 		[(0.5, 0),
@@ -271,33 +243,135 @@ def create_nodes(node_diameter,
 		(0.5, 1),
 		(0, 0.5)]
 	)
-	for point in middle_points:
-		result= (result
-				  .union(
-					  cq.Workplane()
-					  .transformed(offset = cq.Vector(point[0], point[1], half_unit_cell_size))
-					  .box(added_node_diameter, added_node_diameter, added_node_diameter)
-					  .edges("|Z")
-					  .fillet(node_radius)
-					  .edges("|X")
-					  .fillet(node_radius)
-					  )
-				  )
-
-	return result
+	node_points = [(point[0], point[1], z)
+				   for point in corner_points
+				   for z in (0, unit_cell_size)]
+	node_points += [(point[0], point[1], half_unit_cell_size)
+					for point in middle_points]
+	nodes = []
+	for point in node_points:
+		nodes.append(
+			node(node_diameter,
+				cq.Vector(point[0], point[1], point[2]),
+				node_shape,
+				delta)
+			)
+	return union_all(nodes)
 cq.Workplane.create_nodes = create_nodes
 
-def unit_cell(location, unit_cell_size, strut_radius, node_diameter, type):
-	result = cq.Workplane("XY")
-	result = result.union(fcc_diagonals(unit_cell_size, strut_radius))
+def unit_cell(location, unit_cell_size, strut_radius, node_diameter, type, node_shape = 'box'):
+	parts = [fcc_diagonals(unit_cell_size, strut_radius)]
 	if type in ['fccz', 'sfccz', 'sfbcc']:
-		result = result.union(fcc_vertical_struts(unit_cell_size, strut_radius))
+		parts.append(fcc_vertical_struts(unit_cell_size, strut_radius))
 	if type in ['fcc', 'fccz', 'fbcc']:
-		result = result.union(fcc_horizontal_diagonal_struts(unit_cell_size, strut_radius))
-	result = result.union(create_nodes(node_diameter, unit_cell_size, type))
+		parts.append(fcc_horizontal_diagonal_struts(unit_cell_size, strut_radius))
+	parts.append(create_nodes(node_diameter, unit_cell_size, type, node_shape = node_shape))
+	result = union_all(parts)
 	return result.val().located(location)
 cq.Workplane.unit_cell = unit_cell
 
+def graph_parts(type = 'fcc'):
+	"""
+	Returns the struts and the nodes of unit_cell for the unit cell size 1.
+
+	Parameters
+	----------
+		type : str
+			the topology type, see unit_cell
+	Returns
+	-------
+		segments : np.ndarray
+			(N, 2, 3) end points of the struts
+		nodes : np.ndarray
+			(M, 3) node coordinates
+	"""
+	# the diagonals of the side faces
+	segments = [
+		((0, 0, 0), (0, 1, 1)), ((0, 0, 0), (1, 0, 1)),
+		((1, 0, 0), (0, 0, 1)), ((1, 0, 0), (1, 1, 1)),
+		((1, 1, 0), (1, 0, 1)), ((1, 1, 0), (0, 1, 1)),
+		((0, 1, 0), (0, 0, 1)), ((0, 1, 0), (1, 1, 1))]
+	corner_points = [(0, 0), (1, 0), (1, 1), (0, 1)]
+	if type in ['fccz', 'sfccz', 'sfbcc']:
+		segments += [((x, y, 0), (x, y, 1)) for x, y in corner_points]
+	if type in ['fcc', 'fccz', 'fbcc']:
+		segments += [
+			((0, 0, 0), (1, 1, 0)), ((1, 0, 0), (0, 1, 0)),
+			((1, 1, 1), (0, 0, 1)), ((0, 1, 1), (1, 0, 1))]
+		corner_points.append((0.5, 0.5))
+	nodes = [(x, y, z) for x, y in corner_points for z in (0, 1)]
+	nodes += [(x, y, 0.5) for x, y in [(0.5, 0), (1, 0.5), (0.5, 1), (0, 0.5)]]
+	return np.array(segments, dtype = float), np.array(nodes, dtype = float)
+
+def unit_cell_graph(unit_cell_size = 1.0, type = 'fcc'):
+	"""
+	Returns the unit cell of unit_cell as a graph. The diagonals are split at
+	the nodes in the middle of the faces.
+
+	Parameters
+	----------
+		unit_cell_size : float
+			unit cell size (in mm)
+		type : str
+			the topology type, see fcc_heterogeneous_lattice
+	Returns
+	-------
+		nodes : np.ndarray
+			(M, 3) node coordinates
+		edges : np.ndarray
+			(E, 2) node indices of the struts
+	"""
+	segments, nodes = graph_parts(type)
+	return segments_graph(unit_cell_size * segments, unit_cell_size * nodes)
+
+def _graded_cells(Nx, Ny, Nz,
+				  min_strut_diameter,
+				  max_strut_diameter,
+				  min_node_diameter,
+				  max_node_diameter,
+				  type,
+				  rule):
+	"""
+	Checks the type and grades the cells of fcc_heterogeneous_lattice and
+	fcc_heterogeneous_graph (see grid.graded_cells).
+	"""
+	if type not in ['fcc', 'fccz', 'sfcc', 'sfccz']:
+		raise TypeError(f'The type \'{type}\' does not exist!')
+	return graded_cells(Nx, Ny, Nz, min_strut_diameter, max_strut_diameter,
+		min_node_diameter, max_node_diameter, rule)
+
+def fcc_heterogeneous_graph(unit_cell_size,
+							  min_strut_diameter,
+							  max_strut_diameter,
+							  min_node_diameter,
+							  max_node_diameter,
+							  Nx, Ny, Nz,
+							  type = 'fcc',
+							  rule = 'linear'):
+	"""
+	Returns the lattice of fcc_heterogeneous_lattice as a graph, with the struts
+	and nodes shared by neighbouring cells merged (see graph.lattice_graph).
+
+	Parameters
+	----------
+		see fcc_heterogeneous_lattice
+	Returns
+	-------
+		nodes : np.ndarray
+			(M, 3) node coordinates
+		edges : np.ndarray
+			(E, 2) node indices of the struts
+		strut_radii : np.ndarray
+			radius of every strut
+		node_diameters : np.ndarray
+			diameter of every node
+	"""
+	indices, strut_radii, node_diameters = _graded_cells(Nx, Ny, Nz,
+		min_strut_diameter, max_strut_diameter, min_node_diameter, max_node_diameter, type, rule)
+	return lattice_graph(unit_cell_graph(unit_cell_size, type),
+		cell_origins(indices, unit_cell_size),
+		strut_radii, node_diameters)
+
 def fcc_heterogeneous_lattice(unit_cell_size,
 							  min_strut_diameter,
 							  max_strut_diameter,
@@ -306,41 +380,35 @@ def fcc_heterogeneous_lattice(unit_cell_size,
 							  Nx, Ny, Nz,
 							  type = 'fcc',
 							  rule = 'linear',
-							  c_section = 'circle'):
-	if type not in ['fcc', 'fccz', 'sfcc', 'sfccz']:
-		raise TypeError(f'The type \'{type}\' does not exist!')
-	min_strut_radius = min_strut_diameter / 2.0
-	max_strut_radius = max_strut_diameter / 2.0
-	if rule == 'linear':
-		strut_radii = np.linspace(min_strut_radius,
-	   		 					  max_strut_radius,
-		    					  Nz)
-		node_diameters = np.linspace(min_node_diameter,
-	    							 max_node_diameter,
-		    						 Nz)
-	if rule == 'sin':
-		average = lambda num1, num2: (num1 + num2) / 2
-		strut_radii = np.sin(
-			np.linspace(min_strut_radius, max_strut_radius, Nz)*12) + 2*average(min_strut_radius, max_strut_radius)
-		node_diameters = np.sin(
-			np.linspace(min_node_diameter, max_node_diameter, Nz)*12) + 2*average(min_node_diameter, max_node_diameter)
-	UC_pnts = []
-	for i in range(Nx):
-		for j in range(Ny):
-			for k in range(Nz):
-				UC_pnts.append((i * unit_cell_size, j * unit_cell_size, k * unit_cell_size))
+							  c_section = 'circle',
+							  node_shape = 'box',
+							  cache = UNIT_CELL_CACHE,
+							  workers = None,
+							  instanced = False,
+							  deduplicate = False):
+	if deduplicate:
+		# every strut and node shared by neighbouring cells is built once
+		return deduplicated_lattice(fcc_heterogeneous_graph(unit_cell_size,
+				min_strut_diameter, max_strut_diameter,
+				min_node_diameter, max_node_diameter,
+				Nx, Ny, Nz, type, rule),
+			cache, workers, instanced,
+			node_shape = node_shape)
+	indices, strut_radii, node_diameters = _graded_cells(Nx, Ny, Nz,
+		min_strut_diameter, max_strut_diameter, min_node_diameter, max_node_diameter, type, rule)
 	print("Datapoints generated")
 	result = cq.Workplane().tag('base')
-	result = result.pushPoints(UC_pnts)
-	unit_cell_params = []
-	for i in range(Nx * Ny):
-		for j in range(Nz):
-			unit_cell_params.append({"unit_cell_size": unit_cell_size,
-				"strut_radius": strut_radii[j],
-				"node_diameter": node_diameters[j],
-				"type": type})
-	result = result.eachpointAdaptive(unit_cell,
+	result = result.pushPoints(cell_origins(indices, unit_cell_size).tolist())
+	unit_cell_params = cell_params(len(indices),
+		unit_cell_size = unit_cell_size,
+		strut_radius = strut_radii,
+		node_diameter = node_diameters,
+		type = type,
+		node_shape = node_shape)
+	result = result.eachpointAdaptive(cached(unit_cell, cache),
 									  callback_extra_args = unit_cell_params,
-									  useLocalCoords = True)
+									  useLocalCoords = True,
+									  workers = workers,
+									  instanced = instanced)
 	print("The lattice is generated")
 	return result
\ No newline at end of file
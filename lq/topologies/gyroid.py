@@ -1,4 +1,7 @@
 from ..commons import eachpointAdaptive
+from ..cache import UNIT_CELL_CACHE, ShapeCache, cached
+from ..grid import AXES, cell_field, cell_indices, cell_origins, cell_params, graded, per_cell
+from ..primitives import cached_face
 
 import numpy as np
 
@@ -8,18 +11,15 @@ import cadquery as cq
 cq.Workplane.eachpointAdaptive = eachpointAdaptive
 
 # Gyroïd, all edges are splines on different workplanes.
-def gyroid_000(self, thickness: float, unit_cell_size: float
-    ) -> cq.cq.Workplane:
+def _gyroid_000_face(unit_cell_size: float) -> cq.Face:
     """
-    Create a plate with a gyroid spline edge in the first
-    (000) octant
+    Fit the gyroid surface in the first (000) octant
     
     Args:
-      thickness (float): the thickness of the plate
       unit_cell_size (float): The size of the unit cell.
     
     Returns:
-      The result of the function.
+      A cq.Face centered at the origin.
     """
     edge_points = [
         [[0.5, 0.5],
@@ -60,7 +60,22 @@ def gyroid_000(self, thickness: float, unit_cell_size: float
             .spline(edge_points[i + 1])
         )
     surface_points = [(0, 0, 0)]
-    face = cq.Workplane("XY").interpPlate(edge_wire, surface_points, 0).val()
+    return cq.Workplane("XY").interpPlate(edge_wire, surface_points, 0).val()
+
+def gyroid_000(self, thickness: float, unit_cell_size: float
+    ) -> cq.cq.Workplane:
+    """
+    Create a plate with a gyroid spline edge in the first
+    (000) octant. The surface fit is cached per unit cell size.
+    
+    Args:
+      thickness (float): the thickness of the plate
+      unit_cell_size (float): The size of the unit cell.
+    
+    Returns:
+      The result of the function.
+    """
+    face = cached_face('gyroid_000', _gyroid_000_face, unit_cell_size)
     plate_4 = (cq.Workplane("XY")
                .add(face.thicken(0.5 * thickness))
                .union(cq.Workplane("XY").add(face.thicken(-0.5 * thickness))))
@@ -140,7 +155,10 @@ cq.Workplane.unit_cell = unit_cell
 
 def gyroid_homogeneous_lattice(unit_cell_size: float,
 							  thickness: float,
-							  Nx: int, Ny: int, Nz: int
+							  Nx: int, Ny: int, Nz: int,
+							  cache: ShapeCache = UNIT_CELL_CACHE,
+							  workers: int = None,
+							  instanced: bool = False
                 ) -> cq.cq.Workplane:
     """
     Create a unit cell of gyroid, and repeat it Nx, Ny, Nz times
@@ -151,6 +169,9 @@ def gyroid_homogeneous_lattice(unit_cell_size: float,
       Nx (int): number of unit cells in x direction
       Ny (int): number of unit cells in the y direction
       Nz (int): Number of unit cells in the z direction
+      cache (ShapeCache): cache of built unit cells, None disables caching
+      workers (int): number of worker processes used to build the unit cells
+      instanced (bool): return the cells as a single compound of located references
     
     Returns:
       A CQ object.
@@ -158,28 +179,29 @@ def gyroid_homogeneous_lattice(unit_cell_size: float,
 
     # Register our custom plugins before use.
     cq.Workplane.eachpointAdaptive = eachpointAdaptive
-    UC_pnts = []
-    for i in range(Nx):
-        for j in range(Ny):
-            for k in range(Nz):
-                UC_pnts.append((2 * i * unit_cell_size, 2 * j * unit_cell_size, 2 * k * unit_cell_size))
+    indices = cell_indices(Nx, Ny, Nz)
     result = cq.Workplane().tag('base')
-    result = result.pushPoints(UC_pnts)
-    unit_cell_params = []
-    for i in range(Nx * Ny):
-        for j in range(Nz):
-            unit_cell_params.append({"thickness": thickness,
-                "unit_cell_size": unit_cell_size})
-    result = result.eachpointAdaptive(unit_cell,
+    result = result.pushPoints(cell_origins(indices, 2 * unit_cell_size).tolist())
+    unit_cell_params = cell_params(len(indices),
+        thickness = thickness,
+        unit_cell_size = unit_cell_size)
+    result = result.eachpointAdaptive(cached(unit_cell, cache),
 									  callback_extra_args = unit_cell_params,
-									  useLocalCoords = True)
+									  useLocalCoords = True,
+									  workers = workers,
+									  instanced = instanced)
     return result
 
 def gyroid_heterogeneous_lattice(unit_cell_size: float,
                                 min_thickness: float,
                                 max_thickness: float,
                                 Nx: int, Ny: int, Nz: int,
-                                direction: str = 'z'
+                                direction: str = 'z',
+                                cache: ShapeCache = UNIT_CELL_CACHE,
+                                workers: int = None,
+                                instanced: bool = False,
+                                thickness_field = None,
+                                quantization: float = None
                                 ) -> cq.cq.Workplane:
     """
     Create a linearly heterogeneous lattice of gyroid unit cells by creating a base workplane, 
@@ -193,37 +215,39 @@ def gyroid_heterogeneous_lattice(unit_cell_size: float,
       Ny (int): Number of unit cells in the y direction
       Nz (int): Number of unit cells in the z direction
       direction (str): direction of thickness variation (x, y, z)
+      cache (ShapeCache): cache of built unit cells, None disables caching
+      workers (int): number of worker processes used to build the unit cells
+      instanced (bool): return the cells as a single compound of located references
+      thickness_field: a 3D thickness field that replaces the linear variation: a function
+        f(x, y, z) of arrays of coordinates or a 3D array of values spanning the lattice.
+        It is evaluated at the cell centers and clipped to [min_thickness, max_thickness]
+      quantization (float): round the thicknesses to multiples of this step, so that cells
+        of the same thickness are built once
     Returns:
       A CQ object.
     """
-    coordinates_3d = ['x', 'y', 'z']
-    if direction not in coordinates_3d:
-        raise ValueError(f'Direction {direction} does not exist. The acceptable directions are {coordinates_3d}')
+    if direction not in AXES:
+        raise ValueError(f'Direction {direction} does not exist. The acceptable directions are {list(AXES)}')
     # Register the custrom plugin 
     cq.Workplane.eachpointAdaptive = eachpointAdaptive
-    ns = {'x': Nx,'y': Ny, 'z': Nz}
-    thicknesses = np.linspace(min_thickness, max_thickness, ns[direction])
-    UC_pnts = []
+    indices = cell_indices(Nx, Ny, Nz)
+    if thickness_field is None:
+        thicknesses = graded(min_thickness, max_thickness, (Nx, Ny, Nz)[AXES[direction]])
+        thicknesses = cell_field(per_cell(thicknesses, indices, direction), indices,
+                                 unit_cell_size, step = quantization)
+    else:
+        thicknesses = cell_field(thickness_field, indices, unit_cell_size,
+                                 min_thickness, max_thickness, quantization)
     unit_cell_size = 0.5 * unit_cell_size # because unit cell is made of 8 mirrored features
-    for i in range(Nx):
-        for j in range(Ny):
-            for k in range(Nz):
-                UC_pnts.append((2 * i * unit_cell_size, 2 * j * unit_cell_size, 2 * k * unit_cell_size))
     result = cq.Workplane().tag('base')
-    result = result.pushPoints(UC_pnts)
-    unit_cell_params = []
-    for i in range(Nx):
-        for j in range(Ny):
-            for k in range(Nz):
-                n_coordinates = {
-                    'x': i,
-                    'y': j,
-                    'z': k
-                }
-                unit_cell_params.append({"thickness": thicknesses[n_coordinates[direction]],
-                    "unit_cell_size": unit_cell_size})
-    result = result.eachpointAdaptive(unit_cell,
+    result = result.pushPoints(cell_origins(indices, 2 * unit_cell_size).tolist())
+    unit_cell_params = cell_params(len(indices),
+        thickness = thicknesses,
+        unit_cell_size = unit_cell_size)
+    result = result.eachpointAdaptive(cached(unit_cell, cache),
 									  callback_extra_args = unit_cell_params,
-									  useLocalCoords = True)
+									  useLocalCoords = True,
+									  workers = workers,
+									  instanced = instanced)
     return result
 
@@ -13,6 +13,8 @@
 ##############################################################################
 
 from ..commons import eachpointAdaptive
+from ..cache import UNIT_CELL_CACHE, cached
+from ..grid import cell_indices, cell_origins, cell_params
 from .fcc import unit_cell
 
 import numpy as np
@@ -28,31 +30,27 @@ def fcc_martensite(unit_cell_size: float,
                     # Nx: int,
                     Ny: int,
                     Nz: int,
-                    uc_break: int):
+                    uc_break: int,
+                    cache = UNIT_CELL_CACHE,
+                    workers = None,
+                    instanced = False):
     if uc_break < 1:
         raise ValueError('The value of the beginning of the break should larger than 1')
-    UC_pnts = []
     Nx = Nz + uc_break - 1
-    for i in range(Nx):
-        for j in range(Ny):
-            for k in range(Nz):
-                if k < i:
-                    UC_pnts.append(
-                        (i * unit_cell_size,
-                        j * unit_cell_size,
-                        k * unit_cell_size))
+    indices = cell_indices(Nx, Ny, Nz)
+    indices = indices[indices[:, 2] < indices[:, 0]]
     print("Datapoints generated")
     result = cq.Workplane().tag('base')
-    result = result.pushPoints(UC_pnts)
-    unit_cell_params = []
-    for i in range(Nx * Ny):
-        for j in range(Nz):
-            unit_cell_params.append({"unit_cell_size": unit_cell_size,
-                "strut_radius": strut_diameter * 0.5,
-                "node_diameter": node_diameter,
-                "type": 'fcc'})
-    result = result.eachpointAdaptive(unit_cell,
+    result = result.pushPoints(cell_origins(indices, unit_cell_size).tolist())
+    unit_cell_params = cell_params(len(indices),
+        unit_cell_size = unit_cell_size,
+        strut_radius = strut_diameter * 0.5,
+        node_diameter = node_diameter,
+        type = 'fcc')
+    result = result.eachpointAdaptive(cached(unit_cell, cache),
                                         callback_extra_args = unit_cell_params,
-                                        useLocalCoords = True)
+                                        useLocalCoords = True,
+                                        workers = workers,
+                                        instanced = instanced)
     print("The lattice is generated")
     return result
\ No newline at end of file
@@ -12,7 +12,11 @@
 # acknowledge and accept the above terms.
 ##############################################################################
 
-from ..commons import eachpointAdaptive
+from ..commons import eachpointAdaptive, deduplicated_lattice, union_all
+from ..cache import UNIT_CELL_CACHE, cached
+from ..graph import lattice_graph, segments_graph
+from ..grid import cell_origins, cell_params, graded, graded_cells, per_cell
+from ..primitives import node, strut
 
 from math import hypot, acos, degrees
 import numpy as np
@@ -42,7 +46,7 @@ def z_struts(
 		result: cq.cq.Workplane
 			a solid model of the union of all vertical struts
 	"""
-	result = cq.Workplane("XY")
+	struts = []
 	half_truncation = 0.5 * truncation
 	corner_points = unit_cell_size * np.array(
 		[(half_truncation, 0),
@@ -56,21 +60,17 @@ def z_struts(
 	)
 	truncation_delta = truncation * unit_cell_size / 2
 	for point in corner_points:
-		result = (result
-				  .union(
-					  cq.Workplane()
-					  .transformed(offset = cq.Vector(point[0], point[1], truncation_delta))
-					  .circle(strut_radius)
-					  .extrude(unit_cell_size - 2 * truncation_delta)
-					  )
-				  )
-	return result
+		struts.append(
+			strut(strut_radius, unit_cell_size - 2 * truncation_delta,
+				offset = cq.Vector(point[0], point[1], truncation_delta))
+			)
+	return union_all(struts)
 # Register our custom plugin before use.
 cq.Workplane.z_struts = z_struts
 
 def bottom_xy_struts(unit_cell_size, strut_radius, truncation):
 	truncation_delta = truncation * unit_cell_size / 2
-	result = cq.Workplane("XY")
+	struts = []
 	angle = 90
 	corner_points = unit_cell_size * np.array(
 		[(0, 0),
@@ -91,36 +91,28 @@ def bottom_xy_struts(unit_cell_size, strut_radius, truncation):
 		(truncation_delta, - truncation_delta)]
 	)
 	for idp, point in enumerate(corner_points):
-		result = (result
-				  .union(
-					  cq.Workplane()
-					  .transformed(offset = cq.Vector(point[0] + truncation_data_top[idp][0],
-					  		  				point[1] + truncation_data_top[idp][1],
-							  				truncation_delta),
-								   rotate = cq.Vector(90, angle, 0))
-					  .circle(strut_radius)
-					  .extrude(unit_cell_size - 2 * truncation_delta)
-					  )
-				  )
-		result = (result
-				  .union(
-					  cq.Workplane()
-					  .transformed(offset = cq.Vector(point[0] + truncation_data_bottom[idp][0],
-					  		  				point[1] + truncation_data_bottom[idp][1],
-							  				0),
-								   rotate = cq.Vector(90, angle, 0))
-					  .circle(strut_radius)
-					  .extrude(unit_cell_size - 2 * truncation_delta)
-					  )
-				  )
+		struts.append(
+			strut(strut_radius, unit_cell_size - 2 * truncation_delta,
+				offset = cq.Vector(point[0] + truncation_data_top[idp][0],
+					point[1] + truncation_data_top[idp][1],
+					truncation_delta),
+				rotation = cq.Vector(90, angle, 0))
+			)
+		struts.append(
+			strut(strut_radius, unit_cell_size - 2 * truncation_delta,
+				offset = cq.Vector(point[0] + truncation_data_bottom[idp][0],
+					point[1] + truncation_data_bottom[idp][1],
+					0),
+				rotation = cq.Vector(90, angle, 0))
+			)
 		angle += 90
-	return result
+	return union_all(struts)
 # Register our custom plugin before use.
 cq.Workplane.bottom_xy_struts = bottom_xy_struts
 
 def top_xy_struts(unit_cell_size, strut_radius, truncation):
 	truncation_delta = truncation * unit_cell_size / 2
-	result = cq.Workplane("XY")
+	struts = []
 	angle = 90
 	corner_points = unit_cell_size * np.array(
 		[(0, 0),
@@ -141,30 +133,22 @@ def top_xy_struts(unit_cell_size, strut_radius, truncation):
 		(truncation_delta, - truncation_delta)]
 	)
 	for idp, point in enumerate(corner_points):
-		result = (result
-				  .union(
-					  cq.Workplane()
-					  .transformed(offset = cq.Vector(point[0] + truncation_data_bottom[idp][0],
-					  		  					point[1] + truncation_data_bottom[idp][1],
-												unit_cell_size - truncation_delta),
-								   rotate = cq.Vector(90, angle, 0))
-					  .circle(strut_radius)
-					  .extrude(unit_cell_size - 2 * truncation_delta)
-					  )
-				  )
-		result = (result
-				  .union(
-					  cq.Workplane()
-					  .transformed(offset = cq.Vector(point[0] + truncation_data_top[idp][0],
-					  		  				point[1] + truncation_data_top[idp][1],
-							  				unit_cell_size),
-								   rotate = cq.Vector(90, angle, 0))
-					  .circle(strut_radius)
-					  .extrude(unit_cell_size - 2 * truncation_delta)
-					  )
-				  )
+		struts.append(
+			strut(strut_radius, unit_cell_size - 2 * truncation_delta,
+				offset = cq.Vector(point[0] + truncation_data_bottom[idp][0],
+					point[1] + truncation_data_bottom[idp][1],
+					unit_cell_size - truncation_delta),
+				rotation = cq.Vector(90, angle, 0))
+			)
+		struts.append(
+			strut(strut_radius, unit_cell_size - 2 * truncation_delta,
+				offset = cq.Vector(point[0] + truncation_data_top[idp][0],
+					point[1] + truncation_data_top[idp][1],
+					unit_cell_size),
+				rotation = cq.Vector(90, angle, 0))
+			)
 		angle += 90
-	return result
+	return union_all(struts)
 # Register our custom plugin before use.
 cq.Workplane.top_xy_struts = top_xy_struts
 
@@ -178,7 +162,7 @@ def t_struts(strut_radius,
 		(0, 1)]
 	)
 	truncation_delta = truncation * unit_cell_size / 2
-	result = cq.Workplane("XY")
+	struts = []
 	angle_z = - 135
 	for point in corner_points:
 		if point[0] == 0:
@@ -194,66 +178,54 @@ def t_struts(strut_radius,
 			t_yz = - truncation_delta
 			angle_y = - 45
 		# Struts that are in XZ in the first octan
-		result = result.union(
-			cq.Workplane()
-			.transformed(offset = cq.Vector(point[0] + t_xz,
-												point[1] + t_yz,
-												0),
-						rotate = cq.Vector(0, angle_x, 0))
-			.circle(strut_radius)
-			.extrude(hypot(truncation_delta, truncation_delta))
+		struts.append(
+			strut(strut_radius, hypot(truncation_delta, truncation_delta),
+				offset = cq.Vector(point[0] + t_xz,
+					point[1] + t_yz,
+					0),
+				rotation = cq.Vector(0, angle_x, 0))
 		)
-		result = result.union(
-			cq.Workplane()
-			.transformed(offset = cq.Vector(point[0] + t_xz,
-												point[1] + t_yz,
-												unit_cell_size),
-						rotate = cq.Vector(0, angle_x * 3, 0))
-			.circle(strut_radius)
-			.extrude(hypot(truncation_delta, truncation_delta))
+		struts.append(
+			strut(strut_radius, hypot(truncation_delta, truncation_delta),
+				offset = cq.Vector(point[0] + t_xz,
+					point[1] + t_yz,
+					unit_cell_size),
+				rotation = cq.Vector(0, angle_x * 3, 0))
 		)
 		# Struts that are in XY in the first octan
-		result = result.union(
-			cq.Workplane()
-			.transformed(offset = cq.Vector(point[0] + t_xz,
-												point[1],
-												truncation_delta),
-						rotate = cq.Vector(90, angle_z, 0))
-			.circle(strut_radius)
-			.extrude(hypot(truncation_delta, truncation_delta))
+		struts.append(
+			strut(strut_radius, hypot(truncation_delta, truncation_delta),
+				offset = cq.Vector(point[0] + t_xz,
+					point[1],
+					truncation_delta),
+				rotation = cq.Vector(90, angle_z, 0))
 		)
-		result = result.union(
-			cq.Workplane()
-			.transformed(offset = cq.Vector(point[0] + t_xz,
-												point[1],
-												unit_cell_size - truncation_delta),
-						rotate = cq.Vector(90, angle_z, 0))
-			.circle(strut_radius)
-			.extrude(hypot(truncation_delta, truncation_delta))
+		struts.append(
+			strut(strut_radius, hypot(truncation_delta, truncation_delta),
+				offset = cq.Vector(point[0] + t_xz,
+					point[1],
+					unit_cell_size - truncation_delta),
+				rotation = cq.Vector(90, angle_z, 0))
 		)
 		angle_z -= 90
 		# Struts that are in YZ in the first octan
-		result = result.union(
-			cq.Workplane()
-			.transformed(offset = cq.Vector(point[0] + t_xz,
-												point[1] + t_yz,
-												0),
-						rotate = cq.Vector(angle_y, 0, 0))
-			.circle(strut_radius)
-			.extrude(hypot(truncation_delta, truncation_delta))
+		struts.append(
+			strut(strut_radius, hypot(truncation_delta, truncation_delta),
+				offset = cq.Vector(point[0] + t_xz,
+					point[1] + t_yz,
+					0),
+				rotation = cq.Vector(angle_y, 0, 0))
 		)
-		result = result.union(
-			cq.Workplane()
-			.transformed(offset = cq.Vector(point[0] + t_xz,
-												point[1] + t_yz,
-												unit_cell_size),
-						rotate = cq.Vector(3*angle_y, 0, 0))
-			.circle(strut_radius)
-			.extrude(hypot(truncation_delta, truncation_delta))
+		struts.append(
+			strut(strut_radius, hypot(truncation_delta, truncation_delta),
+				offset = cq.Vector(point[0] + t_xz,
+					point[1] + t_yz,
+					unit_cell_size),
+				rotation = cq.Vector(3*angle_y, 0, 0))
 		)
 
 		
-	return result
+	return union_all(struts)
 # Register our custom plugin before use.
 cq.Workplane.t_struts = t_struts
 
@@ -261,11 +233,10 @@ cq.Workplane.t_struts = t_struts
 def create_nodes(node_diameter,
 				unit_cell_size,
 				truncation,
-				delta = 0.01 # a small coefficient is needed because CQ thinks that it cuts through emptiness
+				delta = 0.01, # a small coefficient is needed because CQ thinks that it cuts through emptiness
+				node_shape = 'box'
 				):
-	added_node_diameter = node_diameter + delta
-	node_radius = node_diameter / 2.0
-	result = cq.Workplane("XY")
+	nodes = []
 	corner_points = unit_cell_size * np.array(
 		[(0, 0),
 		(1, 0),
@@ -290,46 +261,96 @@ def create_nodes(node_diameter,
 	
 	for idp, point in enumerate(corner_points):
 		for t_node in t_nodes[idp]:
-			result = (result
-					.union(
-						cq.Workplane()
-						.transformed(offset = cq.Vector(point[0] + t_node[0],
-															point[1] + t_node[1],
-															t_node[2]))
-						.box(added_node_diameter, added_node_diameter, added_node_diameter)
-						.edges("|Z")
-						.fillet(node_radius)
-						.edges("|X")
-						.fillet(node_radius)
-						)
-					)
-			result = (result
-					.union(
-						cq.Workplane()
-						.transformed(offset = cq.Vector(point[0] + t_node[0],
-															point[1] + t_node[1],
-															unit_cell_size - t_node[2]))
-						.box(added_node_diameter, added_node_diameter, added_node_diameter)
-						.edges("|Z")
-						.fillet(node_radius)
-						.edges("|X")
-						.fillet(node_radius)
-						)
-					)
-	return result
+			nodes.append(
+				node(node_diameter,
+					cq.Vector(point[0] + t_node[0],
+						point[1] + t_node[1],
+						t_node[2]),
+					node_shape,
+					delta)
+				)
+			nodes.append(
+				node(node_diameter,
+					cq.Vector(point[0] + t_node[0],
+						point[1] + t_node[1],
+						unit_cell_size - t_node[2]),
+					node_shape,
+					delta)
+				)
+	return union_all(nodes)
 cq.Workplane.create_nodes = create_nodes
 
-def unit_cell(location, unit_cell_size, strut_radius, node_diameter, truncation):
-	result = cq.Workplane("XY")
-	result = result.union(z_struts(unit_cell_size, strut_radius, truncation))
-	result = result.union(bottom_xy_struts(unit_cell_size, strut_radius, truncation))
-	result = result.union(top_xy_struts(unit_cell_size, strut_radius, truncation))
-	result = result.union(create_nodes(node_diameter, unit_cell_size, truncation))
-	result = result.union(t_struts(strut_radius, unit_cell_size, truncation))
+def unit_cell(location, unit_cell_size, strut_radius, node_diameter, truncation, node_shape = 'box'):
+	result = union_all([z_struts(unit_cell_size, strut_radius, truncation),
+						bottom_xy_struts(unit_cell_size, strut_radius, truncation),
+						top_xy_struts(unit_cell_size, strut_radius, truncation),
+						create_nodes(node_diameter, unit_cell_size, truncation, node_shape = node_shape),
+						t_struts(strut_radius, unit_cell_size, truncation)])
 	return result.val().located(location)
 cq.Workplane.unit_cell = unit_cell
 
-def rco_heterogeneous_lattice(unit_cell_size,
+def unit_cell_graph(unit_cell_size = 1.0, truncation = 0.5):
+	"""
+	Returns the unit cell of unit_cell as a graph. Every corner of the cube is
+	cut off by a triangle whose nodes lie on the 3 faces of the corner, at
+	truncation / 2 from the 2 edges of the face, and every edge of the cube is
+	replaced by the 2 struts that join the triangles of its corners.
+
+	Parameters
+	----------
+		unit_cell_size : float
+			unit cell size (in mm)
+		truncation : float
+			the truncation ratio [0..1]
+	Returns
+	-------
+		nodes : np.ndarray
+			(M, 3) node coordinates
+		edges : np.ndarray
+			(E, 2) node indices of the struts
+	"""
+	truncation_delta = truncation / 2
+	segments = []
+	for corner in np.array([(x, y, z) for x in (0, 1) for y in (0, 1) for z in (0, 1)], dtype = float):
+		inward = np.where(corner == 0, 1.0, - 1.0) * truncation_delta
+		# the node on the face normal to the axis "a"
+		points = [corner + inward * (1 - axis) for axis in np.eye(3)]
+		# the triangle at the corner
+		segments += [(points[a], points[b]) for a, b in ((0, 1), (1, 2), (2, 0))]
+		# the struts along the edges of the cube, once from their lower corner
+		for k, axis in enumerate(np.eye(3)):
+			if corner[k] == 0:
+				segments += [(points[a], points[a] + (1 - 2 * truncation_delta) * axis)
+							 for a in range(3) if a != k]
+	return segments_graph(unit_cell_size * np.array(segments))
+
+def _graded_cells(Nx, Ny, Nz,
+				  min_strut_diameter,
+				  max_strut_diameter,
+				  min_node_diameter,
+				  max_node_diameter,
+				  min_truncation,
+				  max_truncation,
+				  rule):
+	"""
+	Checks the truncations and grades the cells of rco_heterogeneous_lattice and
+	rco_heterogeneous_graph: the 'linear_truncation' rule grades the truncation with the
+	minimal struts and nodes, the other rules grade the struts and nodes with the
+	minimal truncation.
+	"""
+	if not 0 <= min_truncation <= 1 or not 0 <= max_truncation <= 1:
+		raise ValueError("The truncation should take values from 0 to 1")
+	if rule == 'linear_truncation':
+		indices, strut_radii, node_diameters = graded_cells(Nx, Ny, Nz,
+			min_strut_diameter, min_strut_diameter, min_node_diameter, min_node_diameter)
+		truncations = graded(min_truncation, max_truncation, Nz)
+	else:
+		indices, strut_radii, node_diameters = graded_cells(Nx, Ny, Nz,
+			min_strut_diameter, max_strut_diameter, min_node_diameter, max_node_diameter, rule)
+		truncations = np.full(Nz, min_truncation)
+	return indices, strut_radii, node_diameters, per_cell(truncations, indices)
+
+def rco_heterogeneous_graph(unit_cell_size,
 							  min_strut_diameter,
 							  max_strut_diameter,
 							  min_node_diameter,
@@ -339,53 +360,73 @@ def rco_heterogeneous_lattice(unit_cell_size,
 							  max_truncation,
 							  rule = 'linear'):
 	"""
+	Returns the lattice of rco_heterogeneous_lattice as a graph, with the struts
+	and nodes shared by neighbouring cells merged (see graph.lattice_graph).
+
+	Parameters
+	----------
+		see rco_heterogeneous_lattice
+	Returns
+	-------
+		nodes : np.ndarray
+			(M, 3) node coordinates
+		edges : np.ndarray
+			(E, 2) node indices of the struts
+		strut_radii : np.ndarray
+			radius of every strut
+		node_diameters : np.ndarray
+			diameter of every node
+	"""
+	indices, strut_radii, node_diameters, truncations = _graded_cells(Nx, Ny, Nz,
+		min_strut_diameter, max_strut_diameter, min_node_diameter, max_node_diameter,
+		min_truncation, max_truncation, rule)
+	return lattice_graph(lambda t: unit_cell_graph(unit_cell_size, t),
+		cell_origins(indices, unit_cell_size),
+		strut_radii, node_diameters,
+		graph_values = truncations)
+
+def rco_heterogeneous_lattice(unit_cell_size,
+							  min_strut_diameter,
+							  max_strut_diameter,
+							  min_node_diameter,
+							  max_node_diameter,
+							  Nx, Ny, Nz,
+							  min_truncation,
+							  max_truncation,
+							  rule = 'linear',
+							  node_shape = 'box',
+							  cache = UNIT_CELL_CACHE,
+							  workers = None,
+							  instanced = False,
+							  deduplicate = False):
+	"""
 	Rhombic Cubeoctahedron (RCO) heterogeneous lattice
 	structure
 	"""
-	if not 0 <= min_truncation <= 1 and not 0 <= max_truncation <= 1:
-		raise ValueError("The truncation should take values from 0 to 1")
-	min_strut_radius = min_strut_diameter / 2.0
-	max_strut_radius = max_strut_diameter / 2.0
-	if rule == 'linear':
-		strut_radii = np.linspace(min_strut_radius,
-	   		 					  max_strut_radius,
-		    					  Nz)
-		node_diameters = np.linspace(min_node_diameter,
-	    							 max_node_diameter,
-		    						 Nz)
-	if rule == 'sin':
-		average = lambda num1, num2: (num1 + num2) / 2
-		strut_radii = np.sin(
-			np.linspace(min_strut_radius, max_strut_radius, Nz)*12) + 2*average(min_strut_radius, max_strut_radius)
-		node_diameters = np.sin(
-			np.linspace(min_node_diameter, max_node_diameter, Nz)*12) + 2*average(min_node_diameter, max_node_diameter)
-	if rule == 'linear_truncation':
-		truncations = np.linspace(min_truncation,
-								max_truncation,
-								Nz)
-	UC_pnts = []
-	for i in range(Nx):
-		for j in range(Ny):
-			for k in range(Nz):
-				UC_pnts.append((i * unit_cell_size, j * unit_cell_size, k * unit_cell_size))
+	if deduplicate:
+		# every strut and node shared by neighbouring cells is built once
+		return deduplicated_lattice(rco_heterogeneous_graph(unit_cell_size,
+				min_strut_diameter, max_strut_diameter,
+				min_node_diameter, max_node_diameter,
+				Nx, Ny, Nz, min_truncation, max_truncation, rule),
+			cache, workers, instanced,
+			node_shape = node_shape)
+	indices, strut_radii, node_diameters, truncations = _graded_cells(Nx, Ny, Nz,
+		min_strut_diameter, max_strut_diameter, min_node_diameter, max_node_diameter,
+		min_truncation, max_truncation, rule)
 	print("Datapoints generated")
 	result = cq.Workplane().tag('base')
-	result = result.pushPoints(UC_pnts)
-	unit_cell_params = []
-	for i in range(Nx * Ny):
-		for j in range(Nz):
-			if rule == 'linear':
-				unit_cell_params.append({"unit_cell_size": unit_cell_size,
-					"strut_radius": strut_radii[j],
-					"node_diameter": node_diameters[j],
-					"truncation": min_truncation})
-			if rule == 'linear_truncation':
-					unit_cell_params.append({"unit_cell_size": unit_cell_size,
-					"strut_radius": min_strut_radius,
-					"node_diameter": min_node_diameter,
-					"truncation": truncations[j]})
-	result = result.eachpointAdaptive(unit_cell,
+	result = result.pushPoints(cell_origins(indices, unit_cell_size).tolist())
+	unit_cell_params = cell_params(len(indices),
+		unit_cell_size = unit_cell_size,
+		strut_radius = strut_radii,
+		node_diameter = node_diameters,
+		truncation = truncations,
+		node_shape = node_shape)
+	result = result.eachpointAdaptive(cached(unit_cell, cache),
 									  callback_extra_args = unit_cell_params,
-									  useLocalCoords = True)
+									  useLocalCoords = True,
+									  workers = workers,
+									  instanced = instanced)
 	print("The lattice is generated")
 	return result
\ No newline at end of file
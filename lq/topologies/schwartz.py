@@ -1,4 +1,7 @@
 from ..commons import eachpointAdaptive
+from ..cache import UNIT_CELL_CACHE, cached
+from ..grid import RULES, cell_field, cell_indices, cell_origins, cell_params, graded, per_cell, sin_wave_rule
+from ..primitives import cached_face
 
 import numpy as np
 from math import cos, sqrt
@@ -8,8 +11,11 @@ import cadquery as cq
 # Register our custom plugins before use.
 cq.Workplane.eachpointAdaptive = eachpointAdaptive
 
+# The thickness of the TPMS lattices follows a sine wave.
+TPMS_RULES = dict(RULES, sin = sin_wave_rule)
+
 # Schwartz P surface, all edges are arcs on different workplanes.
-def schwartz_p_000(self, thickness, unit_cell_size):
+def _schwartz_p_000_face(unit_cell_size):
     delta_radius = 0.5 - 0.5/sqrt(2)
     convex_pnts = [[0.0, 0.5],
                 [delta_radius, delta_radius],
@@ -49,7 +55,10 @@ def schwartz_p_000(self, thickness, unit_cell_size):
         )
 
     surface_points = [(0, 0, 0)]
-    face = cq.Workplane("XY").interpPlate(edge_wire, surface_points, 0).val()
+    return cq.Workplane("XY").interpPlate(edge_wire, surface_points, 0).val()
+
+def schwartz_p_000(self, thickness, unit_cell_size):
+    face = cached_face('schwartz_p_000', _schwartz_p_000_face, unit_cell_size)
     plate_4 = (cq.Workplane("XY")
                .add(face.thicken(0.5 * thickness))
                .union(cq.Workplane("XY").add(face.thicken(-0.5 * thickness))))
@@ -58,7 +67,7 @@ def schwartz_p_000(self, thickness, unit_cell_size):
 cq.Workplane.schwartz_p_000 = schwartz_p_000
 
 # Schwartz D surface, all edges are line segments on different workplanes.
-def schwartz_d_000(self, thickness, unit_cell_size):
+def _schwartz_d_000_face(unit_cell_size):
     half_unit_cell = unit_cell_size * 0.5
     pts = [
         (0, half_unit_cell, 0),
@@ -71,7 +80,10 @@ def schwartz_d_000(self, thickness, unit_cell_size):
     ]
     edge_wire = cq.Workplane().polyline(pts)
     surface_points = [(half_unit_cell * 0.5, half_unit_cell * 0.5, half_unit_cell * 0.5)]
-    face = cq.Workplane("XY").interpPlate(edge_wire, surface_points, 0).val()
+    return cq.Workplane("XY").interpPlate(edge_wire, surface_points, 0).val()
+
+def schwartz_d_000(self, thickness, unit_cell_size):
+    face = cached_face('schwartz_d_000', _schwartz_d_000_face, unit_cell_size)
     plate = (cq.Workplane("XY")
              .add(face.thicken(0.5 * thickness))
              .union(cq.Workplane("XY").add(face.thicken(-0.5 * thickness))))
@@ -155,41 +167,47 @@ def d_unit_cell(location, thickness, unit_cell_size
 
 cq.Workplane.d_unit_cell = d_unit_cell
 
+def _cell_thicknesses(min_thickness, max_thickness, Nz, indices, unit_cell_size,
+                      rule = 'linear', thickness_field = None, quantization = None):
+    """
+    Thickness of every cell: graded along Z with the rule or, if thickness_field is given,
+    the field (a function f(x, y, z) or a 3D array spanning the lattice) at the cell centers
+    clipped to [min_thickness, max_thickness]. quantization rounds the thicknesses to its
+    multiples, so that the cells of the same thickness are built once.
+    """
+    if thickness_field is None:
+        thicknesses = graded(min_thickness, max_thickness, Nz, rule, TPMS_RULES)
+        return cell_field(per_cell(thicknesses, indices), indices, unit_cell_size,
+                          step = quantization)
+    return cell_field(thickness_field, indices, unit_cell_size,
+                      min_thickness, max_thickness, quantization)
+
 def schwartz_p_heterogeneous_lattice(unit_cell_size,
                                 min_thickness,
                                 max_thickness,
                                 Nx, Ny, Nz,
-                                rule = 'linear'):
+                                rule = 'linear',
+                                cache = UNIT_CELL_CACHE,
+                                workers = None,
+                                instanced = False,
+                                thickness_field = None,
+                                quantization = None):
     # Register the custrom plugin 
     cq.Workplane.eachpointAdaptive = eachpointAdaptive
-    if rule == 'linear':
-        thicknesses = np.linspace(min_thickness, max_thickness, Nz)
-    if rule == 'sin':
-        average = lambda num1, num2: (num1 + num2) / 2
-        x_data = np.linspace(0, Nz, num = Nz)
-        print(x_data)
-        thicknesses = 0.5 * np.sin(x_data) * (max_thickness - min_thickness) + average(min_thickness, max_thickness)
-        print(thicknesses)
-    if rule == 'parabola':
-        x = np.linspace(0, 1, num=Nz)
-        frep = lambda d_min, d_max :-4*d_max*(x-0.5)*(x-0.5)+d_max+d_min
-        thicknesses = frep(min_thickness, max_thickness)
-    UC_pnts = []
+    indices = cell_indices(Nx, Ny, Nz)
+    thicknesses = _cell_thicknesses(min_thickness, max_thickness, Nz, indices, unit_cell_size,
+                                    rule, thickness_field, quantization)
     unit_cell_size = 0.5 * unit_cell_size # bacause it's made of 8 mirrored features
-    for i in range(Nx):
-        for j in range(Ny):
-            for k in range(Nz):
-                UC_pnts.append((2 * i * unit_cell_size, 2 * j * unit_cell_size, 2 * k * unit_cell_size))
     result = cq.Workplane().tag('base')
-    result = result.pushPoints(UC_pnts)
-    unit_cell_params = []
-    for i in range(Nx * Ny):
-        for j in range(Nz):
-            unit_cell_params.append({"thickness": thicknesses[j],
-                "unit_cell_size": unit_cell_size})
-    result = result.eachpointAdaptive(p_unit_cell,
+    result = result.pushPoints(cell_origins(indices, 2 * unit_cell_size).tolist())
+    unit_cell_params = cell_params(len(indices),
+        thickness = thicknesses,
+        unit_cell_size = unit_cell_size)
+    result = result.eachpointAdaptive(cached(p_unit_cell, cache),
 									  callback_extra_args = unit_cell_params,
-									  useLocalCoords = True)
+									  useLocalCoords = True,
+									  workers = workers,
+									  instanced = instanced)
     return result
 
 
@@ -197,36 +215,27 @@ def schwartz_d_heterogeneous_lattice(unit_cell_size,
                                 min_thickness,
                                 max_thickness,
                                 Nx, Ny, Nz,
-                                rule = 'linear'):
+                                rule = 'linear',
+                                cache = UNIT_CELL_CACHE,
+                                workers = None,
+                                instanced = False,
+                                thickness_field = None,
+                                quantization = None):
     # Register the custrom plugin 
     cq.Workplane.eachpointAdaptive = eachpointAdaptive
     cq.Workplane.schwartz_d_000 = schwartz_d_000
-    if rule == 'linear':
-        thicknesses = np.linspace(min_thickness, max_thickness, Nz)
-    if rule == 'sin':
-        average = lambda num1, num2: (num1 + num2) / 2
-        x_data = np.linspace(0, Nz, num = Nz)
-        print(x_data)
-        thicknesses = 0.5 * np.sin(x_data) * (max_thickness - min_thickness) + average(min_thickness, max_thickness)
-        print(thicknesses)
-    if rule == 'parabola':
-        x = np.linspace(0, 1, num=Nz)
-        frep = lambda d_min, d_max :-4*d_max*(x-0.5)*(x-0.5)+d_max+d_min
-        thicknesses = frep(min_thickness, max_thickness)
-    UC_pnts = []
-    for i in range(Nx):
-        for j in range(Ny):
-            for k in range(Nz):
-                UC_pnts.append((i * unit_cell_size, j * unit_cell_size, k * unit_cell_size))
+    indices = cell_indices(Nx, Ny, Nz)
+    thicknesses = _cell_thicknesses(min_thickness, max_thickness, Nz, indices, unit_cell_size,
+                                    rule, thickness_field, quantization)
     result = cq.Workplane().tag('base')
-    result = result.pushPoints(UC_pnts)
-    unit_cell_params = []
-    for i in range(Nx * Ny):
-        for j in range(Nz):
-            unit_cell_params.append({"thickness": thicknesses[j],
-                "unit_cell_size": unit_cell_size})
-    result = result.eachpointAdaptive(d_unit_cell,
+    result = result.pushPoints(cell_origins(indices, unit_cell_size).tolist())
+    unit_cell_params = cell_params(len(indices),
+        thickness = thicknesses,
+        unit_cell_size = unit_cell_size)
+    result = result.eachpointAdaptive(cached(d_unit_cell, cache),
 									  callback_extra_args = unit_cell_params,
-									  useLocalCoords = True)
+									  useLocalCoords = True,
+									  workers = workers,
+									  instanced = instanced)
     return result
 
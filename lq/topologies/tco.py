@@ -13,7 +13,11 @@
 ##############################################################################
 
 from unittest import result
-from ..commons import cylinder_by_two_points, eachpointAdaptive, make_sphere
+from ..commons import cylinder_by_two_points, eachpointAdaptive, deduplicated_lattice, union_all
+from ..cache import UNIT_CELL_CACHE, ShapeCache, cached
+from ..graph import lattice_graph, segments_graph, transform_points
+from ..grid import cell_origins, cell_params, graded_cells
+from ..primitives import node
 
 from math import hypot
 import numpy as np
@@ -23,19 +27,15 @@ import cadquery as cq
 # Register our custom plugins before use.
 cq.Workplane.eachpointAdaptive = eachpointAdaptive
 
-def octagon(self,
-	unit_cell_size: float,
-	strut_radius: float
-	) -> cq.cq.Workplane:
+def octagon_vertices(unit_cell_size: float) -> list:
 	"""
-	It creates an octagon
-	
+	Returns the vertices of the octagon in the XZ plane of a unit cell
+
 	Args:
-	  unit_cell_size (float): float
-	  strut_radius (float): float
-	
+	  unit_cell_size (float): The size of the unit cell.
+
 	Returns:
-	  A CQ object.
+	  A list of 8 (x, y, z) tuples.
 	"""
 	# The following coordinates are based on permutations
 	# of the TCO:
@@ -43,7 +43,7 @@ def octagon(self,
 	truncation = 0.5 *unit_cell_size * np.sqrt(2) / (1 + 2 * np.sqrt(2))
 	regular_octagon_side = unit_cell_size / (1 + 2 * np.sqrt(2))
 	# Creating a list of vertices for the octagon.
-	vertices = [
+	return [
 		(truncation, 0, truncation*2),
 		(truncation, 0, truncation*2 + regular_octagon_side),
 		(2*truncation, 0, unit_cell_size - truncation),
@@ -53,15 +53,55 @@ def octagon(self,
 		(2*truncation + regular_octagon_side, 0, truncation),
 		(2*truncation, 0, truncation),
 	]
+
+def square_edge_points(unit_cell_size: float) -> list:
+	"""
+	Returns the end points of the struts made by square_edges
+
+	Args:
+	  unit_cell_size (float): The size of the unit cell.
+
+	Returns:
+	  A list of 4 pairs of (x, y, z) tuples.
+	"""
+	truncation = 0.5 *unit_cell_size * np.sqrt(2) / (1 + 2 * np.sqrt(2))
+	regular_octagon_side = unit_cell_size / (1 + 2 * np.sqrt(2))
+	return [
+		((2*truncation, truncation, 0),
+		 (2*truncation, 0, truncation)),
+		((2*truncation + regular_octagon_side, truncation, 0),
+		 (2*truncation + regular_octagon_side, 0, truncation)),
+		((2*truncation, truncation, unit_cell_size),
+		 (2*truncation, 0, unit_cell_size - truncation)),
+		((2*truncation + regular_octagon_side, truncation, unit_cell_size),
+		 (2*truncation + regular_octagon_side, 0, unit_cell_size - truncation)),
+	]
+
+def octagon(self,
+	unit_cell_size: float,
+	strut_radius: float
+	) -> cq.cq.Workplane:
+	"""
+	It creates an octagon
+	
+	Args:
+	  unit_cell_size (float): float
+	  strut_radius (float): float
+	
+	Returns:
+	  A CQ object.
+	"""
+	vertices = octagon_vertices(unit_cell_size)
 	# all edges:
-	result = cq.Workplane()
+	edges = []
 	for v in range(len(vertices)):
-		result = result.union(cylinder_by_two_points(
+		edges.append(cylinder_by_two_points(
 			vertices[v],
 			# looping to the first point:
 			vertices[v + 1 if v + 1 != len(vertices) else 0],
 			strut_radius
 		))
+	result = union_all(edges)
 	return self.union(self.eachpoint(lambda loc: result.val().located(loc), True))
 cq.Workplane.octagon = octagon
 
@@ -81,14 +121,14 @@ def octagonal_faces(unit_cell_size: float,
 	  A CQ object.
 	"""
 
-	faces = cq.Workplane().octagon(unit_cell_size, strut_radius)
-	faces = faces.union(
+	faces = [cq.Workplane().octagon(unit_cell_size, strut_radius)]
+	faces.append(
 		cq.Workplane()
 		.transformed(
         	rotate = cq.Vector(0, 0, 90))
 		.octagon(unit_cell_size, strut_radius)
 	)
-	faces = faces.union(
+	faces.append(
 		cq.Workplane()
 		.transformed(
         	offset = cq.Vector(unit_cell_size, 0, 0))
@@ -96,19 +136,19 @@ def octagonal_faces(unit_cell_size: float,
         	rotate = cq.Vector(0, 0, 90))
 		.octagon(unit_cell_size, strut_radius)
 	)
-	faces = faces.union(
+	faces.append(
 		cq.Workplane()
 		.transformed(
         	offset = cq.Vector(0, unit_cell_size, 0))
 		.octagon(unit_cell_size, strut_radius)
 	)
-	faces = faces.union(
+	faces.append(
 		cq.Workplane()
 		.transformed(
         	rotate = cq.Vector(-90, 0, 0))
 		.octagon(unit_cell_size, strut_radius)
 	)
-	faces = faces.union(
+	faces.append(
 		cq.Workplane()
 		.transformed(
         	offset = cq.Vector(0, 0, unit_cell_size))
@@ -116,7 +156,7 @@ def octagonal_faces(unit_cell_size: float,
         	rotate = cq.Vector(-90, 0, 0))
 		.octagon(unit_cell_size, strut_radius)
 	)
-	return faces
+	return union_all(faces)
 
 def square_edges(self,
 		unit_cell_size: float,
@@ -133,29 +173,9 @@ def square_edges(self,
 	  A list of strings.
 	"""
 
-	truncation = 0.5 *unit_cell_size * np.sqrt(2) / (1 + 2 * np.sqrt(2))
-	regular_octagon_side = unit_cell_size / (1 + 2 * np.sqrt(2))
-	# Creating a list of vertices for the octagon.
-	result = cylinder_by_two_points(
-			(2*truncation, truncation, 0),
-			(2*truncation, 0, truncation),
-			strut_radius
-		)
-	result = result.union(cylinder_by_two_points(
-			(2*truncation + regular_octagon_side, truncation, 0),
-			(2*truncation + regular_octagon_side, 0, truncation),
-			strut_radius
-		))
-	result = result.union(cylinder_by_two_points(
-			(2*truncation, truncation, unit_cell_size),
-			(2*truncation, 0, unit_cell_size - truncation),
-			strut_radius
-		))
-	result = result.union(cylinder_by_two_points(
-			(2*truncation + regular_octagon_side, truncation, unit_cell_size),
-			(2*truncation + regular_octagon_side, 0, unit_cell_size - truncation),
-			strut_radius
-		))
+	edges = [cylinder_by_two_points(start, end, strut_radius)
+			 for start, end in square_edge_points(unit_cell_size)]
+	result = union_all(edges)
 	return self.union(self.eachpoint(lambda loc: result.val().located(loc), True))
 cq.Workplane.square_edges = square_edges
 
@@ -172,8 +192,8 @@ def square_faces(unit_cell_size: float,
 	Returns:
 	  A CQ object.
 	"""
-	faces = cq.Workplane().square_edges(unit_cell_size, strut_radius)
-	faces = faces.union(
+	faces = [cq.Workplane().square_edges(unit_cell_size, strut_radius)]
+	faces.append(
 		cq.Workplane()
 		.transformed(
         	rotate = cq.Vector(0, 0, 270))
@@ -181,7 +201,7 @@ def square_faces(unit_cell_size: float,
         	offset = cq.Vector(-unit_cell_size, 0, 0))
 		.square_edges(unit_cell_size, strut_radius)
 	)
-	faces = faces.union(
+	faces.append(
 		cq.Workplane()
 		.transformed(
         	offset = cq.Vector(unit_cell_size, 0, 0))
@@ -189,7 +209,7 @@ def square_faces(unit_cell_size: float,
         	rotate = cq.Vector(0, 0, 90))
 		.square_edges(unit_cell_size, strut_radius)
 	)
-	faces = faces.union(
+	faces.append(
 		cq.Workplane()
 		.transformed(
         	offset = cq.Vector(unit_cell_size, unit_cell_size, 0))
@@ -197,7 +217,7 @@ def square_faces(unit_cell_size: float,
         	rotate = cq.Vector(0, 0, 180))
 		.square_edges(unit_cell_size, strut_radius)
 	)
-	faces = faces.union(
+	faces.append(
 		cq.Workplane()
 		.transformed(
         	offset = cq.Vector(0, 0, unit_cell_size))
@@ -205,7 +225,7 @@ def square_faces(unit_cell_size: float,
         	rotate = cq.Vector(0, 90, 0))
 		.square_edges(unit_cell_size, strut_radius)
 	)
-	faces = faces.union(
+	faces.append(
 		cq.Workplane()
 		.transformed(
         	offset = cq.Vector(unit_cell_size, unit_cell_size, unit_cell_size))
@@ -215,34 +235,16 @@ def square_faces(unit_cell_size: float,
         	rotate = cq.Vector(0, 0, 180))
 		.square_edges(unit_cell_size, strut_radius)
 	)
-	return faces
+	return union_all(faces)
 
 # Creates 4 nodes at the XY plane of each unit cell
 def create_nodes(self, node_diameter: float,
 				unit_cell_size: float,
 				delta = 0.01 # a small coefficient is needed because CQ thinks that it cuts through emptiness
 				) -> cq.cq.Workplane:
-	node_radius = node_diameter / 2.0
-	# The following coordinates are based on permutations
-	# of the TCO:
-	# https://en.wikipedia.org/wiki/Truncated_cuboctahedron#Cartesian_coordinates
-	truncation = 0.5 *unit_cell_size * np.sqrt(2) / (1 + 2 * np.sqrt(2))
-	regular_octagon_side = unit_cell_size / (1 + 2 * np.sqrt(2))
-	# Creating a list of vertices for the octagon.
-	vertices = [
-		(truncation, 0, truncation*2),
-		(truncation, 0, truncation*2 + regular_octagon_side),
-		(2*truncation, 0, unit_cell_size - truncation),
-		(2*truncation + regular_octagon_side, 0, unit_cell_size - truncation),
-		(unit_cell_size - truncation, 0, truncation*2 + regular_octagon_side),
-		(unit_cell_size - truncation, 0, truncation*2),
-		(2*truncation + regular_octagon_side, 0, truncation),
-		(2*truncation, 0, truncation),
-	]
+	vertices = octagon_vertices(unit_cell_size)
 	# all edges:
-	result = cq.Workplane()
-	for v in vertices:
-		result = result.union(make_sphere(cq.Vector(v), node_radius))
+	result = union_all([node(node_diameter, v, 'sphere') for v in vertices])
 	return self.union(self.eachpoint(lambda loc: result.val().located(loc), True))
 cq.Workplane.create_nodes = create_nodes
 
@@ -261,58 +263,129 @@ def nodes_faces(node_diameter: float,
 	Returns:
 	  A CQ object.
 	"""
-	faces = cq.Workplane().create_nodes(node_diameter, unit_cell_size)
-	faces = faces.union(
+	# create_nodes is called directly: the other topologies replace cq.Workplane.create_nodes
+	faces = [create_nodes(cq.Workplane(), node_diameter, unit_cell_size)]
+	faces.append(create_nodes(
 		cq.Workplane()
 		.transformed(
-        	rotate = cq.Vector(0, 0, 90))
-		.create_nodes(node_diameter, unit_cell_size)
-	)
-	faces = faces.union(
+        	rotate = cq.Vector(0, 0, 90)),
+		node_diameter, unit_cell_size))
+	faces.append(create_nodes(
 		cq.Workplane()
 		.transformed(
         	offset = cq.Vector(unit_cell_size, 0, 0))
 		.transformed(
-        	rotate = cq.Vector(0, 0, 90))
-		.create_nodes(node_diameter, unit_cell_size)
-	)
-	faces = faces.union(
+        	rotate = cq.Vector(0, 0, 90)),
+		node_diameter, unit_cell_size))
+	faces.append(create_nodes(
 		cq.Workplane()
 		.transformed(
-        	offset = cq.Vector(0, unit_cell_size, 0))
-		.create_nodes(node_diameter, unit_cell_size)
-	)
-	faces = faces.union(
+        	offset = cq.Vector(0, unit_cell_size, 0)),
+		node_diameter, unit_cell_size))
+	faces.append(create_nodes(
 		cq.Workplane()
 		.transformed(
-        	rotate = cq.Vector(-90, 0, 0))
-		.create_nodes(node_diameter, unit_cell_size)
-	)
-	faces = faces.union(
+        	rotate = cq.Vector(-90, 0, 0)),
+		node_diameter, unit_cell_size))
+	faces.append(create_nodes(
 		cq.Workplane()
 		.transformed(
         	offset = cq.Vector(0, 0, unit_cell_size))
 		.transformed(
-        	rotate = cq.Vector(-90, 0, 0))
-		.create_nodes(node_diameter, unit_cell_size)
-	)
-	return faces
+        	rotate = cq.Vector(-90, 0, 0)),
+		node_diameter, unit_cell_size))
+	return union_all(faces)
 
 def unit_cell(location, unit_cell_size, strut_radius, node_diameter):
-	result = cq.Workplane("XY")
-	result = result.union(octagonal_faces(unit_cell_size, strut_radius))
-	result = result.union(square_faces(unit_cell_size, strut_radius))
-	result = result.union(nodes_faces(node_diameter, unit_cell_size, ))
+	result = union_all([octagonal_faces(unit_cell_size, strut_radius),
+						square_faces(unit_cell_size, strut_radius),
+						nodes_faces(node_diameter, unit_cell_size)])
 	return result.val().located(location)
 cq.Workplane.unit_cell = unit_cell
 
+# The chains of cq.Workplane.transformed (offset, rotation) of octagonal_faces
+# and nodes_faces, and of square_faces, relative to the unit cell size.
+OCTAGON_PLACEMENTS = [
+	[],
+	[((0, 0, 0), (0, 0, 90))],
+	[((1, 0, 0), (0, 0, 0)), ((0, 0, 0), (0, 0, 90))],
+	[((0, 1, 0), (0, 0, 0))],
+	[((0, 0, 0), (-90, 0, 0))],
+	[((0, 0, 1), (0, 0, 0)), ((0, 0, 0), (-90, 0, 0))],
+]
+SQUARE_PLACEMENTS = [
+	[],
+	[((0, 0, 0), (0, 0, 270)), ((-1, 0, 0), (0, 0, 0))],
+	[((1, 0, 0), (0, 0, 0)), ((0, 0, 0), (0, 0, 90))],
+	[((1, 1, 0), (0, 0, 0)), ((0, 0, 0), (0, 0, 180))],
+	[((0, 0, 1), (0, 0, 0)), ((0, 0, 0), (0, 90, 0))],
+	[((1, 1, 1), (0, 0, 0)), ((0, 0, 0), (0, 270, 0)), ((0, 0, 0), (0, 0, 180))],
+]
+
+def _place(points, placement, unit_cell_size):
+	"""
+	Maps points from the local coordinates of a chain of transformations
+	to the unit cell coordinates.
+	"""
+	points = np.asarray(points, dtype = float)
+	for offset, rotation in reversed(placement):
+		points = transform_points(points, rotation, unit_cell_size * np.asarray(offset, dtype = float))
+	return points
+
+def unit_cell_graph(unit_cell_size: float = 1.0):
+	"""
+	Returns the unit cell of unit_cell as a graph: the octagons and the square
+	edges placed on the faces of the unit cell, with a node at every vertex.
+
+	Args:
+	  unit_cell_size (float): The size of the unit cell.
+
+	Returns:
+	  The node coordinates (an (M, 3) array) and the node indices of the
+	  struts (an (E, 2) array).
+	"""
+	octagon = np.array(octagon_vertices(unit_cell_size))
+	octagon_edges = np.stack([octagon, np.roll(octagon, - 1, axis = 0)], axis = 1)
+	square = np.array(square_edge_points(unit_cell_size))
+	segments = ([_place(octagon_edges, p, unit_cell_size) for p in OCTAGON_PLACEMENTS]
+				+ [_place(square, p, unit_cell_size) for p in SQUARE_PLACEMENTS])
+	return segments_graph(np.concatenate(segments))
+
+def tco_heterogeneous_graph(unit_cell_size: float,
+							  min_strut_diameter: float,
+							  max_strut_diameter: float,
+							  min_node_diameter: float,
+							  max_node_diameter: float,
+							  Nx: int, Ny: int, Nz: int,
+							  rule: str = 'linear') -> tuple:
+	"""
+	Returns the lattice of tco_heterogeneous_lattice as a graph, with the struts
+	and nodes shared by neighbouring cells merged (see graph.lattice_graph).
+
+	Args:
+	  see tco_heterogeneous_lattice
+
+	Returns:
+	  The nodes (an (M, 3) array), the edges (an (E, 2) array), the strut radius
+	  of every edge and the node diameter of every node.
+	"""
+	indices, strut_radii, node_diameters = graded_cells(Nx, Ny, Nz,
+		min_strut_diameter, max_strut_diameter, min_node_diameter, max_node_diameter, rule)
+	return lattice_graph(unit_cell_graph(unit_cell_size),
+		cell_origins(indices, unit_cell_size),
+		strut_radii, node_diameters)
+
 def tco_heterogeneous_lattice(unit_cell_size: float,
 							  min_strut_diameter: float,
 							  max_strut_diameter: float,
 							  min_node_diameter: float,
 							  max_node_diameter: float,
 							  Nx: int, Ny: int, Nz: int,
-							  rule: str = 'linear') -> cq.cq.Workplane:
+							  rule: str = 'linear',
+							  cache: ShapeCache = UNIT_CELL_CACHE,
+							  workers: int = None,
+							  instanced: bool = False,
+							  deduplicate: bool = False) -> cq.cq.Workplane:
 	"""
 	The function creates a truncated
 	Cubeoctahedron (TCO) heterogeneous lattice structure
@@ -327,44 +400,37 @@ def tco_heterogeneous_lattice(unit_cell_size: float,
 	  Ny (int): number of unit cells in the y direction
 	  Nz (int): number of unit cells in the z direction
 	  truncation (float): the fraction of the strut length that is truncated
-	  rule (str): 'linear' or 'sin'. Defaults to linear
+	  rule (str): 'linear', 'sin' or 'parabola'. Defaults to linear
+	  cache (ShapeCache): cache of built unit cells, None disables caching
+	  workers (int): number of worker processes used to build the unit cells
+	  instanced (bool): return the cells as a single compound of located references
+	  deduplicate (bool): build the struts and nodes shared by neighbouring cells once,
+	    from the global graph of the lattice (see commons.deduplicated_lattice)
 	
 	Returns:
 	  The lattice is returned as a CQ object.
 	"""
-	min_strut_radius = min_strut_diameter / 2.0
-	max_strut_radius = max_strut_diameter / 2.0
-	if rule == 'linear':
-		strut_radii = np.linspace(min_strut_radius,
-	   		 					  max_strut_radius,
-		    					  Nz)
-		node_diameters = np.linspace(min_node_diameter,
-	    							 max_node_diameter,
-		    						 Nz)
-	elif rule == 'sin':
-		average = lambda num1, num2: (num1 + num2) / 2
-		strut_radii = np.sin(
-			np.linspace(min_strut_radius, max_strut_radius, Nz)*12) + 2*average(min_strut_radius, max_strut_radius)
-		node_diameters = np.sin(
-			np.linspace(min_node_diameter, max_node_diameter, Nz)*12) + 2*average(min_node_diameter, max_node_diameter)
-	else:
-		raise ValueError(f"Rule '{rule}' does not exist.")
-	UC_pnts = []
-	for i in range(Nx):
-		for j in range(Ny):
-			for k in range(Nz):
-				UC_pnts.append((i * unit_cell_size, j * unit_cell_size, k * unit_cell_size))
+	if deduplicate:
+		# every strut and node shared by neighbouring cells is built once
+		return deduplicated_lattice(tco_heterogeneous_graph(unit_cell_size,
+				min_strut_diameter, max_strut_diameter,
+				min_node_diameter, max_node_diameter,
+				Nx, Ny, Nz, rule),
+			cache, workers, instanced,
+			node_shape = 'sphere')
+	indices, strut_radii, node_diameters = graded_cells(Nx, Ny, Nz,
+		min_strut_diameter, max_strut_diameter, min_node_diameter, max_node_diameter, rule)
 	print("Datapoints generated")
 	result = cq.Workplane().tag('base')
-	result = result.pushPoints(UC_pnts)
-	unit_cell_params = []
-	for i in range(Nx * Ny):
-		for j in range(Nz):
-			unit_cell_params.append({"unit_cell_size": unit_cell_size,
-				"strut_radius": strut_radii[j],
-				"node_diameter": node_diameters[j]})
-	result = result.eachpointAdaptive(unit_cell,
+	result = result.pushPoints(cell_origins(indices, unit_cell_size).tolist())
+	unit_cell_params = cell_params(len(indices),
+		unit_cell_size = unit_cell_size,
+		strut_radius = strut_radii,
+		node_diameter = node_diameters)
+	result = result.eachpointAdaptive(cached(unit_cell, cache),
 									  callback_extra_args = unit_cell_params,
-									  useLocalCoords = True)
+									  useLocalCoords = True,
+									  workers = workers,
+									  instanced = instanced)
 	print("The lattice is generated")
 	return result
\ No newline at end of file
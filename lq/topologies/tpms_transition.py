@@ -6,6 +6,9 @@ import numpy as np
 from typing import List
 
 from ..commons import eachpointAdaptive
+from ..cache import UNIT_CELL_CACHE, ShapeCache, cached
+from ..grid import cell_indices, cell_origins, cell_params, graded, per_cell
+from ..primitives import cached_face
 from .gyroid import gyroid_000
 from .schwartz import schwartz_p_000
 
@@ -116,18 +119,16 @@ def p_half(self,
     return self.union(self.eachpoint(lambda loc: result.val().located(loc), True))
 cq.Workplane.p_half = p_half
 
-def transition(self, thickness: float, unit_cell_size: float
-    ) -> List[cq.cq.Workplane]:
+def _transition_faces(unit_cell_size: float) -> cq.Compound:
     """
-    It creates a transition between two unit cells of a gyroid and of a Schwarz
-    P surface
+    Fit the four surfaces of the transition between a gyroid and a Schwarz P
+    unit cell
     
     Args:
-      thickness (float): the thickness of the lattice
       unit_cell_size (float): the size of the unit cell in the x, y, and z directions
     
     Returns:
-      A cq.cq.Workplane object
+      A cq.Compound of the four faces
     """
     half_uc = 0.5 * unit_cell_size
     quarter_uc = 0.25 * unit_cell_size
@@ -171,9 +172,6 @@ def transition(self, thickness: float, unit_cell_size: float
     edge_wire = edge_wire.add(edge_wire.close())
     surface_points = [(0, 0, 0)]
     face_0 = cq.Workplane("XY").interpPlate(edge_wire, surface_points, 0).val()
-    plate_0 = (cq.Workplane("XY")
-               .add(face_0.thicken(0.5 * thickness))
-               .union(cq.Workplane("XY").add(face_0.thicken(-0.5 * thickness))))
     # transition 2
     gyroid_pnts = [
         (- half_uc, - half_uc),
@@ -213,10 +211,6 @@ def transition(self, thickness: float, unit_cell_size: float
     edge_wire = edge_wire.add(edge_wire.close())
     surface_points = [(0, 0, 0)]
     face_1 = cq.Workplane("XY").transformed(offset = (0, unit_cell_size, 0)).interpPlate(edge_wire, surface_points, 0).val()
-    plate_1 = (cq.Workplane("XY")
-               .add(face_1.thicken(0.5 * thickness))
-               .union(cq.Workplane("XY").add(face_1.thicken(-0.5 * thickness))))
-    result = plate_0.union(plate_1)
     # transition 3
     gyroid_pnts = [
         (half_uc, half_uc),
@@ -256,10 +250,6 @@ def transition(self, thickness: float, unit_cell_size: float
     edge_wire = edge_wire.add(edge_wire.close())
     surface_points = [(0, 0, 0)]
     face_2 = cq.Workplane("XY").transformed(offset = (0, 0, unit_cell_size)).interpPlate(edge_wire, surface_points, 0).val()
-    plate_2 = (cq.Workplane("XY")
-               .add(face_2.thicken(0.5 * thickness))
-               .union(cq.Workplane("XY").add(face_2.thicken(-0.5 * thickness))))
-    result = result.union(plate_2)
     # transition 4
     gyroid_pnts = [
         (- half_uc, - half_uc),
@@ -299,10 +289,29 @@ def transition(self, thickness: float, unit_cell_size: float
     edge_wire = edge_wire.add(edge_wire.close())
     surface_points = [(0, 0, 0)]
     face_3 = cq.Workplane("XY").transformed(offset = (0, unit_cell_size, unit_cell_size)).interpPlate(edge_wire, surface_points, 0).val()
-    plate_3 = (cq.Workplane("XY")
-               .add(face_3.thicken(0.5 * thickness))
-               .union(cq.Workplane("XY").add(face_3.thicken(-0.5 * thickness))))
-    result = result.union(plate_3)
+    return cq.Compound.makeCompound([face_0, face_1, face_2, face_3])
+
+def transition(self, thickness: float, unit_cell_size: float
+    ) -> List[cq.cq.Workplane]:
+    """
+    It creates a transition between two unit cells of a gyroid and of a Schwarz
+    P surface. The surface fits are cached per unit cell size.
+    
+    Args:
+      thickness (float): the thickness of the lattice
+      unit_cell_size (float): the size of the unit cell in the x, y, and z directions
+    
+    Returns:
+      A cq.cq.Workplane object
+    """
+    faces = cached_face('transition', _transition_faces, unit_cell_size)
+    plates = [(cq.Workplane("XY")
+               .add(face.thicken(0.5 * thickness))
+               .union(cq.Workplane("XY").add(face.thicken(-0.5 * thickness))))
+              for face in faces.Faces()]
+    result = plates[0]
+    for plate in plates[1:]:
+        result = result.union(plate)
     return self.union(self.eachpoint(lambda loc: result.val().located(loc), True))
 cq.Workplane.transition = transition
 
@@ -369,7 +378,10 @@ cq.Workplane.transition_unit_cell = transition_unit_cell
 def transition_layer(
     min_thickness: float, max_thickness: float, unit_cell_size: float, size_1: int, size_2: int,
     direction: str = 'X+',
-    rule: str = 'linear'
+    rule: str = 'linear',
+    cache: ShapeCache = UNIT_CELL_CACHE,
+    workers: int = None,
+    instanced: bool = False
     ):
     """
     It takes a thickness, unit cell size, and two sizes, and returns three objects: a gyroid, a p, and a
@@ -381,6 +393,9 @@ def transition_layer(
       size_1 (int): number of unit cells in the X direction
       size_2 (int): number of unit cells in the Y direction
       direction (str): the direction of the transition layer. Defaults to X
+      cache (ShapeCache): cache of built unit cells, None disables caching
+      workers (int): number of worker processes used to build the unit cells
+      instanced (bool): return the cells as a single compound of located references
     
     Returns:
       A tuple of three objects:
@@ -393,8 +408,7 @@ def transition_layer(
     cq.Workplane.gyroid_half_x = gyroid_half_x
     cq.Workplane.p_half = p_half
     cq.Workplane.transition = transition
-    if rule == 'linear':
-        thicknesses = np.linspace(min_thickness, max_thickness, size_2)
+    thicknesses = graded(min_thickness, max_thickness, size_2, rule)
     result = cq.Workplane()
     if direction == 'Y+':
         result = result.transformed(offset = (0, 0, unit_cell_size))
@@ -415,36 +429,35 @@ def transition_layer(
         result = result.transformed(offset = (0, unit_cell_size, 1.5 * unit_cell_size))
         result = result.transformed(rotate = (0, 0, -90))
         result = result.transformed(rotate = (0, 90, 0))
-    g_pnts = []
-    transition_pnts = []
-    for i in range(size_1):
-        for j in range(size_2):
-            g_pnts.append((0, i * unit_cell_size, j * unit_cell_size))
-            transition_pnts.append((0.5 * unit_cell_size, i * unit_cell_size, j * unit_cell_size))
+    indices = cell_indices(1, size_1, size_2)
+    g_pnts = cell_origins(indices, unit_cell_size).tolist()
+    transition_pnts = (cell_origins(indices, unit_cell_size)
+                       + (0.5 * unit_cell_size, 0, 0)).tolist()
     unit_cell_size *= 0.5 # because the unit cell is made of 8 smaller ones
-    unit_cell_params = []
-    for i in range(size_1):
-        for j in range(size_2):
-            unit_cell_params.append(
-                {
-                    "thickness": thicknesses[j],
-                    "unit_cell_size": unit_cell_size
-                })
+    unit_cell_params = cell_params(len(indices),
+        thickness = per_cell(thicknesses, indices),
+        unit_cell_size = unit_cell_size)
     g = result.pushPoints(g_pnts)
     g = g.eachpointAdaptive(
-        half_gyroid_unit_cell,
+        cached(half_gyroid_unit_cell, cache),
         callback_extra_args = unit_cell_params,
-        useLocalCoords = True)
+        useLocalCoords = True,
+        workers = workers,
+        instanced = instanced)
     p = result.pushPoints(transition_pnts)
     p = p.eachpointAdaptive(
-        half_p_unit_cell,
+        cached(half_p_unit_cell, cache),
         callback_extra_args = unit_cell_params,
-        useLocalCoords = True)
+        useLocalCoords = True,
+        workers = workers,
+        instanced = instanced)
     tr = result.pushPoints(g_pnts)
     tr = tr.eachpointAdaptive(
-        transition_unit_cell,
+        cached(transition_unit_cell, cache),
         callback_extra_args = unit_cell_params,
-        useLocalCoords = True)
+        useLocalCoords = True,
+        workers = workers,
+        instanced = instanced)
     if direction == 'Y+':
         g = g.mirror(mirrorPlane="YZ")
         p = p.mirror(mirrorPlane="YZ")
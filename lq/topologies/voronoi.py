@@ -0,0 +1,594 @@
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+import warnings
+
+import numpy as np
+from scipy.ndimage import map_coordinates
+from scipy.spatial import Voronoi, cKDTree
+
+import cadquery as cq
+
+from ..commons import graph_lattice
+
+# Stochastic foams: the struts are the edges of the Voronoi cells of a set of seeds.
+# The ridges of scipy.spatial.Voronoi are processed as flat NumPy arrays into one graph
+# (see lq.graph), which the graph based engines build, mesh or export in one pass.
+# Large seed sets are split into tiles (see tiled_voronoi_graph), each computed from its own
+# seeds and a halo of neighbouring seeds, so that no global diagram is ever held in memory.
+# The ends of the edges are merged by the seeds of their vertices (see vertex_seeds), so the
+# tiles give the graph of the global diagram whatever the round-off in each of them.
+# Graded foams take their seeds from poisson_disk_seeds, whose density follows a field.
+
+def random_seeds(n: int, lower = (0, 0, 0), upper = (1, 1, 1), seed = None) -> np.ndarray:
+    """
+    Uniformly random seeds in a box.
+
+    :param n: number of seeds
+    :param lower: lower corner of the box
+    :param upper: upper corner of the box
+    :param seed: seed of the random generator (np.random.default_rng)
+    :return: an (n, 3) array
+    """
+    lower = np.asarray(lower, dtype = float)
+    upper = np.asarray(upper, dtype = float)
+    return lower + np.random.default_rng(seed).random((n, 3)) * (upper - lower)
+
+def _density_values(density, points, lower, upper) -> np.ndarray:
+    """
+    The density at points: density is a number, a function of an (N, 3) array of points or
+    a 3D array of values on a regular grid spanning the box (interpolated linearly).
+    """
+    if callable(density):
+        return np.broadcast_to(np.asarray(density(points), dtype = float), (len(points),))
+    density = np.asarray(density, dtype = float)
+    if density.ndim == 0:
+        return np.full(len(points), float(density))
+    if density.ndim != 3:
+        raise ValueError("Expected a number, a function or a 3D array of densities, "
+                         f"got an array of shape {density.shape}")
+    coordinates = (points - lower) / (upper - lower) * (np.array(density.shape) - 1)
+    return map_coordinates(density, coordinates.T, order = 1, mode = 'nearest')
+
+def neighbour_pairs(points, others, cell: float):
+    """
+    The pairs of points and others in the same or in neighbouring cells of a grid hash,
+    i.e. all pairs closer than cell (and some farther ones).
+
+    :param points: an (N, 3) array
+    :param others: an (M, 3) array
+    :param cell: size of the cells of the grid
+    :return: the indices of the points and of the others of every pair
+    """
+    if not len(points) or not len(others):
+        return np.zeros(0, dtype = np.int64), np.zeros(0, dtype = np.int64)
+    cells = np.floor(points / cell).astype(np.int64)
+    other_cells = np.floor(others / cell).astype(np.int64)
+    # one empty layer of cells around the points, so that the neighbours of a cell exist
+    origin = np.minimum(cells.min(axis = 0), other_cells.min(axis = 0)) - 1
+    cells -= origin
+    other_cells -= origin
+    shape = tuple(np.maximum(cells.max(axis = 0), other_cells.max(axis = 0)) + 2)
+    other_keys = np.ravel_multi_index(tuple(other_cells.T), shape)
+    order = np.argsort(other_keys, kind = 'stable')
+    other_keys = other_keys[order]
+    first, second = [], []
+    for offset in itertools.product((-1, 0, 1), repeat = 3):
+        keys = np.ravel_multi_index(tuple((cells + offset).T), shape)
+        start = np.searchsorted(other_keys, keys, 'left')
+        counts = np.searchsorted(other_keys, keys, 'right') - start
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        first.append(np.repeat(np.arange(len(points)), counts))
+        second.append(order[np.repeat(start, counts) + local])
+    return np.concatenate(first), np.concatenate(second)
+
+def _poisson_disk_tile(stream, tile_lower, tile_upper, density, lower, upper, scale, density_max,
+                       spacing, fixed, fixed_radius, rounds):
+    """
+    Dart throwing in a tile. Every round throws candidates with a density proportional to
+    density_max (thinned down to the density) and keeps those farther than the mean of the
+    two radii from the seeds so far and from the earlier candidates of the round.
+
+    :return: the seeds of the tile and their radii
+    """
+    rng = np.random.default_rng(stream)
+    size = tile_upper - tile_lower
+    batch = max(int(np.ceil(density_max * np.prod(size))), 1)
+    points, radius = fixed, fixed_radius
+    for _ in range(rounds):
+        candidates = tile_lower + rng.random((batch, 3)) * size
+        rho = scale * _density_values(density, candidates, lower, upper)
+        kept = rng.random(batch) * density_max < rho
+        candidates, rho = candidates[kept], rho[kept]
+        candidates_radius = spacing * rho ** (- 1 / 3)
+        if not len(candidates):
+            continue
+        cell = max(candidates_radius.max(), radius.max(initial = 0))
+        i, j = neighbour_pairs(candidates, points, cell)
+        close = (np.linalg.norm(candidates[i] - points[j], axis = 1) <
+                 0.5 * (candidates_radius[i] + radius[j]))
+        free = np.ones(len(candidates), dtype = bool)
+        free[i[close]] = False
+        candidates, candidates_radius = candidates[free], candidates_radius[free]
+        # of two close candidates the earlier one wins
+        i, j = neighbour_pairs(candidates, candidates, cell)
+        close = (i > j) & (np.linalg.norm(candidates[i] - candidates[j], axis = 1) <
+                           0.5 * (candidates_radius[i] + candidates_radius[j]))
+        free = np.ones(len(candidates), dtype = bool)
+        free[i[close]] = False
+        points = np.concatenate([points, candidates[free]])
+        radius = np.concatenate([radius, candidates_radius[free]])
+    return points[len(fixed):], radius[len(fixed):]
+
+def _poisson_disk_worker(payload):
+    return _poisson_disk_tile(*payload)
+
+def poisson_disk_seeds(lower,
+    upper,
+    density = None,
+    n: int = None,
+    tiles = (1, 1, 1),
+    seed = None,
+    spacing: float = 0.78,
+    rounds: int = 8,
+    workers: int = None
+) -> np.ndarray:
+    """
+    Blue noise seeds whose density follows a field, for graded stochastic foams. The seeds
+    are thrown as darts with a radius of spacing * density^(-1/3) around each, checked
+    against each other through a grid hash.
+
+    The box is split into tiles with their own random streams (np.random.SeedSequence.spawn),
+    filled in eight passes of tiles that do not touch each other, each against the seeds of
+    the tiles filled before. The seeds then only depend on seed and tiles, not on workers.
+
+    :param lower: lower corner of the box
+    :param upper: upper corner of the box
+    :param density: number of seeds per unit volume: a number, a function of an (N, 3) array
+        of points or a 3D array of values on a regular grid spanning the box. By default uniform
+    :param n: approximate number of seeds, scales density
+    :param tiles: number of tiles along X, Y and Z
+    :param seed: seed of the random streams
+    :param spacing: distance between the seeds relative to density^(-1/3)
+    :param rounds: number of rounds of darts per tile
+    :param workers: number of worker processes filling the tiles (density has to be picklable,
+        e.g. a module level function). If None or 1, the tiles are filled serially
+    :return: an (N, 3) array
+    """
+    lower = np.asarray(lower, dtype = float)
+    upper = np.asarray(upper, dtype = float)
+    if density is None and n is None:
+        raise ValueError("Either a density or a number of seeds is needed")
+    density = 1.0 if density is None else density
+    tile_lower, tile_upper = tile_boxes(lower, upper, tiles)
+    tiles = np.broadcast_to(np.asarray(tiles, dtype = int), (3,))
+    streams = np.random.SeedSequence(seed).spawn(len(tile_lower) + 1)
+
+    # the scale and the bounds of the density from a sample of the box
+    sample = lower + np.random.default_rng(streams[-1]).random((4096, 3)) * (upper - lower)
+    values = _density_values(density, sample, lower, upper)
+    if (values < 0).any() or not (values > 0).any():
+        raise ValueError("The density has to be positive")
+    scale = 1.0 if n is None else n / (values.mean() * np.prod(upper - lower))
+    if not callable(density) and np.ndim(density) == 3:
+        values = np.asarray(density, dtype = float).ravel()
+    density_max = scale * values.max()
+    reach = spacing * (scale * values[values > 0].min()) ** (- 1 / 3)
+    if ((tile_upper[0] - tile_lower[0] < reach) & (tiles > 1)).any():
+        raise ValueError(f"The tiles have to be larger than the distance between the seeds ({reach:.3g})")
+
+    points, radius = np.zeros((0, 3)), np.zeros(0)
+    index = np.stack(np.unravel_index(np.arange(len(tile_lower)), tuple(tiles)), axis = 1)
+    phase = np.ravel_multi_index(tuple((index % 2).T), (2, 2, 2))
+    for current in range(8):
+        payloads = []
+        for tile in np.flatnonzero(phase == current):
+            near = _box_distance(points, tile_lower[tile], tile_upper[tile]) < max(reach, radius.max(initial = 0))
+            payloads.append((streams[tile], tile_lower[tile], tile_upper[tile], density, lower, upper,
+                             scale, density_max, spacing, points[near], radius[near], rounds))
+        if workers is not None and workers > 1 and len(payloads) > 1:
+            with ProcessPoolExecutor(max_workers = workers) as executor:
+                results = list(executor.map(_poisson_disk_worker, payloads))
+        else:
+            results = [_poisson_disk_worker(p) for p in payloads]
+        points = np.concatenate([points] + [r[0] for r in results])
+        radius = np.concatenate([radius] + [r[1] for r in results])
+    return points
+
+def ridge_edges(ridge_vertices, return_ridges: bool = False):
+    """
+    The edges of the Voronoi ridges: the sides of the ridge polygons (scipy lists the
+    vertices of a 3D ridge in order around it), every edge once. The sides that reach
+    to infinity (vertex -1) are dropped.
+
+    :param ridge_vertices: Voronoi.ridge_vertices
+    :param return_ridges: also return a ridge of every edge
+    :return: an (E, 2) array of vertex indices (and the (E, ) ridge indices)
+    """
+    lengths = np.fromiter(map(len, ridge_vertices), dtype = np.int64, count = len(ridge_vertices))
+    flat = np.fromiter(itertools.chain.from_iterable(ridge_vertices), dtype = np.int64,
+                       count = int(lengths.sum()))
+    # the next vertex of every vertex of a ridge, the last one is followed by the first
+    following = np.arange(1, len(flat) + 1)
+    following[np.cumsum(lengths) - 1] = np.cumsum(lengths) - lengths
+    edges = np.sort(np.stack([flat, flat[following]], axis = 1), axis = 1)
+    kept = (edges[:, 0] >= 0) & (edges[:, 0] != edges[:, 1])
+    edges = edges[kept]
+    ridges = np.repeat(np.arange(len(lengths)), lengths)[kept]
+    # one integer per edge is much faster to make unique than the rows
+    _, first = np.unique(edges[:, 0] * (flat.max(initial = 0) + 1) + edges[:, 1], return_index = True)
+    return (edges[first], ridges[first]) if return_ridges else edges[first]
+
+def vertex_seeds(ridge_points, ridge_vertices, n_vertices: int) -> np.ndarray:
+    """
+    The seeds whose cells meet at every Voronoi vertex (generically four). They identify a
+    vertex independently of the round-off in its coordinates, e.g. in the diagrams of
+    different tiles.
+
+    :param ridge_points: Voronoi.ridge_points
+    :param ridge_vertices: Voronoi.ridge_vertices
+    :param n_vertices: number of Voronoi vertices
+    :return: a (V, K) array of seed indices, every row sorted and padded with -1 in front
+    """
+    ridge_points = np.asarray(ridge_points, dtype = np.int64)
+    lengths = np.fromiter(map(len, ridge_vertices), dtype = np.int64, count = len(ridge_vertices))
+    flat = np.fromiter(itertools.chain.from_iterable(ridge_vertices), dtype = np.int64,
+                       count = int(lengths.sum()))
+    # every vertex of a ridge with both seeds of the ridge
+    vertex = np.repeat(flat, 2)
+    seed = ridge_points[np.repeat(np.arange(len(lengths)), lengths)].ravel()
+    kept = vertex >= 0
+    n_seeds = int(ridge_points.max(initial = 0)) + 1
+    vertex, seed = np.divmod(np.unique(vertex[kept] * n_seeds + seed[kept]), n_seeds)
+    counts = np.bincount(vertex, minlength = n_vertices)
+    width = max(int(counts.max(initial = 0)), 1)
+    keys = np.full((n_vertices, width), -1, dtype = np.int64)
+    # the seeds of a vertex are right aligned in its row
+    column = width - counts[vertex] + np.arange(len(vertex)) - np.repeat(np.cumsum(counts) - counts, counts)
+    keys[vertex, column] = seed
+    return keys
+
+def _global_keys(keys, seed_index) -> np.ndarray:
+    """
+    Vertex keys with the seeds renumbered by seed_index, sorted again.
+    """
+    return np.sort(np.where(keys >= 0, seed_index[keys], -1), axis = 1)
+
+def _pad(keys, width: int) -> np.ndarray:
+    """
+    Pads key rows with -1 in front to a width.
+    """
+    padding = np.full((len(keys), width - keys.shape[1]), -1, dtype = np.int64)
+    return np.concatenate([padding, keys], axis = 1)
+
+def _end_keys(first, second, faces) -> np.ndarray:
+    """
+    The keys of the ends of edges: the seeds of the vertex, or for an end clipped to the box,
+    the face of the box and the seeds of the edge (those shared by its two vertices). The
+    vertex beyond a clipped end may differ between tiles, the edge it lies on does not.
+
+    :param first: the keys of the first vertices of the edges, an (E, K) array
+    :param second: the keys of the second vertices of the edges, an (E, K) array
+    :param faces: an (E, 2) array of the faces at which the ends were clipped, see clip_segments
+    :return: a (2 E, K + 1) array
+    """
+    shared = (first[:, :, None] == second[:, None, :]).any(axis = 2) & (first >= 0)
+    edge = np.sort(np.where(shared, first, -1), axis = 1)
+    ends = np.stack([np.where(faces[:, :1] >= 0, edge, first),
+                     np.where(faces[:, 1:] >= 0, edge, second)], axis = 1)
+    return np.concatenate([faces[:, :, None] + 1, ends], axis = 2).reshape(-1, first.shape[1] + 1)
+
+def weld(segments, end_keys):
+    """
+    Merges the ends of segments with the same key into the nodes of a graph.
+
+    :param segments: an (E, 2, 3) array of end points
+    :param end_keys: a (2 E, K) array, a key of every end
+    :return: nodes (an (M, 3) array, each at the first of its ends) and edges (an (E', 2) array)
+    """
+    _, first, inverse = np.unique(end_keys, axis = 0, return_index = True, return_inverse = True)
+    nodes = np.asarray(segments, dtype = float).reshape(-1, 3)[first]
+    edges = np.unique(np.sort(inverse.reshape(-1, 2), axis = 1), axis = 0)
+    return nodes, edges[edges[:, 0] != edges[:, 1]]
+
+def _far_seeds(seeds, lower, upper) -> np.ndarray:
+    """
+    Eight seeds far around the seeds and the box. With them every edge between the seeds
+    is finite, also where scipy would give a ray to infinity (at the convex hull of the
+    seeds), while their own cells are far outside the box.
+    """
+    box_lower = np.minimum(seeds.min(axis = 0), lower)
+    box_upper = np.maximum(seeds.max(axis = 0), upper)
+    corners = np.stack(np.meshgrid(*[[-1, 1]] * 3, indexing = 'ij'), axis = -1).reshape(-1, 3)
+    return 0.5 * (box_lower + box_upper) + 10 * np.linalg.norm(box_upper - box_lower) * corners
+
+def clip_segments(segments, lower, upper, return_faces: bool = False):
+    """
+    Clips segments to a box (Liang-Barsky).
+
+    :param segments: an (N, 2, 3) array of end points
+    :param lower: lower corner of the box
+    :param upper: upper corner of the box
+    :param return_faces: also return the faces of the box at which the ends were clipped
+    :return: the clipped segments and a mask of the segments that cross the box (and an
+        (M, 2) array of the faces, 2 * axis for the lower and 2 * axis + 1 for the upper face
+        of the box, -1 for the ends that were not moved)
+    """
+    segments = np.asarray(segments, dtype = float)
+    start = segments[:, 0]
+    axis = segments[:, 1] - start
+    lower = np.asarray(lower, dtype = float)
+    upper = np.asarray(upper, dtype = float)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        t1 = (lower - start) / axis
+        t2 = (upper - start) / axis
+    parallel = axis == 0
+    inside = (start >= lower) & (start <= upper)
+    # a segment parallel to a slab is either always or never inside it
+    t_min = np.where(parallel, np.where(inside, - np.inf, np.inf), np.minimum(t1, t2))
+    t_max = np.where(parallel, np.where(inside, np.inf, - np.inf), np.maximum(t1, t2))
+    t_enter = np.maximum(t_min.max(axis = 1), 0)
+    t_exit = np.minimum(t_max.min(axis = 1), 1)
+    kept = t_enter < t_exit
+    t_enter, t_exit, start, axis = t_enter[kept], t_exit[kept], start[kept], axis[kept]
+    clipped = np.stack([start + t_enter[:, None] * axis, start + t_exit[:, None] * axis], axis = 1)
+    if not return_faces:
+        return clipped, kept
+    rows = np.arange(len(clipped))
+    enter_axis = t_min[kept].argmax(axis = 1)
+    exit_axis = t_max[kept].argmin(axis = 1)
+    # a segment enters through a lower face along the directions it goes up
+    faces = np.stack([np.where(t_enter > 0, 2 * enter_axis + (axis[rows, enter_axis] < 0), -1),
+                      np.where(t_exit < 1, 2 * exit_axis + (axis[rows, exit_axis] > 0), -1)], axis = 1)
+    return clipped, kept, faces
+
+def ridge_graph(vertices, edges, keys, lower, upper, clip: bool = True):
+    """
+    Trims the Voronoi edges to a box and merges them into a graph. The ends are merged by
+    the seeds of the vertices (see vertex_seeds), not by their coordinates, so that short
+    edges are kept and the same diagram computed from different seed sets gives the same graph.
+
+    :param vertices: Voronoi.vertices
+    :param edges: the edges of ridge_edges
+    :param keys: the seeds of every vertex, see vertex_seeds
+    :param lower: lower corner of the box
+    :param upper: upper corner of the box
+    :param clip: clip the edges that cross the boundary of the box, otherwise only the edges
+        inside the box are kept
+    :return: nodes and edges
+    """
+    segments, edges, faces = _trimmed(vertices, edges, lower, upper, clip)
+    return weld(segments, _end_keys(keys[edges[:, 0]], keys[edges[:, 1]], faces))
+
+def _trimmed(vertices, edges, lower, upper, clip: bool):
+    """
+    The segments of the edges trimmed to a box, the edges kept and the faces at which their
+    ends were clipped (see clip_segments).
+    """
+    segments = np.asarray(vertices, dtype = float)[edges]
+    if clip:
+        segments, kept, faces = clip_segments(segments, lower, upper, return_faces = True)
+    else:
+        kept = ((segments >= lower) & (segments <= upper)).all(axis = (1, 2))
+        segments = segments[kept]
+        faces = np.full((len(segments), 2), -1)
+    return segments, edges[kept], faces
+
+def voronoi_graph(seeds,
+    lower = None,
+    upper = None,
+    clip: bool = True
+):
+    """
+    The graph of the edges of the Voronoi cells of seeds, trimmed to a box.
+
+    :param seeds: an (N, 3) array of seeds
+    :param lower: lower corner of the box, by default of the bounding box of the seeds
+    :param upper: upper corner of the box, by default of the bounding box of the seeds
+    :param clip: clip the edges that cross the boundary of the box (with nodes on the
+        boundary), otherwise only the edges inside the box are kept
+    :return: nodes (an (M, 3) array) and edges (an (E, 2) array)
+    """
+    seeds = np.asarray(seeds, dtype = float).reshape(-1, 3)
+    lower = seeds.min(axis = 0) if lower is None else np.asarray(lower, dtype = float)
+    upper = seeds.max(axis = 0) if upper is None else np.asarray(upper, dtype = float)
+    vor = Voronoi(np.concatenate([seeds, _far_seeds(seeds, lower, upper)]))
+    keys = vertex_seeds(vor.ridge_points, vor.ridge_vertices, len(vor.vertices))
+    return ridge_graph(vor.vertices, ridge_edges(vor.ridge_vertices), keys, lower, upper, clip)
+
+def tile_boxes(lower, upper, tiles):
+    """
+    Splits a box into a grid of tiles.
+
+    :param lower: lower corner of the box
+    :param upper: upper corner of the box
+    :param tiles: number of tiles along X, Y and Z
+    :return: the lower and upper corners of every tile (two (T, 3) arrays, X slowest)
+    """
+    lower = np.asarray(lower, dtype = float)
+    upper = np.asarray(upper, dtype = float)
+    tiles = np.broadcast_to(np.asarray(tiles, dtype = int), (3,))
+    if (tiles < 1).any():
+        raise ValueError(f"The number of tiles must be positive, got {tuple(tiles)}")
+    index = np.stack(np.meshgrid(*[np.arange(n) for n in tiles], indexing = 'ij'), axis = -1).reshape(-1, 3)
+    size = (upper - lower) / tiles
+    return lower + index * size, lower + (index + 1) * size
+
+def _box_distance(points, lower, upper) -> np.ndarray:
+    """
+    Distance from points to a box, 0 inside.
+    """
+    return np.linalg.norm(np.maximum(np.maximum(lower - points, points - upper), 0), axis = 1)
+
+def _halo_widths(seeds, tile_lower, tile_upper, neighbours: int = 8, scale: float = 2.0) -> np.ndarray:
+    """
+    A halo width for every tile from the local spacing of the seeds (cKDTree): scale times
+    the largest distance from the seeds in the tile to their neighbours-th nearest seed and
+    from a grid of points in the tile to their nearest seed. The empty spheres at the ends of
+    the edges crossing the tile are about as large as these distances.
+    """
+    tree = cKDTree(seeds)
+    k = min(neighbours + 1, len(seeds))
+    spacing = tree.query(seeds, [k])[0][:, 0]
+    grid = np.stack(np.meshgrid(*[np.linspace(0, 1, 5)] * 3, indexing = 'ij'), axis = -1).reshape(-1, 3)
+    widths = np.empty(len(tile_lower))
+    for tile in range(len(tile_lower)):
+        inside = ((seeds >= tile_lower[tile]) & (seeds <= tile_upper[tile])).all(axis = 1)
+        empty = tree.query(tile_lower[tile] + grid * (tile_upper[tile] - tile_lower[tile]))[0]
+        widths[tile] = scale * max(spacing[inside].max(initial = 0), empty.max())
+    return widths
+
+def _tile_edges(seeds, seed_index, far_seeds, tile, tile_lower, tile_upper, halo_lower, halo_upper,
+                seeds_lower, seeds_upper, lower, upper, tiles, clip):
+    """
+    The Voronoi edges owned by a tile, computed from the seeds of the tile and its halo.
+    An edge is owned by the tile of the midpoint of its trimmed segment.
+
+    Leaving seeds out can only make edges longer, so an edge trimmed to the box is exact if
+    the empty spheres at its trimmed ends meet no part of the bounding box of the seeds
+    outside the halo. The result is valid if this holds for every edge crossing the tile,
+    i.e. if the halo is at least as wide as the width returned.
+
+    :return: the owned segments (an (E, 2, 3) array), the keys of their vertices with the
+        global seed indices seed_index (two (E, K) arrays), the faces at which their ends were
+        clipped and the width of the halo needed by the edges crossing the tile
+    """
+    seeds = np.concatenate([seeds, far_seeds])
+    vor = Voronoi(seeds)
+    keys = _global_keys(vertex_seeds(vor.ridge_points, vor.ridge_vertices, len(vor.vertices)),
+                        seed_index)
+    edges, ridges = ridge_edges(vor.ridge_vertices, return_ridges = True)
+    clipped, kept = clip_segments(vor.vertices[edges], lower, upper)
+    _, crossing = clip_segments(clipped, tile_lower, tile_upper)
+    # a seed of the ridge of an edge is at the distance of the empty spheres along it
+    ends = clipped[crossing]
+    ends_seed = seeds[vor.ridge_points[ridges[kept][crossing], 0]]
+    radius = np.linalg.norm(ends - ends_seed[:, None], axis = 2).ravel()
+    ends = ends.reshape(-1, 3)
+    needed = 0.0
+    # the bounding box of the seeds outside the halo is made of up to six slabs. A sphere
+    # reaches depth into a slab along an axis from the faces of the slab along the others
+    for axis in range(3):
+        others = [a for a in range(3) if a != axis]
+        depth = np.sqrt(np.maximum(radius ** 2 -
+            _box_distance(ends[:, others], seeds_lower[others], seeds_upper[others]) ** 2, 0))
+        for outwards, tile_face, seeds_face in ((1, tile_upper[axis], seeds_upper[axis]),
+                                                (-1, tile_lower[axis], seeds_lower[axis])):
+            # the slab ends at the face of the seeds, a wider halo leaves no slab at all
+            beyond = outwards * (ends[:, axis] - seeds_face)
+            meets = (depth > 0) & (beyond < depth)
+            reach = np.minimum(outwards * (ends[:, axis] - tile_face) + depth,
+                               outwards * (seeds_face - tile_face))
+            needed = max(needed, reach[meets].max(initial = 0))
+
+    segments, edges, faces = _trimmed(vor.vertices, edges, lower, upper, clip)
+    size = (upper - lower) / tiles
+    owner = np.clip(np.floor((segments.mean(axis = 1) - lower) / size).astype(int), 0, tiles - 1)
+    owned = (owner == tile).all(axis = 1)
+    edges = edges[owned]
+    return segments[owned], keys[edges[:, 0]], keys[edges[:, 1]], faces[owned], needed
+
+def _tile_worker(payload):
+    return _tile_edges(*payload)
+
+def tiled_voronoi_graph(seeds,
+    lower = None,
+    upper = None,
+    tiles = (2, 2, 2),
+    halo: float = None,
+    clip: bool = True,
+    workers: int = None
+):
+    """
+    The graph of voronoi_graph, computed tile by tile: the Voronoi diagram of every tile is
+    computed from the seeds in the tile and in a halo around it, and only the edges owned by
+    the tile are kept. The memory is then bounded by the size of a tile and the tiles can be
+    computed in parallel. A tile whose halo is too thin to fix its edges is computed again with
+    a halo as wide as its edges need (with a warning). The ends shared by tiles are merged by
+    their seeds, so the graph is the one of voronoi_graph.
+
+    :param seeds: an (N, 3) array of seeds
+    :param lower: lower corner of the box, by default of the bounding box of the seeds
+    :param upper: upper corner of the box, by default of the bounding box of the seeds
+    :param tiles: number of tiles along X, Y and Z
+    :param halo: width of the halo. By default it is sized for every tile from the distances
+        between the seeds in and around it
+    :param clip: clip the edges that cross the boundary of the box, see voronoi_graph
+    :param workers: number of worker processes. If None or 1, the tiles are computed serially
+    :return: nodes (an (M, 3) array) and edges (an (E, 2) array)
+    """
+    seeds = np.asarray(seeds, dtype = float).reshape(-1, 3)
+    seeds_lower, seeds_upper = seeds.min(axis = 0), seeds.max(axis = 0)
+    lower = seeds_lower if lower is None else np.asarray(lower, dtype = float)
+    upper = seeds_upper if upper is None else np.asarray(upper, dtype = float)
+    tiles = np.broadcast_to(np.asarray(tiles, dtype = int), (3,))
+    tile_lower, tile_upper = tile_boxes(lower, upper, tiles)
+    far_seeds = _far_seeds(seeds, lower, upper)
+    far_index = len(seeds) + np.arange(len(far_seeds))
+    if halo is None:
+        widths = _halo_widths(seeds, tile_lower, tile_upper)
+    else:
+        widths = np.full(len(tile_lower), float(halo))
+
+    def payload(tile, width):
+        halo_lower = tile_lower[tile] - width
+        halo_upper = tile_upper[tile] + width
+        inside = np.flatnonzero(((seeds >= halo_lower) & (seeds <= halo_upper)).all(axis = 1))
+        index = np.unravel_index(tile, tuple(tiles))
+        return (seeds[inside], np.concatenate([inside, far_index]), far_seeds, index,
+                tile_lower[tile], tile_upper[tile], halo_lower, halo_upper, seeds_lower,
+                seeds_upper, lower, upper, tiles, clip)
+
+    payloads = (payload(tile, widths[tile]) for tile in range(len(tile_lower)))
+    if workers is not None and workers > 1 and len(tile_lower) > 1:
+        with ProcessPoolExecutor(max_workers = workers) as executor:
+            results = list(executor.map(_tile_worker, payloads))
+    else:
+        results = [_tile_worker(p) for p in payloads]
+    for tile, result in enumerate(results):
+        while result[-1] > widths[tile]:
+            # the edges of a wider halo may need a bit more again
+            widths[tile] = 1.25 * result[-1]
+            warnings.warn(f'The halo of tile {tile} is too thin, widening it to {widths[tile]:.3g}')
+            result = _tile_worker(payload(tile, widths[tile]))
+        results[tile] = result
+    width = max(r[1].shape[1] for r in results)
+    segments = np.concatenate([r[0] for r in results])
+    first = np.concatenate([_pad(r[1], width) for r in results])
+    second = np.concatenate([_pad(r[2], width) for r in results])
+    faces = np.concatenate([r[3] for r in results])
+    return weld(segments, _end_keys(first, second, faces))
+
+def voronoi_lattice(seeds,
+    strut_radius: float,
+    node_diameter: float = None,
+    lower = None,
+    upper = None,
+    clip: bool = True,
+    node_shape: str = 'sphere',
+    fuse: bool = False,
+    tiles = None,
+    workers: int = None
+) -> cq.cq.Workplane:
+    """
+    Builds a Voronoi foam: a strut on every edge of the Voronoi cells of seeds, all built in
+    one pass by commons.graph_lattice.
+
+    :param seeds: an (N, 3) array of seeds, e.g. random_seeds
+    :param strut_radius: radius of the struts
+    :param node_diameter: diameter of the nodes, None for no nodes
+    :param lower: lower corner of the box the foam is trimmed to
+    :param upper: upper corner of the box the foam is trimmed to
+    :param clip: clip the edges that cross the boundary of the box
+    :param node_shape: 'box' or 'sphere'
+    :param fuse: fuse the struts and nodes into one solid
+    :param tiles: number of tiles along X, Y and Z to compute the diagram tile by tile (see
+        tiled_voronoi_graph), None for one global diagram
+    :param workers: number of worker processes computing the tiles
+    :return: a Workplane with the struts and nodes (or the fused foam) on its stack
+    """
+    if tiles is None:
+        nodes, edges = voronoi_graph(seeds, lower, upper, clip)
+    else:
+        nodes, edges = tiled_voronoi_graph(seeds, lower, upper, tiles, clip = clip, workers = workers)
+    return graph_lattice(nodes, edges, strut_radius, node_diameter,
+                         node_shape = node_shape, fuse = fuse)
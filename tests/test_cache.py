@@ -0,0 +1,61 @@
+import pickle
+
+import numpy as np
+import pytest
+import cadquery as cq
+
+from lq.cache import UNIT_CELL_CACHE, ShapeCache, cached, make_key
+from lq.topologies.bcc import bcc_heterogeneous_lattice
+
+def box(location, side = 1.0):
+
+    return cq.Solid.makeBox(side, side, side).located(location)
+
+def test_keys_ignore_round_off():
+
+    assert make_key(0.1 + 0.2, side = np.float64(1.0)) == make_key(0.3, side = 1)
+    assert make_key(-0.0) == make_key(0.0)
+    assert make_key(np.array([1.0, 2.0])) == make_key([1, 2])
+
+def test_least_recently_used_shape_is_evicted():
+
+    cache = ShapeCache(maxsize = 2)
+    cache.get('a', lambda: box(cq.Location()))
+    cache.get('b', lambda: box(cq.Location()))
+    cache.get('a', lambda: None)
+    cache.get('c', lambda: box(cq.Location()))
+
+    assert 'a' in cache and 'c' in cache and 'b' not in cache
+    assert cache.info() == {'hits': 1, 'misses': 3, 'size': 2, 'maxsize': 2}
+
+def test_cached_cells_share_their_geometry():
+
+    cache = ShapeCache()
+    cell = cached(box, cache)
+
+    first = cell(cq.Location(cq.Vector(1, 0, 0)), side = 2.0)
+    second = cell(cq.Location(cq.Vector(0, 3, 0)), side = 2.0)
+
+    assert first.wrapped.IsPartner(second.wrapped)
+    assert second.Center().toTuple() == pytest.approx((1, 4, 1))
+    assert cache.info()['misses'] == 1 and cache.info()['hits'] == 1
+    assert cached(box, None) is box
+
+def test_pickled_cell_gets_a_local_cache():
+
+    private = pickle.loads(pickle.dumps(cached(box, ShapeCache(maxsize = 7))))
+    shared = pickle.loads(pickle.dumps(cached(box)))
+
+    assert private.cache.maxsize == 7 and len(private.cache) == 0
+    assert shared.cache is UNIT_CELL_CACHE
+
+def test_cached_lattice_is_the_uncached_lattice():
+
+    cache = ShapeCache()
+    cells = bcc_heterogeneous_lattice(5, 1, 1, 1.2, 1.2, 2, 2, 1, cache = cache).vals()
+    uncached = bcc_heterogeneous_lattice(5, 1, 1, 1.2, 1.2, 2, 2, 1, cache = None).vals()
+
+    assert cache.info()['misses'] == 1 and cache.info()['hits'] == 3
+    assert [c.Volume() for c in cells] == pytest.approx([c.Volume() for c in uncached], rel = 1e-9)
+    np.testing.assert_allclose([c.Center().toTuple() for c in cells],
+                               [c.Center().toTuple() for c in uncached], atol = 1e-9)
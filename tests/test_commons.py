@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+import cadquery as cq
+
+from lq.cache import ShapeCache
+from lq.commons import distinct_instances, eachpointAdaptive, union_all
+from lq.topologies.bcc import bcc_heterogeneous_lattice
+from lq.topologies.cubic import cubic_heterogeneous_lattice
+
+ARGS = (5, 1, 1, 1.2, 1.2, 2, 1, 1)
+
+def box(location, side = 1.0):
+
+    return cq.Solid.makeBox(side, side, side).located(location)
+
+def placed_boxes(**kwargs):
+
+    points = [(3 * i, 0, 0) for i in range(4)]
+    return cq.Workplane().pushPoints(points).eachpointAdaptive(box, useLocalCoords = True, **kwargs).vals()
+
+def test_pooled_cells_are_the_serial_cells():
+
+    serial = bcc_heterogeneous_lattice(5, 1, 2, 1.2, 2.2, 1, 1, 3).vals()
+    pooled = bcc_heterogeneous_lattice(5, 1, 2, 1.2, 2.2, 1, 1, 3, workers = 2).vals()
+
+    assert [c.Volume() for c in pooled] == pytest.approx([c.Volume() for c in serial], rel = 1e-9)
+    np.testing.assert_allclose([c.Center().toTuple() for c in pooled],
+                               [c.Center().toTuple() for c in serial], atol = 1e-9)
+
+def test_pooled_identical_cells_are_imported_once():
+
+    shapes = placed_boxes(callback_extra_args = {'side': 2.0}, workers = 2, chunksize = 1)
+
+    assert all(shape.wrapped.IsPartner(shapes[0].wrapped) for shape in shapes)
+    assert [s.Center().x for s in shapes] == pytest.approx([1, 4, 7, 10])
+
+def test_unpicklable_callback_falls_back_to_serial():
+
+    with pytest.warns(UserWarning, match = 'serial'):
+        shapes = cq.Workplane().pushPoints([(0, 0, 0), (3, 0, 0)]).eachpointAdaptive(
+            lambda location: box(location), useLocalCoords = True, workers = 2).vals()
+
+    assert len(shapes) == 2
+
+def test_deduplicated_lattice_is_the_cell_lattice():
+
+    deduplicated = bcc_heterogeneous_lattice(*ARGS, deduplicate = True)
+    cells = bcc_heterogeneous_lattice(*ARGS)
+
+    assert union_all(deduplicated.vals()).val().Volume() == \
+        pytest.approx(union_all(cells.vals()).val().Volume(), rel = 1e-6)
+
+def test_deduplicated_lattice_is_instanced():
+
+    struts = bcc_heterogeneous_lattice(*ARGS, deduplicate = True).vals()
+    compound = bcc_heterogeneous_lattice(*ARGS, deduplicate = True, instanced = True).vals()
+
+    assert len(compound) == 1 and isinstance(compound[0], cq.Compound)
+    assert len(list(compound[0])) == len(struts)
+
+@pytest.mark.parametrize('options', [{'workers': 2}, {'cache': ShapeCache()}])
+def test_deduplicated_lattice_rejects_cell_options(options):
+
+    with pytest.raises(ValueError):
+        cubic_heterogeneous_lattice(*ARGS, deduplicate = True, **options)
+
+@pytest.mark.parametrize('strategy', ['single', 'tree'])
+def test_union_all_is_the_union_chain(strategy):
+
+    boxes = [cq.Workplane().box(2, 2, 2).translate((x, 0, 0)) for x in (0, 1, 2.5, 3)]
+    chain = boxes[0]
+    for b in boxes[1:]:
+        chain = chain.union(b)
+
+    fused = union_all(boxes, strategy)
+
+    assert len(fused.val().Solids()) == 1
+    assert fused.val().Volume() == pytest.approx(chain.val().Volume(), rel = 1e-9)
+
+def test_union_all_rejects_unknown_strategies():
+
+    with pytest.raises(ValueError):
+        union_all([cq.Workplane().box(1, 1, 1), cq.Workplane().box(1, 1, 1)], 'random')
+
+def test_instanced_lattice_groups_the_distinct_cells():
+
+    cells = bcc_heterogeneous_lattice(5, 1, 2, 1.2, 2.2, 2, 1, 2).vals()
+    instanced = bcc_heterogeneous_lattice(5, 1, 2, 1.2, 2.2, 2, 1, 2, instanced = True).vals()
+
+    assert len(instanced) == 1 and len(list(instanced[0])) == 4
+    assert instanced[0].Volume() == pytest.approx(sum(c.Volume() for c in cells), rel = 1e-6)
+    groups = distinct_instances(instanced[0])
+    assert sorted(len(locations) for _, locations in groups) == [2, 2]
+    origins = sorted(tuple(np.round(l.toTuple()[0], 9)) for _, locations in groups for l in locations)
+    assert origins == [(0, 0, 0), (0, 0, 5), (5, 0, 0), (5, 0, 5)]
+
+def test_columnar_arguments_are_taken_per_point():
+
+    shapes = placed_boxes(callback_extra_args = {'side': np.array([1.0, 2.0, 3.0, 4.0])})
+
+    assert [s.Volume() for s in shapes] == pytest.approx([1, 8, 27, 64])
+
+def test_missing_argument_sets_are_empty():
+
+    shapes = placed_boxes(callback_extra_args = [{'side': 2.0}])
+
+    assert [s.Volume() for s in shapes] == pytest.approx([8, 1, 1, 1])
+
+def test_columns_have_one_value_per_point():
+
+    with pytest.raises(ValueError):
+        placed_boxes(callback_extra_args = {'side': np.array([1.0, 2.0])})
@@ -0,0 +1,147 @@
+from math import pi
+
+import numpy as np
+import pytest
+
+from lq.commons import distinct_instances, union_all
+from lq.properties import cylinder_in_sphere
+from lq.topologies.conformal import (JOINT_SCALE, conformal_graph, conformal_lattice, cylinder,
+                                     cylindrical_map, parametric_graph, spherical_map, toroidal_map)
+
+# A cell with a single strut along the angle of the cylindrical map: its lattice is a ring.
+RING = ([(0, 0, 0), (0, 1, 0)], [(0, 1)])
+
+def test_maps_of_known_points():
+
+    np.testing.assert_allclose(cylindrical_map([(2, 90, 1), (1, 180, 0)]), [(0, 2, 1), (-1, 0, 0)],
+                               atol = 1e-12)
+    np.testing.assert_allclose(spherical_map([(2, 0, 45), (1, 90, 90)]), [(0, 0, 2), (0, 1, 0)],
+                               atol = 1e-12)
+    np.testing.assert_allclose(toroidal_map([(1, 90, 0), (1, 180, 90)], 5), [(5, 0, 1), (0, 4, 0)],
+                               atol = 1e-12)
+
+def test_cylindrical_grid_is_merged_at_360_degrees():
+
+    nodes, edges, segments, radius, diameter = parametric_graph((1, 8, 1), (1, 0, 0), (2, 360, 1), 0.1)
+
+    # 2 radii, 8 angles and 2 heights, the struts along r, theta (around) and z
+    assert len(nodes) == 2 * 8 * 2
+    assert len(edges) == 8 * 2 + 2 * 8 * 2 + 2 * 8
+    assert len(np.unique(np.sort(edges, axis = 1), axis = 0)) == len(edges)
+    assert diameter is None
+    np.testing.assert_allclose(radius, 0.1)
+    # the struts that close the ring keep their parametric end points
+    assert segments[..., 1].max() == pytest.approx(360)
+
+def test_spherical_grid_is_merged_at_the_poles():
+
+    nodes, edges, _, _, _ = parametric_graph((1, 2, 4), (1, 0, 0), (2, 180, 360), 0.1,
+                                             mapping = 'spherical')
+
+    # 2 radii, the two poles and a ring of 4 nodes at the equator; the struts along phi at the
+    # poles are points and dropped
+    assert len(nodes) == 2 * (2 + 4)
+    assert len(edges) == (2 + 4) + 2 * (2 * 4 + 4)
+    assert np.all(edges[:, 0] != edges[:, 1])
+
+def test_shared_struts_keep_the_largest_radius():
+
+    _, edges, segments, radius, diameter = parametric_graph((1, 4, 1), (1, 0, 0), (2, 360, 1),
+                                                            [0.1, 0.2, 0.3, 0.4], [1, 2, 3, 4])
+
+    # the struts along r and z between cells 0 (at 0 degrees) and 3 (at 270 degrees)
+    between = np.isclose(segments[..., 1], 0).all(axis = 1) | np.isclose(segments[..., 1], 360).all(axis = 1)
+    assert between.sum() == 4
+    np.testing.assert_allclose(radius[between], 0.4)
+    np.testing.assert_allclose(np.unique(diameter), [2, 3, 4])
+
+def test_struts_are_split_within_the_tolerance():
+
+    nodes, edges, radius, diameter = conformal_graph((1, 8, 1), (10, 0, 0), (11, 360, 1), 0.2,
+                                                     cell_graph = RING, tolerance = 0.01)
+
+    # the pieces are chords of the circle of radius 10
+    np.testing.assert_allclose(np.linalg.norm(nodes[:, :2], axis = 1), 10)
+    chord = np.linalg.norm(nodes[edges[:, 0]] - nodes[edges[:, 1]], axis = 1)
+    assert np.all(10 - np.sqrt(100 - chord ** 2 / 4) <= 0.01)
+    assert len(edges) > 8
+    np.testing.assert_allclose(radius, 0.2)
+    # the lattice nodes have no diameter, the joints inside the struts the one of their strut
+    assert np.count_nonzero(diameter == 0) == 8
+    np.testing.assert_allclose(diameter[diameter > 0], 0.4)
+
+def test_straight_struts_with_joints():
+
+    lattice = conformal_lattice((1, 1, 2), (0, 0, 0), (1, 1, 2), 0.2, mapping = lambda p: p,
+                                cell_graph = ([(0, 0, 0), (0, 0, 1)], [(0, 1)])).vals()
+
+    # two struts joined by a sphere in the middle, the free ends are flat
+    joint = JOINT_SCALE / 2 * 0.2
+    inside, _, _ = cylinder_in_sphere(0.2, joint)
+    assert len(lattice) == 1 and lattice[0].isValid()
+    assert lattice[0].Volume() == pytest.approx(pi * 0.04 * 2 + 4 / 3 * pi * joint ** 3 - 2 * inside,
+                                                rel = 1e-6)
+
+def test_ring_of_arcs_is_a_torus_with_joints():
+
+    lattice = conformal_lattice((1, 8, 1), (10, 0, 0), (11, 360, 1), 0.2, cell_graph = RING).vals()
+
+    # the joints are small enough next to the circle for the arcs to be straight inside them
+    joint = JOINT_SCALE / 2 * 0.2
+    inside, _, _ = cylinder_in_sphere(0.2, joint)
+    torus = 2 * pi ** 2 * 10 * 0.04
+    assert len(lattice) == 1 and lattice[0].isValid()
+    assert lattice[0].Volume() == pytest.approx(torus + 8 * (4 / 3 * pi * joint ** 3 - 2 * inside),
+                                                rel = 1e-4)
+
+def test_unknown_maps_are_rejected():
+
+    with pytest.raises(ValueError):
+        parametric_graph((1, 4, 1), (1, 0, 0), (2, 360, 1), 0.1, mapping = 'toroidal')
+    with pytest.raises(TypeError):
+        parametric_graph((1, 4, 1), (1, 0, 0), (2, 360, 1), 0.1, mapping = 'conical')
+
+def test_sectors_match_the_whole_cylinder():
+
+    whole = cylinder(1, 45, 2, 1, 0.1, 0.2, 2, 4).val()
+
+    fused = cylinder(1, 45, 2, 1, 0.1, 0.2, 2, 4, sectors = 'fused').vals()
+    instanced = cylinder(1, 45, 2, 1, 0.1, 0.2, 2, 4, sectors = 'instanced').val()
+
+    assert len(fused) == 1 and fused[0].isValid() and len(fused[0].Solids()) == 1
+    assert fused[0].Volume() == pytest.approx(whole.Volume(), rel = 1e-5)
+    # the 8 sectors share one fused sector, they overlap where they meet
+    groups = distinct_instances(instanced)
+    assert len(groups) == 1 and len(groups[0][1]) == 8
+    assert union_all(list(instanced)).val().Volume() == pytest.approx(whole.Volume(), rel = 1e-5)
+
+def test_sectors_build_the_poles_once():
+
+    args = (1, 2, 4), (1, 0, 0), (2, 180, 360), 0.1
+
+    whole = conformal_lattice(*args, mapping = 'spherical').val()
+    fused = conformal_lattice(*args, mapping = spherical_map, sectors = 'fused', periodic_coordinate = 2,
+                              periodic_axis = (0, 0, 1)).vals()
+
+    assert len(fused) == 1 and len(fused[0].Solids()) == 1
+    assert fused[0].Volume() == pytest.approx(whole.Volume(), rel = 1e-5)
+
+def test_sectors_need_a_lattice_all_around():
+
+    with pytest.raises(ValueError):
+        conformal_lattice((1, 4, 1), (1, 0, 0), (2, 360, 1), 0.1, sectors = 'turned')
+    with pytest.raises(ValueError):
+        conformal_lattice((1, 4, 1), (1, 0, 0), (2, 360, 1), 0.1, fuse = False, sectors = 'fused')
+    with pytest.raises(ValueError):
+        conformal_lattice((1, 4, 1), (1, 0, 0), (2, 360, 1), 0.1, mapping = cylindrical_map,
+                          sectors = 'instanced')
+    with pytest.raises(ValueError):
+        conformal_lattice((1, 4, 1), (1, 0, 0), (2, 180, 1), 0.1, sectors = 'instanced')
+
+@pytest.mark.parametrize('radius', [[0.1, 0.1, 0.1, 0.3], lambda points: 0.1 + 0.001 * points[:, 1]])
+def test_sectors_need_the_same_radii_at_every_angle(radius):
+
+    with pytest.raises(ValueError):
+        conformal_lattice((1, 4, 1), (1, 0, 0), (2, 360, 1), radius, sectors = 'fused')
+    with pytest.raises(ValueError):
+        conformal_lattice((1, 4, 1), (1, 0, 0), (2, 360, 1), 0.1, [1, 1, 2, 1], sectors = 'instanced')
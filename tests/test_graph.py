@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+import cadquery as cq
+
+from lq.graph import lattice_graph, merge_graph, segments_graph, strut_segment, tile_cell_graphs
+from lq.primitives import strut
+from lq.topologies import cubic, diamond, rco, tcubic
+
+def as_tuple(value):
+
+    return value.toTuple() if isinstance(value, cq.Vector) else tuple(value)
+
+def edge_set(nodes, edges):
+
+    points = np.round(np.asarray(nodes)[np.asarray(edges)], 6) + 0.0
+    return {tuple(sorted(map(tuple, edge))) for edge in points.tolist()}
+
+def test_strut_segment_is_the_strut_axis():
+
+    placed = strut(0.25, 3, (30, -45, 60), (1, 2, 3))
+    ends = sorted(placed.Faces(), key = lambda f: f.Area())[:2]
+
+    segment = strut_segment(3, (30, -45, 60), (1, 2, 3))
+
+    np.testing.assert_allclose(sorted(f.Center().toTuple() for f in ends), sorted(segment.tolist()),
+                               atol = 1e-9)
+
+def test_segments_are_merged_and_split_at_nodes():
+
+    segments = [[(0, 0, 0), (2, 0, 0)], [(2, 0, 0), (0, 0, 0)], [(1, -1, 0), (1, 1, 1e-12)]]
+
+    nodes, edges = segments_graph(segments, [(1, 0, 0), (5, 5, 5)])
+
+    assert edge_set(nodes, edges) == {((0, 0, 0), (1, 0, 0)), ((1, 0, 0), (2, 0, 0)),
+                                      ((1, -1, 0), (1, 0, 0)), ((1, 0, 0), (1, 1, 0))}
+    # the given nodes are kept even if no strut passes through them
+    assert len(nodes) == 6
+
+# The cells that place their struts at absolute offsets; the volumes of all the fused
+# graphs are checked against the cells in test_topologies.
+@pytest.mark.parametrize('module, parameter', [(cubic, 'cubic'), (diamond, 'diamond'),
+                                               (rco, 0.3), (tcubic, 0.3)])
+def test_unit_cell_graph_is_the_unit_cell(module, parameter, monkeypatch):
+
+    segments = []
+
+    def recorded(radius, length, rotation = (0, 0, 0), offset = (0, 0, 0), *args, **kwargs):
+        segments.append(strut_segment(length, as_tuple(rotation), as_tuple(offset)))
+        return strut(radius, length, rotation, offset, *args, **kwargs)
+
+    monkeypatch.setattr(module, 'strut', recorded)
+    module.unit_cell(cq.Location(), 5, 0.5, 1.2, parameter)
+
+    nodes, edges = module.unit_cell_graph(5, parameter)
+
+    # the struts of the cell split where they cross the nodes of the graph
+    assert edge_set(*segments_graph(segments, nodes)) == edge_set(nodes, edges)
+
+def test_shared_struts_and_nodes_are_merged():
+
+    graph = cubic.unit_cell_graph(1)
+
+    nodes, edges, radii, diameters = lattice_graph(graph, [(0, 0, 0), (1, 0, 0)], [0.1, 0.2], [0.3, 0.4])
+
+    assert len(nodes) == 12 and len(edges) == 20
+    shared = np.isclose(nodes[edges][:, :, 0], 1).all(axis = 1)
+    assert shared.sum() == 4
+    np.testing.assert_allclose(radii[shared], 0.2)
+    np.testing.assert_allclose(radii[~shared & (nodes[edges][:, :, 0] < 1).any(axis = 1)], 0.1)
+    np.testing.assert_allclose(diameters, np.where(nodes[:, 0] < 1, 0.3, 0.4))
+
+def test_cell_graphs_are_built_once_per_value():
+
+    calls = []
+
+    def graph(truncation):
+        calls.append(truncation)
+        return rco.unit_cell_graph(1, truncation)
+
+    nodes, edges, edge_cell, node_cell = tile_cell_graphs(graph, [(0, 0, 0), (1, 0, 0), (2, 0, 0)],
+                                                          [0.3, 0.5, 0.3])
+
+    assert sorted(calls) == [0.3, 0.5]
+    assert len(edges) == 3 * 48 and len(nodes) == 3 * 24
+    for cell, x in enumerate([0, 1, 2]):
+        np.testing.assert_allclose(nodes[node_cell == cell, 0].min(), x)
+        assert np.all(node_cell[edges[edge_cell == cell]] == cell)
+
+def test_merged_edges_keep_their_largest_value():
+
+    nodes = [(0, 0, 0), (1, 0, 0), (1 + 1e-12, 0, 0), (0, 0, 0)]
+
+    merged, edges, values, _ = merge_graph(nodes, [(0, 1), (2, 3), (1, 2)], [0.1, 0.3, 0.5])
+
+    assert len(merged) == 2
+    np.testing.assert_array_equal(edges, [[0, 1]])
+    np.testing.assert_allclose(values, [0.3])
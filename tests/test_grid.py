@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from lq.grid import (cell_field, cell_indices, cell_origins, cell_params, evaluate_field, graded,
+                     graded_cells, per_cell, volume_field)
+from lq.topologies import rco, tcubic
+
+def test_cells_are_in_the_order_of_the_builders():
+
+    indices = cell_indices(2, 3, 4)
+    loops = [(i, j, k) for i in range(2) for j in range(3) for k in range(4)]
+
+    np.testing.assert_array_equal(indices, loops)
+    np.testing.assert_allclose(cell_origins(indices, 2.5), 2.5 * np.array(loops))
+
+def test_rules_are_those_of_the_builders():
+
+    # the formulas the strut builders used before the rules were shared
+    x = np.linspace(0, 1, 5)
+    np.testing.assert_allclose(graded(0.5, 1.0, 5), np.linspace(0.5, 1.0, 5))
+    np.testing.assert_allclose(graded(0.5, 1.0, 5, 'sin'), np.sin(np.linspace(0.5, 1.0, 5) * 12) + 1.5)
+    np.testing.assert_allclose(graded(0.5, 1.0, 5, 'parabola'), - 4 * 1.0 * (x - 0.5) ** 2 + 1.5)
+    with pytest.raises(ValueError):
+        graded(0.5, 1.0, 5, 'cubic')
+
+def test_per_cell_takes_the_layer_values():
+
+    indices = cell_indices(2, 1, 3)
+
+    np.testing.assert_array_equal(per_cell([10, 20, 30], indices), [10, 20, 30, 10, 20, 30])
+    np.testing.assert_array_equal(per_cell([10, 20], indices, 'X'), [10, 10, 10, 20, 20, 20])
+
+def test_cell_params_check_the_columns():
+
+    params = cell_params(3, size = 5, radius = np.array([1.0, 2.0, 3.0]))
+
+    assert params['size'] == 5 and len(params['radius']) == 3
+    with pytest.raises(ValueError):
+        cell_params(3, radius = np.array([1.0, 2.0]))
+
+def test_graded_cells_follow_the_axis():
+
+    indices, strut_radii, node_diameters = graded_cells(3, 2, 4, 1, 2, 1.5, 2.5, axis = 'x')
+
+    np.testing.assert_array_equal(indices, cell_indices(3, 2, 4))
+    np.testing.assert_allclose(strut_radii, np.linspace(0.5, 1, 3)[indices[:, 0]])
+    np.testing.assert_allclose(node_diameters, per_cell(graded(1.5, 2.5, 3), indices, 'x'))
+
+def test_graded_cells_reject_an_unknown_axis():
+
+    with pytest.raises(ValueError):
+        graded_cells(2, 2, 2, 1, 2, 1, 2, axis = 'w')
+
+@pytest.mark.parametrize('build', [rco.rco_heterogeneous_graph, rco.rco_heterogeneous_lattice,
+                                   tcubic.tcubic_heterogeneous_graph, tcubic.tcubic_heterogeneous_lattice])
+@pytest.mark.parametrize('truncations', [(1.5, 0.5), (0.5, -0.5)])
+def test_truncations_out_of_range_are_rejected(build, truncations):
+
+    with pytest.raises(ValueError):
+        build(5, 1, 1, 1.2, 1.2, 1, 1, 2, *truncations)
+
+def test_graph_and_cells_share_the_grading():
+
+    nodes, edges, strut_radii, node_diameters = tcubic.tcubic_heterogeneous_graph(
+        5, 1, 2, 1.2, 2.2, 3, 1, 1, 0.2, 0.2, direction = 'X')
+
+    # the struts are graded along X
+    assert strut_radii.min() == pytest.approx(0.5) and strut_radii.max() == pytest.approx(1)
+    assert np.isin(np.round(strut_radii, 9), np.linspace(0.5, 1, 3)).all()
+
+def test_volume_field_interpolates_linear_data():
+
+    axis = np.linspace(0, 1, 3)
+    x, y, z = np.meshgrid(axis, axis, axis, indexing = 'ij')
+    field = volume_field(x + 2 * y - z, (0, 0, 0), (2, 2, 2))
+
+    points = np.array([[0.3, 1.7, 0.2], [2, 2, 2], [5, -1, 0]])
+    expected = [0.15 + 1.7 - 0.1, 1 + 2 - 1, 1 + 0 - 0]
+    np.testing.assert_allclose(field(*points.T), expected)
+
+def test_cell_field_is_clipped_and_quantized():
+
+    indices = cell_indices(3, 1, 1)
+
+    values = cell_field(lambda x, y, z: x / 10, indices, 2.0, max_value = 0.4, step = 0.25)
+
+    # x / 10 at the centers is 0.1, 0.3 and 0.5, clipped to 0.4
+    np.testing.assert_allclose(values, [0, 0.25, 0.5])
+    with pytest.raises(ValueError):
+        evaluate_field(np.zeros((2, 2, 2)), 0, 0, 0)
@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+from lq.implicit import blend, tpms_distance, tpms_mesh
+from lq.mesh import marching_tetrahedra, mesh_volume
+
+# Areas of the surfaces per cubic unit cell of side 1.
+SURFACE_AREAS = {'gyroid': 3.0915, 'schwarz_p': 2.3451, 'schwarz_d': 3.8377}
+
+def assert_watertight(faces):
+
+    edges = np.sort(faces[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis = 1)
+    _, counts = np.unique(edges, axis = 0, return_counts = True)
+    assert np.all(counts == 2)
+
+def test_sphere_is_meshed_watertight_and_outward():
+
+    axis = np.linspace(-1.5, 1.5, 61)
+    x, y, z = np.meshgrid(axis, axis, axis, indexing = 'ij')
+
+    vertices, faces = marching_tetrahedra(np.sqrt(x * x + y * y + z * z) - 1, axis[[0, 0, 0]], axis[1] - axis[0])
+
+    assert_watertight(faces)
+    assert mesh_volume(vertices, faces) == pytest.approx(4 / 3 * np.pi, rel = 1e-2)
+
+@pytest.mark.parametrize('surface', sorted(SURFACE_AREAS))
+def test_thin_sheet_volume_is_area_times_thickness(surface):
+
+    vertices, faces = tpms_mesh(surface, (1, 1, 1), 1, 0.05, resolution = 64)
+
+    assert_watertight(faces)
+    assert mesh_volume(vertices, faces) == pytest.approx(SURFACE_AREAS[surface] * 0.05, rel = 0.04)
+
+@pytest.mark.parametrize('surface', sorted(SURFACE_AREAS))
+def test_network_fills_half_of_the_box(surface):
+
+    vertices, faces = tpms_mesh(surface, (2, 2, 2), 2, 0.0, 'network', resolution = 32)
+
+    assert_watertight(faces)
+    assert mesh_volume(vertices, faces) == pytest.approx(4, rel = 0.02)
+
+def test_lattice_is_trimmed_to_the_box():
+
+    vertices, faces = tpms_mesh('gyroid', (3, 2, 1), 1, 0.1, origin = (1, 2, 3))
+
+    # the vertices are kept a thousandth of the spacing off the samples
+    np.testing.assert_allclose(vertices.min(axis = 0), (1, 2, 3), atol = 1e-4)
+    np.testing.assert_allclose(vertices.max(axis = 0), (4, 4, 4), atol = 1e-4)
+
+def test_unknown_surfaces_and_kinds_are_rejected():
+
+    with pytest.raises(ValueError):
+        tpms_mesh('neovius', (1, 1, 1), 1)
+    with pytest.raises(ValueError):
+        tpms_mesh('gyroid', (1, 1, 1), 1, kind = 'shell')
+
+def test_thickness_fields_match_a_constant_thickness():
+
+    constant = mesh_volume(*tpms_mesh('gyroid', (1, 1, 1), 1, 0.05, resolution = 32))
+
+    function = mesh_volume(*tpms_mesh('gyroid', (1, 1, 1), 1, lambda x, y, z: np.full(np.shape(x), 0.05),
+                                      resolution = 32))
+    volume = mesh_volume(*tpms_mesh('gyroid', (1, 1, 1), 1, np.full((2, 3, 4), 0.05), resolution = 32))
+
+    assert function == pytest.approx(constant, rel = 1e-12)
+    assert volume == pytest.approx(constant, rel = 1e-12)
+
+def test_graded_thickness_gives_the_mean_thickness():
+
+    graded = tpms_mesh('schwarz_p', (2, 2, 2), 1, lambda x, y, z: 0.02 + 0.03 * x, resolution = 48)
+
+    assert mesh_volume(*graded) == pytest.approx(8 * SURFACE_AREAS['schwarz_p'] * 0.05, rel = 0.04)
+
+def test_blend_is_each_surface_away_from_the_transition():
+
+    transition = blend('gyroid', 'schwarz_p', point = (5, 0, 0), width = 0.5)
+    x, y, z = np.random.default_rng(0).random((3, 100))
+
+    np.testing.assert_allclose(transition(x, y, z, 1), tpms_distance('gyroid', x, y, z, 1), atol = 1e-12)
+    np.testing.assert_allclose(transition(x + 9, y, z, 1), tpms_distance('schwarz_p', x + 9, y, z, 1),
+                               atol = 1e-12)
+
+def test_blended_lattice_is_between_its_surfaces():
+
+    transition = blend('gyroid', blend('schwarz_p', 'schwarz_d', (0, 0, 2)), (0, 0, 1), (0, 0, 1))
+
+    vertices, faces = tpms_mesh(transition, (3, 3, 3), 1, 0.1, resolution = 24)
+
+    assert_watertight(faces)
+    parts = [mesh_volume(*tpms_mesh(s, (3, 3, 1), 1, 0.1, resolution = 24))
+             for s in ('gyroid', 'schwarz_p', 'schwarz_d')]
+    assert min(parts) * 3 < mesh_volume(vertices, faces) < max(parts) * 3
+
+def test_blend_needs_a_direction_and_a_width():
+
+    with pytest.raises(ValueError):
+        blend('gyroid', 'schwarz_p', direction = (0, 0, 0))
+    with pytest.raises(ValueError):
+        blend('gyroid', 'schwarz_p', width = 0)
@@ -0,0 +1,150 @@
+import re
+import zipfile
+import xml.etree.ElementTree as ElementTree
+
+import numpy as np
+import pytest
+
+from lq import implicit, mesh
+from lq.implicit import tpms_mesh, tpms_stream
+from lq.mesh import (BALLS_NAMESPACE, BEAM_LATTICE_NAMESPACE, MODEL_NAMESPACE, ThreeMfWriter,
+                     mesh_volume, write_beam_lattice)
+from lq.topologies.bcc import bcc_heterogeneous_graph
+
+def read_3mf(path):
+
+    with zipfile.ZipFile(path) as archive:
+        model = archive.read('3D/3dmodel.model').decode()
+    vertices = np.array(re.findall(r'<vertex x="([^"]+)" y="([^"]+)" z="([^"]+)"/>', model), dtype = float)
+    faces = np.array(re.findall(r'<triangle v1="(\d+)" v2="(\d+)" v3="(\d+)"/>', model), dtype = np.int64)
+    return vertices.reshape(-1, 3), faces.reshape(-1, 3)
+
+def read_stl(path):
+
+    with open(path, 'rb') as file:
+        data = file.read()
+    count = int.from_bytes(data[80:84], 'little')
+    record = np.dtype([('normal', '<f4', (3,)), ('vertices', '<f4', (3, 3)), ('attribute', '<u2')])
+    return np.frombuffer(data, dtype = record, offset = 84, count = count)['vertices']
+
+def assert_watertight(faces):
+
+    edges = np.sort(faces[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis = 1)
+    _, counts = np.unique(edges, axis = 0, return_counts = True)
+    assert np.all(counts == 2)
+
+@pytest.fixture
+def writers(monkeypatch):
+
+    created = []
+    def recording_writer(path, **kwargs):
+        writer = mesh.mesh_writer(path, **kwargs)
+        created.append(writer)
+        return writer
+    monkeypatch.setattr(implicit, 'mesh_writer', recording_writer)
+    return created
+
+def test_streamed_3mf_is_the_whole_mesh(tmp_path, writers):
+
+    path = str(tmp_path / 'gyroid.3mf')
+    args = ('gyroid', (10, 10, 10), 5, 0.5)
+
+    count = tpms_stream(path, *args, resolution = 12, brick = 7)
+    vertices, faces = read_3mf(path)
+    whole_vertices, whole_faces = tpms_mesh(*args, resolution = 12)
+
+    assert count == len(faces) == len(whole_faces)
+    assert len(vertices) == len(whole_vertices)
+    assert_watertight(faces)
+    assert mesh_volume(vertices, faces) == pytest.approx(mesh_volume(whole_vertices, whole_faces), rel = 1e-5)
+    assert writers[0]._shared == {} and writers[0]._remaining == {}
+
+def test_streamed_stl_is_the_whole_mesh(tmp_path):
+
+    path = str(tmp_path / 'gyroid.stl')
+    args = ('schwarz_p', (10, 10, 10), 5, 0.5)
+
+    count = tpms_stream(path, *args, resolution = 12, brick = 7)
+    triangles = read_stl(path)
+    whole_vertices, whole_faces = tpms_mesh(*args, resolution = 12)
+
+    assert count == len(triangles) == len(whole_faces)
+    volume = np.einsum('ij,ij->i', triangles[:, 0], np.cross(triangles[:, 1], triangles[:, 2])).sum() / 6
+    assert volume == pytest.approx(mesh_volume(whole_vertices, whole_faces), rel = 1e-4)
+
+def test_3mf_writer_forgets_the_last_copy(tmp_path):
+
+    vertices = np.array([[0, 0, 0], [1, 0, 0], [0, 1, 0]], dtype = float)
+    faces = np.array([[0, 1, 2]])
+
+    with ThreeMfWriter(str(tmp_path / 'chunks.3mf')) as writer:
+        writer.add(vertices, faces, keys = [1, 2, 3], copies = [1, 2, 3])
+        assert sorted(writer._shared) == [2, 3]
+        writer.add(vertices, faces, keys = [4, 2, 3], copies = [1, 2, 3])
+        assert sorted(writer._shared) == [3]
+        writer.add(vertices, faces, keys = [5, 6, 3], copies = [1, 1, 3])
+        assert writer._shared == {}
+
+    read_vertices, read_faces = read_3mf(str(tmp_path / 'chunks.3mf'))
+    assert len(read_vertices) == 6
+    np.testing.assert_array_equal(read_faces, [[0, 1, 2], [3, 1, 2], [4, 5, 2]])
+
+def test_3mf_writer_keeps_shared_vertices_without_copies(tmp_path):
+
+    vertices = np.array([[0, 0, 0], [1, 0, 0], [0, 1, 0]], dtype = float)
+
+    with ThreeMfWriter(str(tmp_path / 'chunks.3mf')) as writer:
+        writer.add(vertices, np.array([[0, 1, 2]]), keys = [1, 2, 3])
+        writer.add(vertices, np.array([[0, 1, 2]]), keys = [1, 2, 4])
+
+        assert writer.n_vertices == 4
+        assert sorted(writer._shared) == [1, 2, 3, 4]
+
+def read_beam_lattice(path):
+
+    with zipfile.ZipFile(path) as archive:
+        root = ElementTree.fromstring(archive.read('3D/3dmodel.model'))
+    namespaces = {'m': MODEL_NAMESPACE, 'b': BEAM_LATTICE_NAMESPACE, 'b2': BALLS_NAMESPACE}
+    vertices = np.array([[float(v.get(axis)) for axis in 'xyz']
+                         for v in root.iterfind('.//m:vertex', namespaces)])
+    beams = np.array([[float(b.get(key)) for key in ('v1', 'v2', 'r1', 'r2')]
+                      for b in root.iterfind('.//b:beam', namespaces)])
+    balls = np.array([[float(b.get(key)) for key in ('vindex', 'r')]
+                      for b in root.iterfind('.//b2:ball', namespaces)])
+    return root, vertices, beams, balls
+
+def test_beam_lattice_is_the_graph(tmp_path):
+
+    nodes, edges, radii, diameters = bcc_heterogeneous_graph(5, 1, 2, 1.2, 1.6, 2, 2, 2, 'bccz')
+
+    write_beam_lattice(str(tmp_path / 'lattice.3mf'), nodes, edges, radii, diameters, chunk = 7)
+
+    root, vertices, beams, balls = read_beam_lattice(tmp_path / 'lattice.3mf')
+    assert root.get('requiredextensions') == 'b b2'
+    assert not list(root.iter(f'{{{MODEL_NAMESPACE}}}triangle'))
+    np.testing.assert_allclose(vertices, nodes, rtol = 1e-6)
+    np.testing.assert_array_equal(beams[:, :2], edges)
+    np.testing.assert_allclose(beams[:, 2], radii, rtol = 1e-5)
+    np.testing.assert_allclose(beams[:, 3], radii, rtol = 1e-5)
+    np.testing.assert_array_equal(balls[:, 0], np.arange(len(nodes)))
+    np.testing.assert_allclose(balls[:, 1], diameters / 2, rtol = 1e-5)
+
+def test_beam_lattice_without_nodes_has_tapered_beams(tmp_path):
+
+    nodes = [(0, 0, 0), (1, 0, 0), (1, 1, 0)]
+
+    write_beam_lattice(str(tmp_path / 'lattice.3mf'), nodes, [(0, 1), (1, 2)], 0.2, radius2 = [0.1, 0.3],
+                       cap = 'butt')
+
+    root, _, beams, balls = read_beam_lattice(tmp_path / 'lattice.3mf')
+    lattice = root.find(f'.//{{{BEAM_LATTICE_NAMESPACE}}}beamlattice')
+    assert root.get('requiredextensions') == 'b' and lattice.get('cap') == 'butt'
+    np.testing.assert_allclose(beams[:, 2:], [[0.2, 0.1], [0.2, 0.3]])
+    assert len(balls) == 0
+
+@pytest.mark.parametrize('edges, radius, options', [([(0, 3)], 0.1, {}), ([(0, 1)], 0.0, {}),
+                                                    ([(0, 1)], 0.1, {'cap': 'round'})])
+def test_beam_lattice_rejects_bad_input(edges, radius, options, tmp_path):
+
+    with pytest.raises(ValueError):
+        write_beam_lattice(str(tmp_path / 'lattice.3mf'), [(0, 0, 0), (1, 0, 0)], edges, radius, **options)
@@ -0,0 +1,86 @@
+from math import pi
+
+import numpy as np
+import pytest
+import cadquery as cq
+
+from lq.cache import ShapeCache
+from lq.commons import cylinder_by_two_points
+from lq.primitives import node, strut, strut_between, struts_between
+
+@pytest.mark.parametrize('rotation, offset', [((0, 0, 0), (0, 0, 0)),
+                                              ((45, 0, 30), (1, 2, 3)),
+                                              ((-90, 35.26, 0), (0, -1, 0.5))])
+def test_strut_is_the_sketched_cylinder(rotation, offset):
+
+    sketched = (cq.Workplane().transformed(offset = offset, rotate = rotation)
+                .circle(0.5).extrude(4).val())
+
+    placed = strut(0.5, 4, rotation, offset, cache = ShapeCache())
+
+    assert placed.Volume() == pytest.approx(sketched.Volume(), rel = 1e-9)
+    np.testing.assert_allclose(placed.Center().toTuple(), sketched.Center().toTuple(), atol = 1e-9)
+    assert placed.intersect(sketched).Volume() == pytest.approx(sketched.Volume(), rel = 1e-6)
+
+def test_struts_share_their_prototype():
+
+    cache = ShapeCache()
+    first = strut(0.5, 4, (10, 0, 0), (0, 0, 0), cache)
+    second = strut(0.5, 4, (0, 20, 0), (1, 1, 1), cache)
+
+    assert first.wrapped.IsPartner(second.wrapped)
+    assert cache.info()['misses'] == 1
+
+@pytest.mark.parametrize('p1, p2', [((0, 0, 0), (1, 2, 3)), ((1, 1, 1), (1.001, 1, -2)),
+                                    ((0, 0, 0), (0, 0, -5))])
+def test_strut_joins_its_end_points(p1, p2):
+
+    placed = strut_between(p1, p2, 0.25, cache = ShapeCache())
+    faces = sorted(placed.Faces(), key = lambda f: f.Area())[:2]
+    centers = sorted(tuple(f.Center().toTuple()) for f in faces)
+
+    np.testing.assert_allclose(centers, sorted([p1, p2]), atol = 1e-9)
+    assert placed.Volume() == pytest.approx(pi * 0.25 ** 2 * np.linalg.norm(np.subtract(p2, p1)), rel = 1e-9)
+
+def test_tapered_strut_is_a_truncated_cone():
+
+    placed = cylinder_by_two_points((0, 0, 0), (3, 0, 4), 1.0, 0.5).val()
+
+    assert placed.Volume() == pytest.approx(pi * 5 / 3 * (1 + 0.5 + 0.25), rel = 1e-9)
+    # the centroid of a frustum along its axis
+    centroid = np.array([3, 0, 4]) * (1 + 2 * 0.5 + 3 * 0.25) / (4 * 1.75)
+    np.testing.assert_allclose(placed.Center().toTuple(), centroid, atol = 1e-9)
+
+def test_struts_between_take_columns_of_radii():
+
+    endpoints = [[(0, 0, 0), (0, 0, 1)], [(0, 0, 0), (1, 0, 0)], [(0, 0, 0), (0, 2, 0)]]
+
+    struts = struts_between(endpoints, [0.1, 0.2, 0.3], cache = ShapeCache())
+
+    assert [s.Volume() for s in struts] == pytest.approx([pi * 0.01, pi * 0.04, pi * 0.18], rel = 1e-9)
+    with pytest.raises(ValueError):
+        struts_between([(0, 0, 0), (1, 1, 1)], 0.1)
+    with pytest.raises(ValueError):
+        strut_between((1, 1, 1), (1, 1, 1), 0.1)
+
+def test_box_node_is_the_filleted_cube():
+
+    side = 1.2 + 0.01
+    filleted = (cq.Workplane().box(side, side, side).edges("|Z").fillet(0.6)
+                .edges("|X").fillet(0.6).val())
+
+    placed = node(1.2, (1, 2, 3), cache = ShapeCache())
+
+    assert placed.Volume() == pytest.approx(filleted.Volume(), rel = 1e-9)
+    np.testing.assert_allclose(placed.Center().toTuple(), (1, 2, 3), atol = 1e-9)
+
+def test_nodes_share_their_prototype():
+
+    cache = ShapeCache()
+    nodes = [node(1.2, center, 'sphere', cache = cache) for center in [(0, 0, 0), (5, 0, 0)]]
+
+    assert nodes[0].wrapped.IsPartner(nodes[1].wrapped)
+    assert nodes[1].Volume() == pytest.approx(4 / 3 * pi * 0.6 ** 3, rel = 1e-9)
+    assert cache.info()['misses'] == 1
+    with pytest.raises(TypeError):
+        node(1.2, shape = 'cone')
@@ -0,0 +1,116 @@
+from math import pi
+
+import numpy as np
+import pytest
+
+from lq import properties
+from lq.commons import graph_lattice
+from lq.cache import ShapeCache
+from lq.properties import cylinder_in_sphere, graph_properties
+from lq.topologies import bcc, cubic, diamond, fbcc, fcc, rco, tco, tcubic
+
+def test_cylinder_in_sphere_limits():
+
+    volume, h, cap = cylinder_in_sphere([1e-9, 1.0, 2.0], 1.0)
+
+    np.testing.assert_allclose(volume, [0, 2 / 3 * pi, 2 / 3 * pi], atol = 1e-12)
+    np.testing.assert_allclose(h, [1, 0, 0], atol = 1e-12)
+    np.testing.assert_allclose(cap, [0, 2 * pi, 2 * pi], atol = 1e-12)
+
+def test_single_strut_is_a_cylinder():
+
+    result = graph_properties([(0, 0, 0), (0, 0, 3)], [(0, 1)], 0.5, envelope = 10.0)
+
+    assert result['volume'] == pytest.approx(pi * 0.25 * 3, rel = 1e-12)
+    assert result['surface_area'] == pytest.approx(2 * pi * 0.5 * 3.5, rel = 1e-12)
+    assert result['relative_density'] == pytest.approx(pi * 0.075, rel = 1e-12)
+
+def test_node_on_a_strut_end_is_exact():
+
+    result = graph_properties([(0, 0, 0), (0, 0, 3)], [(0, 1)], 0.5, [1.6, 0.0], 'sphere')
+
+    inside, h, cap = cylinder_in_sphere(0.5, 0.8)
+    assert result['volume'] == pytest.approx(4 / 3 * pi * 0.8 ** 3 + pi * 0.25 * 3 - inside, rel = 1e-12)
+    assert result['surface_area'] == pytest.approx(4 * pi * 0.64 - cap + 2 * pi * 0.5 * (3 - h) + pi * 0.25,
+                                                   rel = 1e-12)
+
+@pytest.mark.parametrize('name, graph, node_shape', [
+    ('bccz', lambda: bcc.bcc_heterogeneous_graph(5, 0.6, 1, 0.8, 1.2, 2, 2, 2, 'bccz'), 'box'),
+    ('cubic', lambda: cubic.cubic_heterogeneous_graph(5, 0.6, 1, 0.8, 1.2, 2, 2, 2), 'box'),
+    ('diamond', lambda: diamond.diamond_heterogeneous_graph(5, 1, 1, 1.2, 1.2, 1, 1, 1), 'box'),
+    ('fbcc', lambda: fbcc.fbcc_heterogeneous_graph(5, 1, 1, 1.2, 1.2, 1, 1, 1), 'box'),
+    ('fcc', lambda: fcc.fcc_heterogeneous_graph(5, 1, 1, 1.2, 1.2, 1, 1, 1), 'box'),
+    ('rco', lambda: rco.rco_heterogeneous_graph(5, 1, 1, 1.2, 1.2, 1, 1, 1, 0.3, 0.3), 'box'),
+    ('tco', lambda: tco.tco_heterogeneous_graph(5, 1, 1, 1.2, 1.2, 1, 1, 1), 'sphere'),
+    ('tcubic', lambda: tcubic.tcubic_heterogeneous_graph(5, 1, 1, 1.2, 1.2, 1, 1, 1, 0.3, 0.3), 'box'),
+])
+def test_properties_are_the_fused_lattice(name, graph, node_shape):
+
+    nodes, edges, radii, diameters = graph()
+
+    result = graph_properties(nodes, edges, radii, diameters, node_shape)
+
+    fused = graph_lattice(nodes, edges, radii, diameters, node_shape, fuse = True).val()
+    assert result['volume'] == pytest.approx(fused.Volume(), rel = 0.01)
+    assert result['surface_area'] == pytest.approx(fused.Area(), rel = 0.015)
+    envelope = np.prod(nodes.max(axis = 0) - nodes.min(axis = 0))
+    assert result['relative_density'] == pytest.approx(fused.Volume() / envelope, rel = 0.01)
+
+def test_sphere_nodes_are_the_fused_lattice():
+
+    graph = bcc.bcc_heterogeneous_graph(5, 0.6, 0.6, 1.6, 1.6, 2, 1, 1, 'bcc')
+
+    result = graph_properties(*graph, node_shape = 'sphere')
+
+    fused = graph_lattice(*graph, node_shape = 'sphere', fuse = True).val()
+    assert result['volume'] == pytest.approx(fused.Volume(), rel = 0.005)
+    assert result['surface_area'] == pytest.approx(fused.Area(), rel = 0.005)
+
+def test_equal_neighbourhoods_are_integrated_once(monkeypatch):
+
+    calls = []
+
+    def counted(*args):
+        calls.append(args)
+        return ball_overlaps(*args)
+
+    ball_overlaps = properties.ball_overlaps
+    monkeypatch.setattr(properties, 'ball_overlaps', counted)
+
+    graph_properties(*cubic.cubic_heterogeneous_graph(5, 1, 1, 1.2, 1.2, 3, 3, 3), cache = None)
+    count = len(calls)
+    graph_properties(*cubic.cubic_heterogeneous_graph(5, 1, 1, 1.2, 1.2, 5, 5, 5), cache = None)
+
+    # the corners, edges, faces and inside of the grid of nodes
+    assert count == 4 and len(calls) == 2 * 4
+
+def test_neighbourhoods_are_cached(monkeypatch):
+
+    calls = []
+
+    def counted(*args):
+        calls.append(args)
+        return ball_overlaps(*args)
+
+    ball_overlaps = properties.ball_overlaps
+    monkeypatch.setattr(properties, 'ball_overlaps', counted)
+    cache = ShapeCache()
+    graph = bcc.bcc_heterogeneous_graph(5, 0.6, 1, 0.8, 1.2, 3, 3, 3, 'bccz')
+
+    first = graph_properties(*graph, cache = cache)
+    count = len(calls)
+    second = graph_properties(*graph, cache = cache)
+
+    assert len(calls) == count and cache.info()['hits'] == count
+    assert second == first
+    # the lattice turned about Z has the same kinds of neighbourhoods
+    turned = graph_properties(graph[0][:, [1, 0, 2]] * (-1, 1, 1), *graph[1:], cache = cache)
+    assert len(calls) == count
+    assert turned['volume'] == pytest.approx(first['volume'], rel = 1e-12)
+
+def test_bad_graphs_are_rejected():
+
+    with pytest.raises(TypeError):
+        graph_properties([(0, 0, 0), (1, 0, 0)], [(0, 1)], 0.1, node_shape = 'cone')
+    with pytest.raises(ValueError):
+        graph_properties([(0, 0, 0), (0, 0, 0)], [(0, 1)], 0.1)
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from lq.graph import graph_segments
+from lq.mesh import mesh_volume
+from lq.sdf import beam_field, beam_mesh, default_voxel_size
+from lq.topologies.bcc import bcc_heterogeneous_graph
+
+def bccz_segments(n, diameter):
+
+    nodes, edges, radii, _ = bcc_heterogeneous_graph(5, diameter, diameter, 1, 1, n, n, n, 'bccz')
+    return graph_segments(nodes, edges), radii
+
+def assert_watertight(faces):
+
+    edges = np.sort(faces[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis = 1)
+    _, counts = np.unique(edges, axis = 0, return_counts = True)
+    assert np.all(counts == 2)
+
+def test_capsule_volume():
+
+    vertices, faces = beam_mesh([[[0, 0, 0], [0, 0, 4]]], 1.0, voxel_size = 0.05)
+
+    assert_watertight(faces)
+    assert mesh_volume(vertices, faces) == pytest.approx(np.pi * 4 + 4 / 3 * np.pi, rel = 1e-2)
+
+def test_small_lattice_keeps_a_third_of_the_radius():
+
+    segments, radii = bccz_segments(1, 1)
+
+    _, _, spacing = beam_field(segments, radii)
+
+    assert spacing == pytest.approx(radii.min() / 3)
+
+def test_default_voxel_size_fits_the_budget():
+
+    segments, radii = bccz_segments(3, 1)
+
+    vertices, faces = beam_mesh(segments, radii, max_triangles = 200000)
+
+    assert len(faces) <= 200000
+    assert_watertight(faces)
+
+def test_coarse_default_voxel_size_warns():
+
+    segments, radii = bccz_segments(3, 0.5)
+
+    with pytest.warns(UserWarning, match = 'smallest radius'):
+        voxel_size = default_voxel_size(segments, radii, radii, max_triangles = 100000)
+
+    assert voxel_size > radii.min()
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from lq.graph import graph_segments
+from lq.mesh import mesh_volume
+from lq.strut_mesh import hull_nodes, sphere_template, strut_mesh, strut_mesh_export, strut_prisms
+from lq.topologies.bcc import bcc_heterogeneous_graph
+
+def assert_closed(faces):
+
+    edges = np.sort(faces[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis = 1)
+    _, counts = np.unique(edges, axis = 0, return_counts = True)
+    assert np.all(counts == 2)
+
+@pytest.mark.parametrize('segments', [3, 8, 17])
+def test_prism_volume(segments):
+
+    endpoints = [[(0, 0, 0), (1, 2, 2)], [(1, 1, 1), (1, 1, -3)]]
+
+    vertices, faces = strut_prisms(endpoints, [0.5, 0.25], segments = segments)
+
+    assert_closed(faces)
+    polygon = 0.5 * segments * np.sin(2 * np.pi / segments)
+    assert mesh_volume(vertices, faces) == pytest.approx(polygon * (0.25 * 3 + 0.0625 * 4), rel = 1e-9)
+
+def test_tapered_prism_is_a_frustum():
+
+    vertices, faces = strut_prisms([[(0, 0, 0), (0, 0, 3)]], 1.0, 0.5, segments = 64)
+
+    polygon = 0.5 * 64 * np.sin(2 * np.pi / 64)
+    assert mesh_volume(vertices, faces) == pytest.approx(polygon * 3 / 3 * (1 + 0.5 + 0.25), rel = 1e-9)
+
+def test_sphere_template_is_closed_and_outward():
+
+    vertices, faces = sphere_template(32)
+
+    assert_closed(faces)
+    assert mesh_volume(vertices, faces) == pytest.approx(4 / 3 * np.pi, rel = 0.02)
+
+def test_hull_nodes_are_outward():
+
+    points = np.array([[0, 0, 0], [1, 0, 0], [0, 1, 0], [0, 0, 1], [2, 2, 2], [3, 2, 2]], dtype = float)
+
+    vertices, faces = hull_nodes([[0.2, 0.2, 0.2], [2.5, 2, 2]], points, np.array([0, 0, 0, 0, 1, 1]))
+
+    # the tetrahedron and the fallback sphere of the flat node
+    assert mesh_volume(vertices[:4], faces[:4]) == pytest.approx(1 / 6)
+    assert mesh_volume(vertices, faces) > 1 / 6
+
+@pytest.mark.parametrize('node', ['sphere', 'hull'])
+def test_lattice_pieces_are_closed(node, tmp_path):
+
+    nodes, edges, radii, _ = bcc_heterogeneous_graph(5, 1, 1, 1, 1, 2, 2, 2, 'bccz')
+    endpoints = graph_segments(nodes, edges)
+
+    vertices, faces = strut_mesh_export(str(tmp_path / 'lattice.stl'), endpoints, radii, node = node)
+
+    assert_closed(faces)
+    assert mesh_volume(vertices, faces) > mesh_volume(*strut_prisms(endpoints, radii))
+    assert (tmp_path / 'lattice.stl').stat().st_size == 84 + 50 * len(faces)
+
+def test_unknown_node_shapes_are_rejected():
+
+    with pytest.raises(TypeError):
+        strut_mesh([[(0, 0, 0), (1, 0, 0)]], 0.1, node = 'cube')
@@ -0,0 +1,56 @@
+import pytest
+
+from lq.commons import graph_lattice
+from lq.topologies import bcc, cubic, diamond, fbcc, fcc, rco, tco, tcubic
+
+ARGS = (5, 1, 1, 1.2, 1.2, 1, 1, 1)
+
+# Volumes of single cells (unit cell size 5, struts 1, nodes 1.2) built by the
+# original code, before the cell parts were fused in one boolean. The original tco
+# cell lost its solids, its volume is the one of the fused struts and sphere nodes.
+BASELINE_VOLUMES = {
+    'bcc': (bcc.bcc_heterogeneous_lattice, bcc.bcc_heterogeneous_graph, (), 29.2029),
+    'bccz': (bcc.bcc_heterogeneous_lattice, bcc.bcc_heterogeneous_graph, ('bccz',), 41.2471),
+    'cubic': (cubic.cubic_heterogeneous_lattice, cubic.cubic_heterogeneous_graph, (), 45.3265),
+    'diamond': (diamond.diamond_heterogeneous_lattice, diamond.diamond_heterogeneous_graph, (), 28.0852),
+    'fbcc': (fbcc.fbcc_heterogeneous_lattice, fbcc.fbcc_heterogeneous_graph, (), 77.4085),
+    'fcc': (fcc.fcc_heterogeneous_lattice, fcc.fcc_heterogeneous_graph, (), 60.1005),
+    'rco': (rco.rco_heterogeneous_lattice, rco.rco_heterogeneous_graph, (0.3, 0.3), 70.7819),
+    'tco': (tco.tco_heterogeneous_lattice, tco.tco_heterogeneous_graph, (), 62.8893),
+    'tcubic': (tcubic.tcubic_heterogeneous_lattice, tcubic.tcubic_heterogeneous_graph, (0.3, 0.3), 47.3102),
+}
+
+# Node shapes of the cells that do not have box nodes.
+NODE_SHAPES = {'tco': 'sphere'}
+
+@pytest.mark.parametrize('name', sorted(BASELINE_VOLUMES))
+def test_unit_cell_volume(name):
+
+    lattice, _, extra, volume = BASELINE_VOLUMES[name]
+
+    cells = lattice(*ARGS, *extra).vals()
+
+    assert len(cells) == 1 and len(cells[0].Solids()) == 1
+    assert cells[0].Volume() == pytest.approx(volume, rel = 1e-5)
+
+@pytest.mark.parametrize('name', sorted(BASELINE_VOLUMES))
+def test_fused_graph_volume(name):
+
+    _, graph, extra, volume = BASELINE_VOLUMES[name]
+
+    fused = graph_lattice(*graph(*ARGS, *extra), node_shape = NODE_SHAPES.get(name, 'box'),
+                          fuse = True).vals()
+
+    assert len(fused) == 1 and len(fused[0].Solids()) == 1
+    assert fused[0].Volume() == pytest.approx(volume, rel = 1e-5)
+
+@pytest.mark.parametrize('strategy', ['single', 'tree'])
+def test_fused_graph_with_nearly_touching_nodes(strategy):
+
+    # OCC returns an empty shape for the struts and box nodes of the tco cell, they are
+    # fused again with a fuzzy tolerance
+    fused = graph_lattice(*tco.tco_heterogeneous_graph(5, 0.6, 1, 1.2, 1.2, 1, 1, 1), fuse = True,
+                          strategy = strategy).vals()
+
+    assert len(fused) == 1 and len(fused[0].Solids()) == 1
+    assert fused[0].Volume() == pytest.approx(48.5098, rel = 1e-5)
@@ -0,0 +1,52 @@
+import pytest
+import cadquery as cq
+
+from lq.primitives import FACE_CACHE, cached_face
+from lq.topologies import gyroid, schwartz
+from lq.topologies.gyroid import _gyroid_000_face
+
+# Whole-cell volumes (t = 0.3) of the builders before the surface fits were cached.
+GYROID_VOLUMES = {2.5: 23.1330, 7: 181.3053}
+SCHWARTZ_P_VOLUMES = {2.5: 17.4936, 7: 137.6382}
+SCHWARTZ_D_VOLUMES = {2.5: 3.5867, 7: 28.3571}
+
+@pytest.mark.parametrize('size', sorted(GYROID_VOLUMES))
+def test_gyroid_unit_cell_volume(size):
+
+    cell = gyroid.unit_cell(cq.Location(), 0.3, size)
+
+    assert len(cell.Solids()) == 1
+    assert cell.Volume() == pytest.approx(GYROID_VOLUMES[size], rel = 1e-3)
+
+@pytest.mark.parametrize('size', sorted(SCHWARTZ_P_VOLUMES))
+def test_schwartz_p_unit_cell_volume(size):
+
+    cell = schwartz.p_unit_cell(cq.Location(), 0.3, size)
+
+    assert len(cell.Solids()) == 1
+    assert cell.Volume() == pytest.approx(SCHWARTZ_P_VOLUMES[size], rel = 1e-3)
+
+@pytest.mark.parametrize('size', sorted(SCHWARTZ_D_VOLUMES))
+def test_schwartz_d_unit_cell_volume(size):
+
+    cell = schwartz.d_unit_cell(cq.Location(), 0.3, size)
+
+    assert cell.Volume() == pytest.approx(SCHWARTZ_D_VOLUMES[size], rel = 1e-3)
+
+def test_schwartz_p_heterogeneous_lattice_volume():
+
+    result = schwartz.schwartz_p_heterogeneous_lattice(5, 0.3, 0.3, 1, 1, 1)
+
+    volume = sum(s.Volume() for s in result.vals())
+    assert volume == pytest.approx(SCHWARTZ_P_VOLUMES[2.5], rel = 1e-3)
+
+def test_cached_face_is_fitted_per_size():
+
+    FACE_CACHE.clear()
+    small = cached_face('gyroid_000', _gyroid_000_face, 2.5)
+    large = cached_face('gyroid_000', _gyroid_000_face, 7)
+
+    assert cached_face('gyroid_000', _gyroid_000_face, 2.5) is small
+    assert FACE_CACHE.info()['misses'] == 2
+    assert large.Area() == pytest.approx(_gyroid_000_face(7).Area(), rel = 1e-6)
+    assert small.Area() == pytest.approx(_gyroid_000_face(2.5).Area(), rel = 1e-6)
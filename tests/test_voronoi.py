@@ -0,0 +1,182 @@
+import itertools
+import warnings
+
+import numpy as np
+import pytest
+from scipy.spatial import cKDTree
+
+from lq.topologies.voronoi import (clip_segments, poisson_disk_seeds, random_seeds, ridge_edges, tiled_voronoi_graph,
+                                   vertex_seeds, voronoi_graph, voronoi_lattice)
+
+def clustered_seeds(n, seed = 0):
+
+    rng = np.random.default_rng(seed)
+    centers = rng.random((20, 3))
+    seeds = centers[rng.integers(0, len(centers), n)] + 0.03 * rng.standard_normal((n, 3))
+    return np.clip(seeds, 0, 1)
+
+def assert_same_graph(first, second):
+
+    nodes, edges = first
+    tiled_nodes, tiled_edges = second
+    np.testing.assert_array_equal(edges, tiled_edges)
+    np.testing.assert_allclose(nodes, tiled_nodes, rtol = 0, atol = 1e-12)
+
+@pytest.mark.parametrize('seeds', [random_seeds(3000, seed = 1), clustered_seeds(3000)],
+                         ids = ['uniform', 'clustered'])
+@pytest.mark.parametrize('clip', [True, False])
+def test_tiled_graph_is_the_global_graph(seeds, clip):
+
+    graph = voronoi_graph(seeds, (0, 0, 0), (1, 1, 1), clip)
+    tiled = tiled_voronoi_graph(seeds, (0, 0, 0), (1, 1, 1), (3, 3, 3), clip = clip)
+
+    assert_same_graph(graph, tiled)
+
+def test_short_edges_are_kept():
+
+    nodes, edges = voronoi_graph(clustered_seeds(3000), (0, 0, 0), (1, 1, 1))
+
+    assert len(np.unique(nodes, axis = 0)) == len(nodes)
+    assert np.linalg.norm(nodes[edges[:, 0]] - nodes[edges[:, 1]], axis = 1).min() < 1e-6
+
+def test_pooled_tiles_are_the_serial_tiles():
+
+    seeds = random_seeds(2000, seed = 2)
+
+    serial = tiled_voronoi_graph(seeds, tiles = (2, 2, 1))
+    pooled = tiled_voronoi_graph(seeds, tiles = (2, 2, 1), workers = 2)
+
+    assert_same_graph(serial, pooled)
+
+def test_default_halo_is_wide_enough():
+
+    seeds = random_seeds(3000, seed = 3)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        tiled_voronoi_graph(seeds, (0, 0, 0), (1, 1, 1), (3, 3, 3))
+
+def test_thin_halo_is_widened():
+
+    seeds = random_seeds(2000, seed = 4)
+
+    with pytest.warns(UserWarning, match = 'too thin'):
+        tiled = tiled_voronoi_graph(seeds, (0, 0, 0), (1, 1, 1), (2, 2, 2), halo = 0.01)
+
+    assert_same_graph(voronoi_graph(seeds, (0, 0, 0), (1, 1, 1)), tiled)
+
+def test_clip_segments_faces():
+
+    segments = np.array([[[-1, 0.5, 0.5], [2, 0.5, 0.5]],
+                         [[0.5, 0.5, 0.5], [0.5, 0.5, -1]],
+                         [[0.2, 0.2, 0.2], [0.8, 0.8, 0.8]],
+                         [[2, 2, 2], [3, 3, 3]]])
+
+    clipped, kept, faces = clip_segments(segments, (0, 0, 0), (1, 1, 1), return_faces = True)
+
+    np.testing.assert_array_equal(kept, [True, True, True, False])
+    np.testing.assert_array_equal(faces, [[0, 1], [-1, 4], [-1, -1]])
+    np.testing.assert_allclose(clipped[0], [[0, 0.5, 0.5], [1, 0.5, 0.5]])
+
+def test_bcc_seeds_give_truncated_octahedra():
+
+    corners = np.array(list(itertools.product(range(-1, 5), repeat = 3)), dtype = float)
+    seeds = np.concatenate([corners, corners + 0.5])
+
+    nodes, edges = voronoi_graph(seeds, (0.6, 0.6, 0.6), (2.9, 2.9, 2.9), clip = False)
+
+    lengths = np.linalg.norm(nodes[edges[:, 0]] - nodes[edges[:, 1]], axis = 1)
+    np.testing.assert_allclose(lengths, np.sqrt(2) / 4, rtol = 1e-9)
+    assert np.bincount(edges.ravel()).max() == 4
+
+@pytest.mark.parametrize('clip', [True, False])
+def test_nodes_are_equidistant_to_their_seeds(clip):
+
+    seeds = random_seeds(500, seed = 5)
+
+    nodes, edges = voronoi_graph(seeds, (0.1, 0.1, 0.1), (0.9, 0.9, 0.9), clip)
+
+    distances, _ = cKDTree(seeds).query(nodes, 5)
+    on_box = np.isclose(nodes, 0.1).any(axis = 1) | np.isclose(nodes, 0.9).any(axis = 1)
+    assert on_box.any() == clip
+    # a vertex is shared by four cells, a node clipped to the box lies on a ridge of three
+    np.testing.assert_allclose(distances[~on_box, :4], distances[~on_box, :1].repeat(4, axis = 1), rtol = 1e-7)
+    np.testing.assert_allclose(distances[on_box, :3], distances[on_box, :1].repeat(3, axis = 1), rtol = 1e-7)
+    middle = nodes[edges].mean(axis = 1)
+    distances, _ = cKDTree(seeds).query(middle, 3)
+    np.testing.assert_allclose(distances, distances[:, :1].repeat(3, axis = 1), rtol = 1e-7)
+
+def test_ridge_edges_are_the_polygon_sides():
+
+    ridges = [[0, 1, 2], [2, 1, 3], [-1, 4, 5]]
+
+    edges, ridge = ridge_edges(ridges, return_ridges = True)
+
+    np.testing.assert_array_equal(edges, [[0, 1], [0, 2], [1, 2], [1, 3], [2, 3], [4, 5]])
+    np.testing.assert_array_equal(ridge, [0, 0, 0, 1, 1, 2])
+
+def test_vertex_seeds_are_the_cells_around_a_vertex():
+
+    ridge_points = [(0, 1), (0, 2), (1, 2), (2, 3)]
+    ridge_vertices = [[0, 1], [0, -1], [0, 1], [1, -1]]
+
+    keys = vertex_seeds(ridge_points, ridge_vertices, 2)
+
+    np.testing.assert_array_equal(keys, [[-1, 0, 1, 2], [0, 1, 2, 3]])
+
+def test_voronoi_lattice_builds_every_edge():
+
+    seeds = random_seeds(20, seed = 6)
+    nodes, edges = voronoi_graph(seeds, (0, 0, 0), (1, 1, 1))
+
+    lattice = voronoi_lattice(seeds, 0.01, 0.03, (0, 0, 0), (1, 1, 1))
+
+    assert len(lattice.vals()) == len(edges) + len(nodes)
+
+def test_blue_noise_seeds_keep_their_distance():
+
+    seeds = poisson_disk_seeds((0, 0, 0), (1, 1, 1), n = 2000, tiles = (2, 2, 2), seed = 1)
+
+    distances, _ = cKDTree(seeds).query(seeds, 2)
+    assert distances[:, 1].min() >= 0.78 * 2000 ** (- 1 / 3) * (1 - 1e-9)
+    assert len(seeds) == pytest.approx(2000, rel = 0.15)
+    assert ((seeds >= 0) & (seeds <= 1)).all()
+
+def linear_density(points):
+
+    return 200 + 800 * points[:, 0]
+
+def test_blue_noise_seeds_follow_the_density():
+
+    seeds = poisson_disk_seeds((0, 0, 0), (2, 1, 1), linear_density, tiles = (2, 1, 1), seed = 2)
+
+    radius = 0.78 * linear_density(seeds) ** (- 1 / 3)
+    i, j = cKDTree(seeds).query_pairs(radius.max(), output_type = 'ndarray').T
+    assert (np.linalg.norm(seeds[i] - seeds[j], axis = 1) >= 0.5 * (radius[i] + radius[j]) * (1 - 1e-9)).all()
+    # 600 and 1400 seeds are expected in the halves of the box
+    assert (seeds[:, 0] < 1).sum() == pytest.approx(600, rel = 0.15)
+    assert (seeds[:, 0] >= 1).sum() == pytest.approx(1400, rel = 0.15)
+
+def test_blue_noise_seeds_are_reproducible():
+
+    serial = poisson_disk_seeds((0, 0, 0), (1, 1, 1), n = 1000, tiles = (2, 2, 1), seed = 3)
+    pooled = poisson_disk_seeds((0, 0, 0), (1, 1, 1), n = 1000, tiles = (2, 2, 1), seed = 3, workers = 2)
+
+    np.testing.assert_array_equal(serial, pooled)
+    assert not np.array_equal(serial, poisson_disk_seeds((0, 0, 0), (1, 1, 1), n = 1000, tiles = (2, 2, 1), seed = 4))
+
+def test_density_fields_of_a_constant_are_the_constant():
+
+    number = poisson_disk_seeds((0, 0, 0), (1, 1, 1), 500.0, seed = 5)
+    field = poisson_disk_seeds((0, 0, 0), (1, 1, 1), lambda points: np.full(len(points), 500.0), seed = 5)
+    grid = poisson_disk_seeds((0, 0, 0), (1, 1, 1), np.full((3, 4, 5), 500.0), seed = 5)
+
+    np.testing.assert_array_equal(field, number)
+    np.testing.assert_array_equal(grid, number)
+
+@pytest.mark.parametrize('arguments', [{}, {'density': -1.0}, {'density': np.ones((2, 2))},
+                                       {'n': 1000, 'tiles': (20, 1, 1)}])
+def test_bad_blue_noise_arguments_are_rejected(arguments):
+
+    with pytest.raises(ValueError):
+        poisson_disk_seeds((0, 0, 0), (1, 1, 1), **arguments)